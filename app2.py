@@ -3,10 +3,11 @@ import uuid
 import json
 import logging
 
-import boto3
 import streamlit as st
 from typing import Dict, Any
 
+from bot.rules import RulesFile
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,16 +21,30 @@ LINE_OF_THERAPY_OPTIONS = ["1st", "2nd", "3rd or later", "Unknown"]
 
 # Configuration (use environment variables or configuration files in production)
 AWS_REGION = os.getenv('AWS_REGION', 'us-west-2')
+APP2_RULES_PATH = os.getenv('APP2_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app2_rules.json'))
 BEDROCK_MODEL_ID = 'anthropic.claude-3-5-sonnet-20241022-v2:0'
 SESSION_ID = str(uuid.uuid4())
 
-# Initialize Bedrock client
-try:
-    bedrock_client = boto3.client(service_name='bedrock-runtime', region_name='us-west-2')
-except Exception as e:
-    logger.error(f"Error initializing Bedrock client: {e}")
-    st.error("An error occurred while initializing the application. Please try again later.")
-    st.stop()
+# Recommendation rules, reloaded when the file changes
+recommendation_rules = RulesFile(
+    APP2_RULES_PATH,
+    {
+        "cancer_type": SUPPORTED_CANCER_TYPES + ["Other", "Unknown"],
+        "stage": STAGES,
+        "therapy_status": THERAPY_STATUSES,
+        "recent_surgery": BOOLEAN_VALUES,
+        "line_of_therapy": LINE_OF_THERAPY_OPTIONS,
+        "tissue_testing_preference": BOOLEAN_VALUES,
+    },
+    outputs=("recommendation",),
+)
+
+# Bedrock client, created on the first call and then kept for the process, so neither the first
+# render nor any rerun waits for boto3 to import and build a client
+@st.cache_resource(show_spinner=False)
+def get_bedrock_client():
+    import boto3
+    return boto3.client(service_name='bedrock-runtime', region_name='us-west-2')
 
 # Streamlit app
 st.subheader('Test Selection Assistant', divider='rainbow')
@@ -57,18 +72,16 @@ def recommend_guardant_test(
     tissue_testing_preference: bool
 ) -> str:
     """
-    Recommends a Guardant test based on the provided attributes.
+    Recommends a Guardant test based on the provided attributes, from the rules in app2_rules.json.
     """
-    recommendation = "Further assessment needed"
-
-    if stage == 'Stage_4' or stage == 'Metastatic':
-        if therapy_status == 'therapy_not_working' or therapy_status == 'newly_diagnosed':
-            recommendation = "Guardant360 CDx"
-        elif therapy_status == 'responding_well':
-            recommendation = "Guardant Monitoring Response"
-    else:
-        
-        
+    return recommendation_rules.rules.lookup(
+        cancer_type,
+        stage,
+        therapy_status,
+        "true" if recent_surgery else "false",
+        line_of_therapy,
+        "true" if tissue_testing_preference else "false",
+    )[0]
 
 def all_attributes_collected(attributes: Dict[str, Any]) -> bool:
     """
@@ -129,7 +142,7 @@ Make sure the output is valid JSON.'''
     })
 
     try:
-        response = bedrock_client.invoke_model(
+        response = get_bedrock_client().invoke_model(
             modelId=BEDROCK_MODEL_ID,
             accept='application/json',
             contentType='application/json',
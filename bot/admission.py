@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from context import estimate_request_tokens, estimate_tokens
+from metrics import increment, observe, register_gauges
+from retry import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# Process-wide admission control for Bedrock calls. Every session's model calls share two token
+# buckets, one on requests per second and one on estimated input tokens per minute, so a burst of
+# new chats is spread out below the account's quotas instead of being throttled all at once.
+# Calls the buckets cannot take right away wait in a bounded queue ordered by priority (extractions,
+# which a user is waiting on before anything else happens, go ahead of descriptions, and both go
+# ahead of background pre-warming and speculation), first come first served within a priority.
+# A call that finds the queue full, or waits longer than ADMISSION_MAX_WAIT, raises BedrockBusy;
+# the chat app then shows a "busy, retrying" status and tries again.
+#
+# Admission happens in AdmittedClient, which bedrock.py puts right above the boto3 client: every
+# real attempt is admitted, retries and hedges included, while cassette replays and local stand-ins
+# are not. Callers pass the priority down with admission_priority(). Retries of a call that was
+# turned away run under one admission_ticket(), so they keep their place in line instead of joining
+# the back of the queue.
+#
+# The limits are per process: with several replicas, set them to the account quota divided by the
+# replica count.
+
+# Configuration (use environment variables or configuration files in production)
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+# Bucket rates (0 disables a bucket)
+BEDROCK_REQUESTS_PER_SECOND = float(os.getenv('BEDROCK_REQUESTS_PER_SECOND', '10'))
+BEDROCK_INPUT_TOKENS_PER_MINUTE = float(os.getenv('BEDROCK_INPUT_TOKENS_PER_MINUTE', '400000'))
+# Bucket sizes, as seconds of their rate that can be spent at once after an idle period
+ADMISSION_BURST_SECONDS = float(os.getenv('ADMISSION_BURST_SECONDS', '2'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '200'))
+# Longest a call waits in the queue before giving up with BedrockBusy
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '10'))
+# How often coroutines waiting behind other calls check the queue (threads are woken instead)
+ADMISSION_POLL_SECONDS = float(os.getenv('ADMISSION_POLL_SECONDS', '0.02'))
+
+# Lower goes first
+PRIORITIES = {"extraction": 0, "description": 1, "background": 2}
+
+_controller = None
+_controller_set = False
+_controller_lock = threading.Lock()
+# Arrival order in the wait queue, shared by tickets and calls
+_sequence = itertools.count()
+_priority = contextvars.ContextVar('admission_priority', default='description')
+_ticket = contextvars.ContextVar('admission_ticket', default=None)
+
+
+class BedrockBusy(Exception):
+    """
+    Raised when a Bedrock call is not admitted: the wait queue is full or the wait took too long.
+    """
+
+
+class TokenBucket:
+    """
+    Refills at rate units per second up to capacity. Not locked; AdmissionController serialises use.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until amount is available (0 if it is now).
+        """
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+class AdmissionController:
+    """
+    Token buckets on requests/s and input tokens/min in front of a bounded priority wait queue.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = BEDROCK_REQUESTS_PER_SECOND,
+        input_tokens_per_minute: float = BEDROCK_INPUT_TOKENS_PER_MINUTE,
+        burst_seconds: float = ADMISSION_BURST_SECONDS,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second * burst_seconds)) if requests_per_second > 0 else None
+        tokens_per_second = input_tokens_per_minute / 60
+        self._tokens = TokenBucket(tokens_per_second, tokens_per_second * burst_seconds) if input_tokens_per_minute > 0 else None
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        # Heap of (priority rank, ticket or arrival sequence, arrival sequence); only the head may
+        # take from the buckets
+        self._queue = []
+        self._condition = threading.Condition()
+        self._waits = LatencyWindow(1000)
+        self._stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0, "peak_queue_depth": 0}
+
+    def acquire(self, priority: str = 'description', input_tokens: int = 0) -> float:
+        """
+        Blocks until the call is admitted and returns the seconds it waited. Raises BedrockBusy.
+        """
+        with self._condition:
+            entry, start, deadline, tokens = self._enter(priority, input_tokens)
+            if entry is None:
+                return 0.0
+            while True:
+                waited, sleep = self._poll(entry, priority, tokens, start, deadline)
+                if waited is not None:
+                    return waited
+                self._condition.wait(sleep)
+
+    async def acquire_async(self, priority: str = 'description', input_tokens: int = 0) -> float:
+        """
+        Coroutine version of acquire(), for the serving engine's event loop.
+        """
+        with self._condition:
+            entry, start, deadline, tokens = self._enter(priority, input_tokens)
+        if entry is None:
+            return 0.0
+        while True:
+            with self._condition:
+                waited, sleep = self._poll(entry, priority, tokens, start, deadline)
+            if waited is not None:
+                return waited
+            await asyncio.sleep(min(sleep, ADMISSION_POLL_SECONDS) if sleep is not None else ADMISSION_POLL_SECONDS)
+
+    def _enter(self, priority: str, input_tokens: int):
+        # Called with the lock held. Admits the call straight away when nothing is queued and the
+        # buckets allow it (entry None), otherwise queues it or raises BedrockBusy if the queue is full.
+        start = time.monotonic()
+        # A request larger than the bucket would never fit; it waits for a full bucket instead
+        tokens = min(input_tokens, self._tokens.capacity) if self._tokens else 0
+        if not self._queue and self._wait_time(tokens, start) == 0:
+            self._admit(priority, tokens, 0.0)
+            return None, start, None, tokens
+        if len(self._queue) >= self.queue_size:
+            self._reject(priority, 'full')
+        arrival = next(_sequence)
+        ticket = _ticket.get()
+        entry = (PRIORITIES[priority], arrival if ticket is None else ticket, arrival)
+        heapq.heappush(self._queue, entry)
+        self._stats["queued"] += 1
+        self._stats["peak_queue_depth"] = max(self._stats["peak_queue_depth"], len(self._queue))
+        return entry, start, start + self.max_wait, tokens
+
+    def _poll(self, entry: Tuple[int, int, int], priority: str, tokens: float, start: float, deadline: float):
+        """
+        Called with the lock held. Returns (seconds waited, None) once the call is admitted, or
+        (None, seconds to sleep) while it must keep waiting (None: until woken by another call).
+        """
+        now = time.monotonic()
+        sleep = None
+        if self._queue[0] == entry:
+            refill = self._wait_time(tokens, now)
+            if refill == 0:
+                heapq.heappop(self._queue)
+                self._admit(priority, tokens, now - start)
+                # The next call in line becomes the head
+                self._condition.notify_all()
+                return now - start, None
+            sleep = refill
+        if now >= deadline:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            self._condition.notify_all()
+            self._reject(priority, 'timeout')
+        remaining = deadline - now
+        return None, remaining if sleep is None else min(sleep, remaining)
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        wait = 0.0
+        if self._requests:
+            wait = self._requests.wait_time(1, now)
+        if self._tokens:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+    def _admit(self, priority: str, tokens: float, waited: float):
+        if self._requests:
+            self._requests.take(1)
+        if self._tokens:
+            self._tokens.take(tokens)
+        self._stats["admitted"] += 1
+        self._waits.add(waited)
+        observe('bot_admission_wait_seconds', waited, priority=priority)
+
+    def _reject(self, priority: str, reason: str):
+        self._stats[f"rejected_{reason}"] += 1
+        increment('bot_admission_rejected_total', priority=priority, reason=reason)
+        message = f"Bedrock admission queue {'is full' if reason == 'full' else 'wait timed out'} ({len(self._queue)} waiting)"
+        logger.warning(f"Rejected {priority} call: {message}")
+        raise BedrockBusy(message)
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._queue)
+            for name, rank in PRIORITIES.items():
+                stats[f"queue_depth_{name}"] = sum(1 for entry in self._queue if entry[0] == rank)
+        stats["wait_p50_ms"] = self._waits.percentile(50) * 1000
+        stats["wait_p95_ms"] = self._waits.percentile(95) * 1000
+        return stats
+
+
+def request_tokens(body: str) -> int:
+    """
+    Estimated input tokens of a Bedrock messages request body.
+    """
+    request = json.loads(body)
+    tokens = estimate_request_tokens(request.get("system", ''), request.get("messages", []))
+    if request.get("tools"):
+        tokens += estimate_tokens(json.dumps(request["tools"]))
+    return tokens
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """
+    Returns the process-wide admission controller, creating it on first use (None when disabled).
+    """
+    global _controller, _controller_set
+    if not _controller_set:
+        with _controller_lock:
+            if not _controller_set:
+                if ADMISSION_ENABLED:
+                    _controller = AdmissionController()
+                    register_gauges('bot_admission', _controller.stats)
+                _controller_set = True
+    return _controller
+
+
+def set_admission_controller(controller: Optional[AdmissionController]):
+    """
+    Replaces the process-wide controller, e.g. with other limits, or with None to admit everything.
+    """
+    global _controller, _controller_set
+    with _controller_lock:
+        _controller = controller
+        _controller_set = True
+        if controller is not None:
+            register_gauges('bot_admission', controller.stats)
+
+
+@contextmanager
+def admission_priority(priority: str):
+    """
+    Admits the Bedrock calls made inside the block at this priority.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def admission_ticket():
+    """
+    Queues every call made inside the block, e.g. the retries of a call turned away as busy, in the
+    place the block was entered at, ahead of calls of the same priority that arrived later.
+    A block inside another keeps the outer ticket.
+    """
+    if _ticket.get() is not None:
+        yield
+        return
+    token = _ticket.set(next(_sequence))
+    try:
+        yield
+    finally:
+        _ticket.reset(token)
+
+
+def admit(priority: str, body: str) -> float:
+    """
+    Waits until the process-wide controller admits a Bedrock call with this request body.
+    Returns the seconds waited; raises BedrockBusy.
+    """
+    controller = get_admission_controller()
+    return controller.acquire(priority, request_tokens(body)) if controller else 0.0
+
+
+async def admit_async(priority: str, body: str) -> float:
+    controller = get_admission_controller()
+    return await controller.acquire_async(priority, request_tokens(body)) if controller else 0.0
+
+
+class AdmittedClient:
+    """
+    Wraps a Bedrock runtime client so every model invocation is admitted first, at the priority set
+    with admission_priority().
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def invoke_model(self, **kwargs):
+        admit(_priority.get(), kwargs['body'])
+        return self._client.invoke_model(**kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        admit(_priority.get(), kwargs['body'])
+        return self._client.invoke_model_with_response_stream(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class AsyncAdmittedClient(AdmittedClient):
+    """
+    Coroutine version of AdmittedClient for aiobotocore-style clients.
+    """
+
+    async def invoke_model(self, **kwargs):
+        await admit_async(_priority.get(), kwargs['body'])
+        return await self._client.invoke_model(**kwargs)
+
+    async def invoke_model_with_response_stream(self, **kwargs):
+        await admit_async(_priority.get(), kwargs['body'])
+        return await self._client.invoke_model_with_response_stream(**kwargs)
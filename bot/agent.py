@@ -0,0 +1,182 @@
+import os
+import re
+import time
+import uuid
+import logging
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List
+
+from bedrock import get_bedrock_client
+from metrics import increment, observe
+
+logger = logging.getLogger(__name__)
+
+# Answers product questions with the Bedrock knowledge-base agent (bedrock-agent-runtime InvokeAgent).
+# The agent client is the process-wide pooled one from bedrock.py, agent session ids are reused per
+# user so the agent keeps the conversation's context, the completion event stream is assembled chunk
+# by chunk, and several questions can be answered concurrently up to a limit.
+#
+#   python bot/agent.py "How many genes does CDx evaluate?" "What is the turnaround time?" --fake
+
+AGENT_SERVICE = 'bedrock-agent-runtime'
+
+# Configuration (use environment variables or configuration files in production)
+BEDROCK_AGENT_ID = os.getenv('BEDROCK_AGENT_ID', 'WBEMY1OFQB')
+BEDROCK_AGENT_ALIAS_ID = os.getenv('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
+# Questions of one request answered at the same time
+AGENT_MAX_CONCURRENCY = int(os.getenv('AGENT_MAX_CONCURRENCY', '4'))
+# Agent calls in flight across the whole process
+AGENT_MAX_WORKERS = int(os.getenv('AGENT_MAX_WORKERS', '16'))
+# Drop sessions idle for longer than the agent keeps them (its idleSessionTTLInSeconds)
+AGENT_SESSION_IDLE_SECONDS = float(os.getenv('AGENT_SESSION_IDLE_SECONDS', '600'))
+
+AGENT_ERROR_TEXT = "An error occurred while answering this question. Please try again later."
+
+QUESTION_SPLIT_RE = re.compile(r'(?<=\?)\s+|\s*\n+\s*(?:\d+[.)]\s*|[-*•]\s*)?')
+
+_executor = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix='agent')
+
+
+def split_questions(text: str) -> List[str]:
+    """
+    Splits a message asking several questions ("What is CDx? How fast are results?", or one per line)
+    into the individual questions.
+    """
+    return [question.strip() for question in QUESTION_SPLIT_RE.split(text) if question and question.strip()]
+
+
+class AgentSessionPool:
+    """
+    Agent session ids for one user. A question reuses the most recently idle session, so the agent
+    keeps the conversation's context; questions asked at the same time each get their own session,
+    since an agent session handles one invocation at a time.
+    """
+
+    def __init__(self, idle_seconds: float = AGENT_SESSION_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.created = 0
+        self.reused = 0
+        self._idle: List[tuple] = []  # (session id, released at), most recent last
+        self._lock = threading.Lock()
+
+    def acquire(self) -> str:
+        with self._lock:
+            now = time.monotonic()
+            self._idle = [(session_id, released) for session_id, released in self._idle if now - released < self.idle_seconds]
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()[0]
+            self.created += 1
+            return str(uuid.uuid4())
+
+    def release(self, session_id: str):
+        with self._lock:
+            self._idle.append((session_id, time.monotonic()))
+
+
+def invoke_agent(question: str, session_id: str):
+    return get_bedrock_client(AGENT_SERVICE).invoke_agent(
+        agentId=BEDROCK_AGENT_ID,
+        agentAliasId=BEDROCK_AGENT_ALIAS_ID,
+        sessionId=session_id,
+        inputText=question,
+    )
+
+
+def stream_agent_answer(question: str, session_id: str, citations: List[str] = None) -> Iterator[str]:
+    """
+    Yields the answer text chunk by chunk as the agent streams it, for use with st.write_stream.
+    Source URIs of the knowledge-base passages the answer cites are appended to citations.
+    """
+    start = time.perf_counter()
+    response = invoke_agent(question, session_id)
+    first_chunk = True
+    for event in response['completion']:
+        if 'chunk' not in event:
+            continue
+        chunk = event['chunk']
+        if first_chunk:
+            first_chunk = False
+            observe('bot_stage_seconds', time.perf_counter() - start, stage='agent_first_chunk')
+        if citations is not None:
+            for citation in chunk.get('attribution', {}).get('citations', []):
+                for reference in citation.get('retrievedReferences', []):
+                    uri = reference.get('location', {}).get('s3Location', {}).get('uri')
+                    if uri and uri not in citations:
+                        citations.append(uri)
+        yield chunk.get('bytes', b'').decode('utf-8')
+    observe('bot_stage_seconds', time.perf_counter() - start, stage='agent_answer')
+
+
+def ask_agent(question: str, sessions: AgentSessionPool) -> Dict[str, Any]:
+    """
+    Answers one question on an idle session of the pool.
+    Returns {"question", "text", "citations", "session_id", "seconds"}, plus "error" if it failed.
+    """
+    session_id = sessions.acquire()
+    start = time.perf_counter()
+    citations = []
+    result = {"question": question, "session_id": session_id}
+    try:
+        result["text"] = ''.join(stream_agent_answer(question, session_id, citations))
+    except Exception as e:
+        increment('bot_errors_total', stage='agent')
+        logger.error(f"Error invoking Bedrock agent: {e}")
+        result["text"] = AGENT_ERROR_TEXT
+        result["error"] = str(e)
+    finally:
+        sessions.release(session_id)
+    result["citations"] = citations
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def ask_agent_many(questions: List[str], sessions: AgentSessionPool, max_concurrency: int = AGENT_MAX_CONCURRENCY) -> List[Dict[str, Any]]:
+    """
+    Answers several questions at once, at most max_concurrency at a time, in the order asked.
+    """
+    results = [None] * len(questions)
+    pending = {}
+    for index, question in enumerate(questions):
+        if len(pending) >= max_concurrency:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        pending[_executor.submit(ask_agent, question, sessions)] = index
+    for future, index in pending.items():
+        results[index] = future.result()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ask the Bedrock knowledge-base agent one or more questions")
+    parser.add_argument('questions', nargs='+', help="questions, or one message with several questions in it")
+    parser.add_argument('--concurrency', type=int, default=AGENT_MAX_CONCURRENCY, help="questions answered at the same time (1 for serial)")
+    parser.add_argument('--fake', action='store_true', help="answer with the local agent stand-in instead of Bedrock")
+    parser.add_argument('--latency', type=float, default=2.0, help="median stand-in latency (s)")
+    args = parser.parse_args()
+
+    if args.fake:
+        from bedrock import set_bedrock_client
+        from fake_bedrock import FakeAgentClient, LatencyModel
+        set_bedrock_client(FakeAgentClient(LatencyModel(args.latency)), service_name=AGENT_SERVICE)
+
+    questions = [question for text in args.questions for question in split_questions(text)]
+    sessions = AgentSessionPool()
+    start = time.perf_counter()
+    results = ask_agent_many(questions, sessions, args.concurrency)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        print(f"Q: {result['question']} ({result['seconds']:.2f}s, session {result['session_id'][:8]})")
+        print(f"A: {result['text']}")
+        for citation in result['citations']:
+            print(f"   {citation}")
+        print()
+    print(f"{len(questions)} questions in {elapsed:.2f}s with concurrency {args.concurrency} "
+          f"({sessions.created} sessions created, {sessions.reused} reused)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,258 +1,384 @@
 import os
+import time
 import uuid
-import json
 import logging
 
-import boto3
 import streamlit as st
+import streamlit.components.v1 as components
 from typing import Dict, Any
 
+from admission import BedrockBusy, admission_ticket
+from bedrock import start_client_warmup
+from description_cache import (
+    DESCRIPTION_CACHE_ENABLED,
+    DESCRIPTION_CACHE_PREWARM,
+    DescriptionCache,
+    description_cache,
+    start_prewarm,
+)
+from engine import ENGINE_ENABLED, EngineBusy, get_engine
+from fast_extract import STAGE_THERAPY_STATUSES
+from metrics import start_metrics_server, tag, timer
+from pipeline import (
+    DESCRIPTION_CACHE_HISTORY,
+    DESCRIPTION_ERROR_TEXT,
+    DESCRIPTION_PROMPT_VERSION,
+    all_attributes_collected,
+    extract_turn_attributes,
+    generate_cacheable_description,
+    get_product_description,
+    stream_product_description,
+    update_attributes,
+    validate_attributes,
+)
+from routing import DESCRIPTION_MODEL_ID
+from recommendation import SUPPORTED_CANCER_TYPES, STAGES, THERAPY_STATUSES, all_recommendations, recommend_guardant_test
+from session_store import SESSION_KEYS, SESSION_TTL, get_session_store, persisted_state
+from speculation import SPECULATION_MAX_BRANCHES, SPECULATIVE_DESCRIPTIONS, Speculator, speculation_stats
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Constants
-SUPPORTED_CANCER_TYPES = ["Lung", "Breast", "Colorectal", "Other"]
-STAGES = ["Stage_2_3", "Stage_4"]
-THERAPY_STATUSES = ["newly_diagnosed", "had_surgery", "had_therapy", "had_both", "therapy_not_working", "in_therapy"]
-
 stage_2_3_therapy_statuses = ["Newly Diagnosed", "Had Surgery", "Had Therapy", "Had Both Surgery and Therapy"]
 stage_4_therapy_statuses = ["Newly Diagnosed", "Not Responding to Therapy", "In Therapy"]
 
 # Configuration (use environment variables or configuration files in production)
-AWS_REGION = os.getenv('AWS_REGION', 'us-west-2')
-BEDROCK_MODEL_ID = 'anthropic.claude-3-5-sonnet-20241022-v2:0'
-
-# Initialize Bedrock client
-try:
-    bedrock_client = boto3.client('bedrock-runtime', region_name=AWS_REGION)
-except Exception as e:
-    logger.error(f"Error initializing Bedrock client: {e}")
-    st.error("An error occurred while initializing the application. Please try again later.")
-    st.stop()
+# Render product descriptions token by token as Bedrock streams them
+STREAM_DESCRIPTIONS = os.getenv('STREAM_DESCRIPTIONS', 'true').lower() == 'true'
+# Cookie carrying the session id, so a reload or another replica resumes the conversation (empty disables).
+# The id is the only key to the stored conversation, patient details included, so it stays out of
+# URLs and a new one is issued whenever a conversation is reset. It is not a credential: Streamlit
+# cannot answer with Set-Cookie, so the cookie is written by a page script and cannot be HttpOnly.
+# Tabs of one browser share the cookie and so the conversation.
+SESSION_COOKIE = os.getenv('SESSION_COOKIE', 'tsb_sid')
+# How long a turn keeps retrying while Bedrock admission control or the engine turns it away
+BUSY_RETRY_SECONDS = float(os.getenv('BUSY_RETRY_SECONDS', '30'))
+
+ENGINE_BUSY_TEXT = "We are handling a lot of requests right now. Please try again in a moment."
+BUSY_RETRY_TEXT = "We're busy right now, retrying…"
 
 # Streamlit app
 st.subheader('Test Selection Assistant', divider='rainbow')
 
-# Initialize chat history and attributes in session state
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
-
-if 'attributes' not in st.session_state:
-    st.session_state.attributes = {
-        "cancer_type": "Unknown",
-        "stage": "Unknown",
-        "therapy_status": "Unknown",
-    }
-
-def recommend_guardant_test(
-    cancer_type: str,
-    stage: str,
-    therapy_status: str,
-) -> str:
+def likely_recommendations(attributes: Dict[str, Any]) -> list:
     """
-    Recommends a Guardant test based on the provided attributes.
+    Lists the distinct recommendations still reachable from the attributes collected so far.
     """
-    recommendation = "Further assessment needed"
-    future_recommendation = None
-    
-    if cancer_type in ["Lung", "Breast", "Colorectal"]:
-        if stage == "Stage_2_3":
-            if therapy_status == "newly_diagnosed":
-                recommendation = "We recommend **Guardant360 LDT** or **Guardant360 CDx**"
-                future_recommendation = "We also highly recommend following up with 'Guardant Reveal' to monitor the patient's response to therapy."
-            else: 
-                recommendation = "We recommend **Guardant Reveal**"
-                future_recommendation = "With 'Guardant Reveal', patients receive up to 3 blood draws starting between 3-13 weeks after curative intent therapy."
-        elif stage == "Stage_4":
-            if therapy_status == "newly_diagnosed" or therapy_status == "therapy_not_working":
-                recommendation = "We recommend **Guardant360 LDT** or **Guardant360 CDx**"
-                future_recommendation = "We also highly recommend following up with 'Guardant360 Response' to monitor the patient's response to therapy."
-            elif therapy_status == "in_therapy":
-                recommendation = "We recommend **Guardant360 Response**"
-                future_recommendation = "Assess response to IO and targeted therapy with a single draw 4 - 10 weeks after starting therapy initiation"
-    else:
-        recommendation = 'We recommend **Guardant360 CDx** & **TissueNext**'
-    
-    return recommendation, future_recommendation
-    
-def extract_attributes_with_claude(chat_history: list) -> Dict[str, Any]:
+    def candidates(key, values):
+        return values if attributes.get(key, "Unknown") == "Unknown" else [attributes[key]]
+
+    recommendations = []
+    for cancer_type in candidates("cancer_type", SUPPORTED_CANCER_TYPES):
+        for stage in candidates("stage", STAGES):
+            for therapy_status in candidates("therapy_status", THERAPY_STATUSES):
+                if therapy_status not in STAGE_THERAPY_STATUSES.get(stage, THERAPY_STATUSES):
+                    continue
+                recommendation, _ = recommend_guardant_test(cancer_type, stage, therapy_status)
+                if recommendation not in recommendations:
+                    recommendations.append(recommendation)
+    return recommendations
+
+def speculate_descriptions(attributes: Dict[str, Any]):
     """
-    Uses Bedrock Claude to extract attributes from the user's input, considering the entire chat history.
+    Starts generating descriptions for the recommendations the pending answer can still lead to.
     """
-    # Define the system prompt
-    system_prompt = '''
-You are an AI assistant that extracts specific attributes from user input.
-
-Extract the following attributes from the user input and output them as a JSON object:
-
-{{
-    "cancer_type": "Lung" / "Breast" / "Colorectal" / "Other" / "Unknown",
-    "stage": "Stage_2_3" / "Stage_4" / "Unknown",
-    "therapy_status": if stage_2_3: "newly_diagnosed" / "had_surgery" / "had_therapy" / "had_both" / "Unknown"
-                        if stage_4: "newly_diagnosed" / "therapy_not_working" / "in_therapy" / "Unknown",
-}}
-Always choose "Unknown" if the user didn't provide the information.
-DO NOT INCLUDE ANY INFORMATION FROM THE PREVIOUS CHAT MESSAGES. ONLY USE THE LATEST CHAT MESSAGE TO GENERATE THE JSON.
-DO NOT HALLUCINATE OR MAKE UP INFORMATION. ONLY EXTRACT THE ATTRIBUTES IF THEY ARE MENTIONED IN THE USER INPUT.
-Make sure the output is valid JSON.
-'''
-# If the use prompt asks for more information on a test and not a new recommendation, just generate a JSON saying new_recommendation: False
-
-    # Build the messages list including the system prompt and chat history
-    messages = []
-
-    for message in chat_history:
-        messages.append({
-            "role": message['role'],
-            "content": [{
-                "type": "text",
-                "text": message['text']
-            }]
-        })
+    recommendations = likely_recommendations(attributes)
+    if DESCRIPTION_CACHE_ENABLED:
+        recommendations = [
+            recommendation for recommendation in recommendations
+            if DescriptionCache.make_key(recommendation, DESCRIPTION_PROMPT_VERSION, DESCRIPTION_MODEL_ID) not in description_cache
+        ]
+    if 0 < len(recommendations) <= SPECULATION_MAX_BRANCHES:
+        st.session_state.speculator.speculate(recommendations)
+
+def with_busy_retries(call, *args):
+    """
+    Returns call(*args), retrying with backoff while Bedrock or the engine is busy and showing a
+    status meanwhile. Retries keep the first try's place in the admission queue. Raises the busy
+    error once BUSY_RETRY_SECONDS have passed.
+    """
+    deadline = time.monotonic() + BUSY_RETRY_SECONDS
+    delay = 0.5
+    status = st.empty()
+    with admission_ticket():
+        try:
+            while True:
+                try:
+                    return call(*args)
+                except (EngineBusy, BedrockBusy) as e:
+                    if time.monotonic() + delay > deadline:
+                        raise
+                    logger.info(f"Busy, retrying in {delay:.1f}s: {e}")
+                    status.info(BUSY_RETRY_TEXT)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 4)
+        finally:
+            status.empty()
+
+def with_busy_retries_stream(stream_function, *args):
+    """
+    Yields from stream_function(*args), starting it over while it is turned away as busy before its first chunk.
+    """
+    def first_chunk():
+        stream = iter(stream_function(*args))
+        return stream, next(stream, None)
 
-    body = json.dumps({
-        "messages": messages,
-        "anthropic_version": "bedrock-2023-05-31",
-        "system":            system_prompt,
-        "max_tokens":        2000,
-        "temperature":       0.1,
-        "top_p":             0.9
-    })
+    stream, text = with_busy_retries(first_chunk)
+    if text is not None:
+        yield text
+        yield from stream
 
+def turn_attributes(user_input: str) -> Dict[str, Any]:
+    """
+    Extracts the latest turn's attributes, on the serving engine when it is enabled.
+    Shows an error and returns {} if extraction failed.
+    """
     try:
-        response = bedrock_client.invoke_model(
-            modelId=BEDROCK_MODEL_ID,
-            accept='application/json',
-            contentType='application/json',
-            body=body
-        )
-
-        response_body = json.loads(response['body'].read())
-        text_output = response_body['content'][0]['text']
-
-        # Log the text output for debugging
-        logger.info(f"Text output from model: {text_output}")
-
-        # Parse the JSON output from the model's response
-        attributes = json.loads(text_output)
-        # if attributes.get('new_recommendation'):
-        #     attributes = get_product_description(chat_history[-1], chat_history)
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decoding error: {e}")
-        logger.error(f"Text output received: {text_output}")
-        st.error("An error occurred while processing your input. Please try again.")
-        attributes = {}
-    except Exception as e:
-        logger.error(f"Error invoking Bedrock model: {e}")
+        if not ENGINE_ENABLED:
+            extracted_attributes = with_busy_retries(
+                extract_turn_attributes, user_input, st.session_state.chat_history, st.session_state.attributes
+            )
+        else:
+            engine = get_engine()
+            extracted_attributes = with_busy_retries(
+                engine.run, engine.extract_turn_attributes, user_input, st.session_state.chat_history, st.session_state.attributes
+            )
+    except (EngineBusy, BedrockBusy):
+        st.error(ENGINE_BUSY_TEXT)
+        return {}
+    if not extracted_attributes:
         st.error("An error occurred while processing your request. Please try again later.")
-        attributes = {}
-
-    return attributes
-
-def get_product_description(recommendation: str, chat_history) -> str:
-    messages = []
-
-    for message in chat_history:
-        messages.append({
-            "role": message['role'],
-            "content": [{
-                "type": "text",
-                "text": message['text']
-            }]
-        })
-    
-    system_prompt = f'''
-You are an AI assistant that generates a product description based on the recommendation provided.
-Only talk in 'we' and 'our' and do not use any first person pronouns.
-
-Given the recommendation: "{recommendation}", generate a product description for the user.
-
-If there are multiple recommendations, generate a detailed comparison between the products.
-If the recommendation has LDT: be sure to mention that its not FDA approved, it evaluates 739 gene types.
-If the recommendation has CDx: be sure to mention that its FDA approved, it evaluates 74 gene types. 
-If comparing between LDT and CDx, make a table with the differences. Do not give any individual information about tests if comparing.
-
-Be concise. Do not repeat information.
-
-DO NOT AUTOMATICALLY PICK ONE TEST TO DESCRIBE. DESCRIBE ALL TESTS IN THE RECOMMENDATION.
-'''
-
-    body = json.dumps({
-        "messages": messages,
-        "anthropic_version": "bedrock-2023-05-31",
-        "system":            system_prompt,
-        "max_tokens":        500,
-        "temperature":       0.1,
-        "top_p":             0.9
-    })
+    return extracted_attributes
 
+def product_description(recommendation: str, chat_history: list, attributes: Dict[str, Any] = None) -> str:
+    """
+    Generates the product description, on the serving engine when it is enabled.
+    """
     try:
-        response = bedrock_client.invoke_model(
-            modelId=BEDROCK_MODEL_ID,
-            accept='application/json',
-            contentType='application/json',
-            body=body
-        )
-
-        response_body = json.loads(response['body'].read())
-        text_output = response_body['content'][0]['text']
-    except Exception as e:
-        logger.error(f"Error invoking Bedrock model: {e}")
+        if not ENGINE_ENABLED:
+            text_output = with_busy_retries(get_product_description, recommendation, chat_history, attributes)
+        else:
+            engine = get_engine()
+            text_output = with_busy_retries(engine.run, engine.describe, recommendation, chat_history, attributes)
+    except (EngineBusy, BedrockBusy):
+        st.error(ENGINE_BUSY_TEXT)
+        return DESCRIPTION_ERROR_TEXT
+    if text_output == DESCRIPTION_ERROR_TEXT:
         st.error("An error occurred while processing your request. Please try again later.")
-        text_output = "An error occurred while generating the product description. Please try again later."
-        
     return text_output
 
-def validate_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+def product_description_stream(recommendation: str, chat_history: list, attributes: Dict[str, Any] = None):
     """
-    Validates and normalizes the extracted attributes.
+    Yields the product description as it streams, from the serving engine when it is enabled.
     """
-    validated_attributes = {}
-
-    # Validate 'cancer_type'
-    cancer_type = attributes.get('cancer_type', 'Unknown')
-    if cancer_type in SUPPORTED_CANCER_TYPES + ['Other', 'Unknown']:
-        validated_attributes['cancer_type'] = cancer_type
-    else:
-        validated_attributes['cancer_type'] = 'Unknown'
-
-    # Validate 'stage'
-    stage = attributes.get('stage', 'Unknown')
-    if stage in STAGES:
-        validated_attributes['stage'] = stage
-    else:
-        validated_attributes['stage'] = 'Unknown'
-
-    # Validate 'therapy_status'
-    therapy_status = attributes.get('therapy_status', 'Unknown')
-    if therapy_status in THERAPY_STATUSES:
-        validated_attributes['therapy_status'] = therapy_status
-    else:
-        validated_attributes['therapy_status'] = 'Unknown'
+    try:
+        if not ENGINE_ENABLED:
+            stream = with_busy_retries_stream(stream_product_description, recommendation, chat_history, attributes)
+        else:
+            engine = get_engine()
+            stream = with_busy_retries_stream(engine.stream, engine.stream_description, recommendation, chat_history, attributes)
+        for text in stream:
+            if text == DESCRIPTION_ERROR_TEXT:
+                st.error("An error occurred while processing your request. Please try again later.")
+            yield text
+    except (EngineBusy, BedrockBusy):
+        st.error(ENGINE_BUSY_TEXT)
+        yield DESCRIPTION_ERROR_TEXT
+
+def handle_user_input(user_input: str):
+    with st.chat_message('user'):
+        st.markdown(user_input)
+    st.session_state.chat_history.append({"role": 'user', "text": user_input})
+
+    # Get the attributes from the local extractor, or Bedrock Claude when it is not confident
+    extracted_attributes = turn_attributes(user_input)
+    if not extracted_attributes:
+        return  # Error already handled
+
+    # Validate and update attributes in session state
+    try:
+        validated_attributes = validate_attributes(extracted_attributes)
+        update_attributes(st.session_state.attributes, validated_attributes)
+
+        # Check if all attributes are collected
+        if all_attributes_collected(st.session_state.attributes):
+            # Run the recommendation function
+            try:
+                with timer('recommendation'):
+                    recommendation, future_recommendation = recommend_guardant_test(
+                        cancer_type=st.session_state.attributes["cancer_type"],
+                        stage=st.session_state.attributes["stage"],
+                        therapy_status=st.session_state.attributes["therapy_status"],
+                    )
+                logger.info(f"Recommendation: {recommendation}")
+            except Exception as e:
+                logger.error(f"Error in recommendation function: {e}")
+                st.error("An error occurred while generating the recommendation. Please try again later.")
+                return
+            spec_url = {}
+            if 'Tissue' in recommendation:
+                spec_url['TissueNext Specifications'] = "https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Guardant360+TissueNext+Specification+Sheet.pdf"
+            elif 'CDx' in recommendation:
+                spec_url['Guardant360 CDx Specifications'] = 'https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Guardant360+CDx+Specification+Sheet.pdf'
+            if 'LDT' in recommendation:
+                spec_url['Guardant360 LDT Specifications'] = 'https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Guardant360+Specification+Sheet.pdf'
+            ordering_link = 'https://portal.guardanthealth.com/'
+            # Links and follow-up shown below the description
+            footer_text = ''
+            for key, value in spec_url.items():
+                footer_text += f"[{key}]({value})"
+                footer_text += '  \n\n'        
+            # footer_text += f"[Order Test through Portal]({ordering_link})"
+            # footer_text += '  \n\n'
+            if future_recommendation:
+                    footer_text += f'<div style="color:#2990e2; font-weight:bold;">{future_recommendation}</div><br>'
+            if DESCRIPTION_CACHE_ENABLED:
+                cache_key = DescriptionCache.make_key(recommendation, DESCRIPTION_PROMPT_VERSION, DESCRIPTION_MODEL_ID)
+                description_history, description_attributes = DESCRIPTION_CACHE_HISTORY, None
+                text_output = description_cache.get(cache_key)
+                logger.info(f"Description cache stats: {description_cache.stats()}")
+            else:
+                description_history, description_attributes = st.session_state.chat_history, st.session_state.attributes
+                text_output = None
+            cache_miss = text_output is None
+            if SPECULATIVE_DESCRIPTIONS:
+                if text_output is None:
+                    text_output = st.session_state.speculator.claim(recommendation)
+                else:
+                    st.session_state.speculator.discard()
+                logger.info(f"Speculation stats: {speculation_stats()}")
+            if text_output is not None:
+                print_text = text_output + '  \n\n' + footer_text
+                with timer('render_description'), st.chat_message('assistant'):
+                    st.markdown(print_text, unsafe_allow_html=True)
+                    st.link_button('Order Test through Portal', ordering_link)
+            elif STREAM_DESCRIPTIONS:
+                # Stream the description into the bubble and append the footer once it finishes
+                with st.chat_message('assistant'):
+                    text_output = st.write_stream(product_description_stream(recommendation, description_history, description_attributes))
+                    st.markdown(footer_text, unsafe_allow_html=True)
+                    st.link_button('Order Test through Portal', ordering_link)
+                print_text = text_output + '  \n\n' + footer_text
+            else:
+                text_output = product_description(recommendation, description_history, description_attributes)
+                print_text = text_output + '  \n\n' + footer_text
+                with timer('render_description'), st.chat_message('assistant'):
+                    st.markdown(print_text, unsafe_allow_html=True)
+                    st.link_button('Order Test through Portal', ordering_link)
+            if DESCRIPTION_CACHE_ENABLED and cache_miss and DESCRIPTION_ERROR_TEXT not in text_output:
+                description_cache.set(cache_key, text_output)
+            st.session_state.chat_history.append({"role": 'assistant', "text": print_text})                
+    
+            # Reset attributes for the next interaction, under a new session id
+            st.session_state.attributes = {key: "Unknown" for key in st.session_state.attributes}
+            st.session_state.rotate_session_id = True
+        else:
+            for key, value in st.session_state.attributes.items():
+                if value == "Unknown":
+                    with st.chat_message('assistant'):
+                        if key == "cancer_type":
+                            question = f"Can you please provide more details about the Cancer Type?"
+                            st.markdown(question)
+                            st.session_state.chat_history.append({"role": 'assistant', "text": question})
+                            options = f"Please select from the following options: {', '.join(SUPPORTED_CANCER_TYPES)}"
+                            st.markdown(options)
+                            st.session_state.chat_history.append({"role": 'assistant', "text": options})
+                        elif key == "stage":
+                            question = f"Can you please provide more details about the Cancer Stage of the patient?"
+                            st.markdown(question)
+                            st.session_state.chat_history.append({"role": 'assistant', "text": question})
+                            # options = f"Please select from the following options: "
+                            # st.markdown(options)
+                            # st.session_state.chat_history.append({"role": 'assistant', "text": options})
+                        elif key == "therapy_status" and st.session_state.attributes["stage"] != "Unknown":
+                            question = f"Can you please provide more details about patient's recent Therapy and Surgery Status?"
+                            st.markdown(question)
+                            st.session_state.chat_history.append({"role": 'assistant', "text": question})
+                            if st.session_state.attributes["stage"] == "Stage_2_3":
+                                options = f"Please select from the following options: {', '.join(stage_2_3_therapy_statuses)}"
+                            elif st.session_state.attributes["stage"] == "Stage_4":
+                                options = f"Please select from the following options: {', '.join(stage_4_therapy_statuses)}"
+                            st.markdown(options)
+                            st.session_state.chat_history.append({"role": 'assistant', "text": options})
+            if SPECULATIVE_DESCRIPTIONS:
+                # Start the likely descriptions while the user answers
+                speculate_descriptions(st.session_state.attributes)
+    except Exception as e:
+        with st.chat_message('assistant'):
+            st.markdown(extracted_attributes)
 
-    return validated_attributes
+def current_session_id() -> str:
+    """
+    The session id from the session cookie, or a new one.
+    """
+    session_id = st.context.cookies.get(SESSION_COOKIE) if SESSION_COOKIE else None
+    try:
+        return str(uuid.UUID(session_id))
+    except (TypeError, ValueError):
+        return new_session_id()
 
-def all_attributes_collected(attributes: Dict[str, Any]) -> bool:
+def new_session_id() -> str:
     """
-    Checks if all attributes have been collected.
+    A new random session id, stored in the session cookie.
     """
-    return all(value != "Unknown" for value in attributes.values())
+    session_id = str(uuid.uuid4())
+    if SESSION_COOKIE:
+        headers = st.context.headers
+        https = headers.get('X-Forwarded-Proto', '') == 'https' or headers.get('Origin', '').startswith('https:')
+        secure = '; Secure' if https else ''
+        # The component's iframe shares the app's origin, so the cookie is set for the app
+        components.html(
+            f"<script>document.cookie = '{SESSION_COOKIE}={session_id}; Path=/; Max-Age={int(SESSION_TTL)}; SameSite=Strict{secure}';</script>",
+            height=0,
+        )
+    return session_id
 
 def main():
-    # Initialize chat history and attributes if they don't exist
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-    if 'attributes' not in st.session_state:
-        st.session_state.attributes = {'cancer_type': 'Unknown', 'stage': 'Unknown', 'therapy_status': 'Unknown'}
+    # Conversation state lives in the session store between reruns and in st.session_state during one
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = current_session_id()
+    sessions = get_session_store()
+    for key, value in sessions.load(st.session_state.session_id).items():
+        st.session_state[key] = value
+    try:
+        chat_page()
+    finally:
+        if st.session_state.pop('rotate_session_id', False):
+            # Moves the conversation to a new id; the old one, wherever it was seen, no longer resumes it
+            sessions.delete(st.session_state.session_id)
+            st.session_state.session_id = new_session_id()
+        sessions.save(st.session_state.session_id, persisted_state(st.session_state))
+        for key in SESSION_KEYS:
+            st.session_state.pop(key, None)
+
+def chat_page():
+    if SPECULATIVE_DESCRIPTIONS and 'speculator' not in st.session_state:
+        # Speculative descriptions are context-free, like the cached ones
+        st.session_state.speculator = Speculator(generate_cacheable_description)
     
+    # Expose /metrics when enabled (once per process)
+    start_metrics_server()
+
+    # Create the process-wide Bedrock client in the background (once per process), so the first
+    # render does not wait for boto3 to import; the first call waits for it if it is not ready yet
+    start_client_warmup()
+
+    # Generate every product description in the background once per process
+    if DESCRIPTION_CACHE_ENABLED and DESCRIPTION_CACHE_PREWARM:
+        start_prewarm(
+            [DescriptionCache.make_key(recommendation, DESCRIPTION_PROMPT_VERSION, DESCRIPTION_MODEL_ID) for recommendation in all_recommendations()],
+            generate_cacheable_description,
+        )
+
     # Display all previous chat messages
     for chat in st.session_state.chat_history:
         with st.chat_message(chat['role']):
             st.markdown(chat['text'])
     
     # Display the initial assistant message only once
-    if 'welcome_message_displayed' not in st.session_state:
+    if not st.session_state.welcome_message_displayed:
         with st.chat_message('assistant'):
             initial_message = "Hi! Welcome to GH Test Selection Assistant! Please start with your patient's cancer type and stage."
             st.markdown(initial_message)
@@ -262,94 +388,9 @@ def main():
     # Chat input from user
     user_input = st.chat_input('Enter your message here...')
     if user_input:
-        with st.chat_message('user'):
-            st.markdown(user_input)
-        st.session_state.chat_history.append({"role": 'user', "text": user_input})
-    
-        # Use Bedrock Claude to get attributes
-        extracted_attributes = extract_attributes_with_claude(chat_history=st.session_state.chat_history)
-        if not extracted_attributes:
-            return  # Error already handled
-
-        # Validate and update attributes in session state
-        try:
-            validated_attributes = validate_attributes(extracted_attributes)
-            for key in st.session_state.attributes:
-                if validated_attributes.get(key, "Unknown") != "Unknown":
-                    st.session_state.attributes[key] = validated_attributes[key]
-    
-            # Check if all attributes are collected
-            if all_attributes_collected(st.session_state.attributes):
-                # Run the recommendation function
-                try:
-                    recommendation, future_recommendation = recommend_guardant_test(
-                        cancer_type=st.session_state.attributes["cancer_type"],
-                        stage=st.session_state.attributes["stage"],
-                        therapy_status=st.session_state.attributes["therapy_status"],
-                    )
-                    logger.info(f"Recommendation: {recommendation}")
-                except Exception as e:
-                    logger.error(f"Error in recommendation function: {e}")
-                    st.error("An error occurred while generating the recommendation. Please try again later.")
-                    return
-                text_output = get_product_description(recommendation, st.session_state.chat_history)
-                spec_url = {}
-                if 'Tissue' in recommendation:
-                    spec_url['TissueNext Specifications'] = "https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Guardant360+TissueNext+Specification+Sheet.pdf"
-                elif 'CDx' in recommendation:
-                    spec_url['Guardant360 CDx Specifications'] = 'https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Guardant360+CDx+Specification+Sheet.pdf'
-                if 'LDT' in recommendation:
-                    spec_url['Guardant360 LDT Specifications'] = 'https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Guardant360+Specification+Sheet.pdf'
-                ordering_link = 'https://portal.guardanthealth.com/'
-                # print_text = recommendation
-                # print_text += '  \n\n'
-                print_text = text_output
-                print_text += '  \n\n'        
-                for key, value in spec_url.items():
-                    print_text += f"[{key}]({value})"
-                    print_text += '  \n\n'        
-                # print_text += f"[Order Test through Portal]({ordering_link})"
-                # print_text += '  \n\n'
-                if future_recommendation:
-                        print_text += f'<div style="color:#2990e2; font-weight:bold;">{future_recommendation}</div><br>'
-                with st.chat_message('assistant'):
-                    st.markdown(print_text, unsafe_allow_html=True)
-                    st.link_button('Order Test through Portal', ordering_link)
-                st.session_state.chat_history.append({"role": 'assistant', "text": print_text})                
-        
-                # Reset attributes for the next interaction
-                st.session_state.attributes = {key: "Unknown" for key in st.session_state.attributes}
-            else:
-                for key, value in st.session_state.attributes.items():
-                    if value == "Unknown":
-                        with st.chat_message('assistant'):
-                            if key == "cancer_type":
-                                question = f"Can you please provide more details about the Cancer Type?"
-                                st.markdown(question)
-                                st.session_state.chat_history.append({"role": 'assistant', "text": question})
-                                options = f"Please select from the following options: {', '.join(SUPPORTED_CANCER_TYPES)}"
-                                st.markdown(options)
-                                st.session_state.chat_history.append({"role": 'assistant', "text": options})
-                            elif key == "stage":
-                                question = f"Can you please provide more details about the Cancer Stage of the patient?"
-                                st.markdown(question)
-                                st.session_state.chat_history.append({"role": 'assistant', "text": question})
-                                # options = f"Please select from the following options: "
-                                # st.markdown(options)
-                                # st.session_state.chat_history.append({"role": 'assistant', "text": options})
-                            elif key == "therapy_status" and st.session_state.attributes["stage"] != "Unknown":
-                                question = f"Can you please provide more details about patient's recent Therapy and Surgery Status?"
-                                st.markdown(question)
-                                st.session_state.chat_history.append({"role": 'assistant', "text": question})
-                                if st.session_state.attributes["stage"] == "Stage_2_3":
-                                    options = f"Please select from the following options: {', '.join(stage_2_3_therapy_statuses)}"
-                                elif st.session_state.attributes["stage"] == "Stage_4":
-                                    options = f"Please select from the following options: {', '.join(stage_4_therapy_statuses)}"
-                                st.markdown(options)
-                                st.session_state.chat_history.append({"role": 'assistant', "text": options})
-        except Exception as e:
-            with st.chat_message('assistant'):
-                st.markdown(extracted_attributes)
+        tag(st.session_state.session_id, sum(1 for chat in st.session_state.chat_history if chat['role'] == 'user') + 1)
+        with timer('turn'):
+            handle_user_input(user_input)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
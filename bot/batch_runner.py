@@ -0,0 +1,183 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List
+
+from admission import AdmissionController, admission_ticket, set_admission_controller
+from pipeline import process_turn
+
+# Headless runner that replays chat transcripts through the bot pipeline.
+#
+#   python bot/batch_runner.py transcripts.jsonl -o results.jsonl --workers 8 --rps 5
+#
+# Each input line is a JSON object with an "id" and a "turns" list of user messages (strings or
+# {"role", "text"} objects; non-user turns are ignored). Each output line holds the attributes
+# after every turn and the recommendations made. The output file doubles as the checkpoint:
+# conversations already in it are skipped when the run is restarted.
+#
+# --rps sets the request rate of Bedrock admission control (admission.py), which counts every real
+# attempt, retries and hedges included.
+#
+# A conversation stops at its first failed turn, since the turns after it would run on stale
+# attributes. It is then written to the failed file (results.failed.jsonl next to results.jsonl by
+# default) instead of the output, so the next run retries it; the failed file is rewritten every run.
+# Turns that Bedrock admission control turns away as busy are retried with backoff, keeping their
+# place in the admission queue, for up to BATCH_BUSY_RETRY_SECONDS before they count as failed.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WELCOME_MESSAGE = "Hi! Welcome to GH Test Selection Assistant! Please start with your patient's cancer type and stage."
+
+# Configuration (use environment variables or configuration files in production)
+BATCH_BUSY_RETRY_SECONDS = float(os.getenv('BATCH_BUSY_RETRY_SECONDS', '300'))
+BATCH_BUSY_MAX_DELAY = float(os.getenv('BATCH_BUSY_MAX_DELAY', '10'))
+
+
+def user_turns(conversation: Dict[str, Any]) -> List[str]:
+    turns = []
+    for turn in conversation.get('turns', []):
+        if isinstance(turn, str):
+            turns.append(turn)
+        elif turn.get('role', 'user') == 'user':
+            turns.append(turn['text'])
+    return turns
+
+
+def process_turn_with_busy_retries(user_input: str, chat_history: list, attributes: Dict[str, Any], with_descriptions: bool):
+    """
+    process_turn, run again from the same chat history and attributes while the turn is turned away
+    as busy, until BATCH_BUSY_RETRY_SECONDS have passed.
+    """
+    deadline = time.monotonic() + BATCH_BUSY_RETRY_SECONDS
+    delay = 0.5
+    history_length = len(chat_history)
+    with admission_ticket():
+        while True:
+            turn, next_attributes = process_turn(user_input, chat_history, dict(attributes), with_descriptions)
+            if turn.get("error") != "busy" or time.monotonic() + delay > deadline:
+                return turn, next_attributes
+            logger.info(f"Turn turned away as busy, retrying in {delay:.1f}s")
+            del chat_history[history_length:]
+            time.sleep(delay)
+            delay = min(delay * 2, BATCH_BUSY_MAX_DELAY)
+
+
+def run_conversation(conversation: Dict[str, Any], with_descriptions: bool = True) -> Dict[str, Any]:
+    """
+    Drives one transcript through extraction, validation, recommendation and description,
+    following the same turn logic as the chat app. Stops at the first failed turn; the result
+    then has an "error" and counts as not done.
+    """
+    chat_history = [{"role": 'assistant', "text": WELCOME_MESSAGE}]
+    attributes = {"cancer_type": "Unknown", "stage": "Unknown", "therapy_status": "Unknown"}
+    result = {"id": conversation['id'], "turns": [], "recommendations": []}
+    start = time.perf_counter()
+
+    for user_input in user_turns(conversation):
+        turn, attributes = process_turn_with_busy_retries(user_input, chat_history, attributes, with_descriptions)
+        result["turns"].append({key: turn[key] for key in ("user", "attributes", "error") if key in turn})
+        if "error" in turn:
+            result["error"] = f"turn {len(result['turns'])}: {turn['error']}"
+            break
+        if "recommendation" in turn:
+            result["recommendations"].append({
+                key: turn[key] for key in ("attributes", "recommendation", "future_recommendation", "description") if key in turn
+            })
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def completed_ids(output_path: str) -> set:
+    """
+    Ids of the conversations in the output whose turns all succeeded.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # partially written last line of an interrupted run
+            # Outputs from before failed conversations were kept separate can hold failed turns
+            if 'id' in result and 'error' not in result and not any('error' in turn for turn in result.get('turns', [])):
+                done.add(result['id'])
+    return done
+
+
+def load_conversations(input_path: str) -> List[Dict[str, Any]]:
+    conversations = []
+    with open(input_path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            conversation = json.loads(line)
+            conversation.setdefault('id', line_number)
+            conversations.append(conversation)
+    return conversations
+
+
+def failed_path_for(output_path: str) -> str:
+    root, extension = os.path.splitext(output_path)
+    return f"{root}.failed{extension or '.jsonl'}"
+
+
+def run_batch(input_path: str, output_path: str, workers: int = 4, rps: float = 0.0, with_descriptions: bool = True,
+              failed_path: str = None):
+    failed_path = failed_path or failed_path_for(output_path)
+    conversations = load_conversations(input_path)
+    done = completed_ids(output_path)
+    pending = [conversation for conversation in conversations if conversation['id'] not in done]
+    logger.info(f"{len(conversations)} conversations, {len(done)} already done, {len(pending)} to run")
+
+    if rps > 0:
+        # Admission control counts every real attempt, retries and hedges included
+        set_admission_controller(AdmissionController(requests_per_second=rps))
+
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+    failed = 0
+    with open(output_path, 'a') as output, open(failed_path, 'w') as failures, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_conversation, conversation, with_descriptions): conversation for conversation in pending}
+        for completed, future in enumerate(as_completed(futures), 1):
+            conversation = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": conversation['id'], "error": str(e)}
+            # Failed conversations are kept out of the output, so they are retried on the next run
+            if "error" in result:
+                logger.error(f"Conversation {conversation['id']} failed: {result['error']}")
+                failed += 1
+            with write_lock:
+                destination = failures if "error" in result else output
+                destination.write(json.dumps(result) + '\n')
+                destination.flush()
+            if completed % 100 == 0:
+                logger.info(f"{completed}/{len(pending)} conversations processed")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Processed {len(pending) - failed} conversations in {elapsed:.1f}s ({failed} failed, in {failed_path}), results in {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay JSONL chat transcripts through the test selection pipeline")
+    parser.add_argument('input', help="JSONL file with one transcript per line")
+    parser.add_argument('-o', '--output', default='results.jsonl', help="JSONL output, also used to resume interrupted runs")
+    parser.add_argument('--failed', help="JSONL file for conversations with a failed turn (default: <output>.failed.jsonl)")
+    parser.add_argument('--workers', type=int, default=4, help="conversations processed concurrently")
+    parser.add_argument('--rps', type=float, default=0.0, help="maximum Bedrock requests per second (0 for the admission control default, BEDROCK_REQUESTS_PER_SECOND)")
+    parser.add_argument('--no-descriptions', action='store_true', help="skip product description generation")
+    args = parser.parse_args()
+    run_batch(args.input, args.output, args.workers, args.rps, not args.no_descriptions, args.failed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import os
+import asyncio
+import logging
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from functools import partial
+
+from admission import AdmittedClient, AsyncAdmittedClient
+from cassette import BEDROCK_CASSETTE_MODE, CassetteClient
+from retry import RETRY_ENABLED, AsyncResilientClient, ResilientClient
+
+logger = logging.getLogger(__name__)
+
+# Configuration (use environment variables or configuration files in production)
+AWS_REGION = os.getenv('AWS_REGION', 'us-west-2')
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', '50'))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv('BEDROCK_CONNECT_TIMEOUT', '5'))
+BEDROCK_READ_TIMEOUT = float(os.getenv('BEDROCK_READ_TIMEOUT', '60'))
+# botocore's own attempts per call; when RETRY_ENABLED the runtime and agent runtime clients are retried by retry.py instead
+BEDROCK_MAX_ATTEMPTS = int(os.getenv('BEDROCK_MAX_ATTEMPTS', '1' if RETRY_ENABLED else '4'))
+BEDROCK_TCP_KEEPALIVE = os.getenv('BEDROCK_TCP_KEEPALIVE', 'true').lower() == 'true'
+# Threads used to run boto3 calls for async callers when aiobotocore is not installed
+BEDROCK_ASYNC_THREADS = int(os.getenv('BEDROCK_ASYNC_THREADS', str(BEDROCK_MAX_POOL_CONNECTIONS)))
+# Create the runtime client on a background thread when the app starts, instead of on the first call
+BEDROCK_CLIENT_WARMUP = os.getenv('BEDROCK_CLIENT_WARMUP', 'true').lower() == 'true'
+
+# One client per (service, region) for the whole process. Streamlit re-executes the app script on
+# every rerun, but imported modules are kept, so every session and rerun shares these clients and
+# their connection pools. boto3 clients are thread-safe once created; sessions are not, so client
+# creation is serialised with a lock and each client gets its own session.
+_clients = {}
+_clients_lock = threading.Lock()
+_warmup_started = False
+
+# boto3 and botocore take a few hundred milliseconds to import, so they are imported by the functions
+# that create clients rather than here: importing this module, and every page that imports it, stays
+# cheap and the cost is paid once, by the first Bedrock call.
+
+
+def client_config():
+    """
+    Connection pool, timeout and retry settings shared by all Bedrock clients, as a botocore Config.
+    """
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        tcp_keepalive=BEDROCK_TCP_KEEPALIVE,
+        retries={'max_attempts': BEDROCK_MAX_ATTEMPTS, 'mode': 'adaptive'},
+    )
+
+
+def get_bedrock_client(service_name: str = 'bedrock-runtime', region_name: str = AWS_REGION):
+    """
+    Returns the process-wide client for the given Bedrock service, creating it on first use.
+    """
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if key not in _clients:
+            cassette = BEDROCK_CASSETTE_MODE if service_name == 'bedrock-runtime' else ''
+            if cassette == 'replay':
+                # Every response comes from the recordings, so no real client is needed
+                client = None
+            else:
+                logger.info(f"Creating {service_name} client in {region_name}")
+                import boto3
+                session = boto3.session.Session()
+                client = session.client(service_name, region_name=region_name, config=client_config())
+                if service_name == 'bedrock-runtime':
+                    # Below the retries, so every attempt is admitted, and below the cassette, so replays are not
+                    client = AdmittedClient(client)
+                if RETRY_ENABLED and service_name in ('bedrock-runtime', 'bedrock-agent-runtime'):
+                    client = ResilientClient(client)
+            if cassette:
+                logger.info(f"Bedrock cassette in {cassette} mode")
+                client = CassetteClient(client, mode=cassette)
+            _clients[key] = client
+        return _clients[key]
+
+
+def start_client_warmup(service_name: str = 'bedrock-runtime', region_name: str = AWS_REGION):
+    """
+    Creates the process-wide client on a background thread, once per process, so the first page
+    render does not wait for it. A failure is logged and the client is created again on first use.
+    """
+    global _warmup_started
+    with _clients_lock:
+        if _warmup_started or not BEDROCK_CLIENT_WARMUP:
+            return
+        _warmup_started = True
+
+    def warm():
+        try:
+            get_bedrock_client(service_name, region_name)
+        except Exception as e:
+            logger.error(f"Error creating {service_name} client in the background: {e}")
+
+    threading.Thread(target=warm, name='bedrock-warmup', daemon=True).start()
+
+
+def set_bedrock_client(client, service_name: str = 'bedrock-runtime', region_name: str = AWS_REGION):
+    """
+    Replaces the process-wide client, e.g. with a rate-limited wrapper or a local stand-in.
+    """
+    with _clients_lock:
+        _clients[(service_name, region_name)] = client
+
+
+class AsyncBody:
+    """
+    Already-read response body with aiobotocore's awaitable read().
+    """
+
+    def __init__(self, payload: bytes):
+        self._payload = payload
+
+    async def read(self) -> bytes:
+        return self._payload
+
+
+class ThreadedBedrockClient:
+    """
+    Gives a boto3 client aiobotocore's call shapes by running every call, and every read of a
+    response stream, in a thread pool. Concurrency is then bounded by the pool size. Calls run in
+    the caller's context, so admission priorities and metric tags carry over.
+    """
+
+    def __init__(self, client, max_workers: int = BEDROCK_ASYNC_THREADS):
+        self._client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bedrock-async')
+
+    async def invoke_model(self, **kwargs):
+        def call():
+            response = self._client.invoke_model(**kwargs)
+            return {**response, "body": AsyncBody(response['body'].read())}
+        return await asyncio.get_running_loop().run_in_executor(self._executor, contextvars.copy_context().run, call)
+
+    async def invoke_model_with_response_stream(self, **kwargs):
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            self._executor, contextvars.copy_context().run, partial(self._client.invoke_model_with_response_stream, **kwargs)
+        )
+        return {**response, "body": self._events(iter(response['body']))}
+
+    async def _events(self, events):
+        loop = asyncio.get_running_loop()
+        finished = object()
+        while True:
+            event = await loop.run_in_executor(self._executor, next, events, finished)
+            if event is finished:
+                return
+            yield event
+
+
+async def create_async_bedrock_client(stack: AsyncExitStack, service_name: str = 'bedrock-runtime', region_name: str = AWS_REGION):
+    """
+    Creates an aiobotocore client on the running event loop that stays open until stack is closed.
+    Without aiobotocore, or with a cassette (which wraps the boto3 client), returns a thread-pool
+    adapter around the process-wide boto3 client instead.
+    """
+    if BEDROCK_CASSETTE_MODE and service_name == 'bedrock-runtime':
+        return ThreadedBedrockClient(get_bedrock_client(service_name, region_name))
+    try:
+        from aiobotocore.session import get_session as get_aio_session
+    except ImportError:  # Optional: without aiobotocore, async callers run boto3 calls in a thread pool
+        logger.info("aiobotocore is not installed, running async Bedrock calls in a thread pool")
+        return ThreadedBedrockClient(get_bedrock_client(service_name, region_name))
+    logger.info(f"Creating async {service_name} client in {region_name}")
+    client = await stack.enter_async_context(
+        get_aio_session().create_client(service_name, region_name=region_name, config=client_config())
+    )
+    if service_name == 'bedrock-runtime':
+        client = AsyncAdmittedClient(client)
+        if RETRY_ENABLED:
+            client = AsyncResilientClient(client)
+    return client
@@ -0,0 +1,52 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from cohort import ATTRIBUTE_CATEGORIES, recommend_cohort
+from recommendation import recommend_guardant_test
+
+# Rows per second of the vectorized cohort scorer against looping over recommend_guardant_test.
+#
+#   python bot/bench_cohort.py --rows 100000
+
+
+def synthetic_patients(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Include some values outside the known categories, as real exports have them
+    return pd.DataFrame({
+        column: rng.choice(categories + ["Unknown"], size=rows)
+        for column, categories in ATTRIBUTE_CATEGORIES.items()
+    })
+
+
+def run(rows: int):
+    patients = synthetic_patients(rows)
+
+    start = time.perf_counter()
+    scalar = [
+        recommend_guardant_test(cancer_type, stage, therapy_status)
+        for cancer_type, stage, therapy_status in zip(patients["cancer_type"], patients["stage"], patients["therapy_status"])
+    ]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = recommend_cohort(patients)
+    vectorized_seconds = time.perf_counter() - start
+
+    expected = pd.DataFrame(scalar, columns=["recommendation", "future_recommendation"])
+    assert (result["recommendation"].astype(object).to_numpy() == expected["recommendation"].to_numpy()).all()
+    assert (result["future_recommendation"].astype(object).fillna("").to_numpy() == expected["future_recommendation"].fillna("").to_numpy()).all()
+
+    print(f"rows:       {rows}")
+    print(f"scalar:     {scalar_seconds:.3f}s ({rows / scalar_seconds:,.0f} rows/s)")
+    print(f"vectorized: {vectorized_seconds:.3f}s ({rows / vectorized_seconds:,.0f} rows/s)")
+    print(f"speedup:    {scalar_seconds / vectorized_seconds:.1f}x (results identical)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark vectorized cohort recommendations against the scalar rules")
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    run(args.rows)
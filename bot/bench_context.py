@@ -0,0 +1,52 @@
+import argparse
+
+from context import build_full_messages, build_incremental_messages, estimate_request_tokens
+
+# Simulates a long chat session and prints the estimated input tokens sent on each turn
+# in 'full' and 'incremental' context mode.
+#
+#   python bot/bench_context.py --patients 10
+
+WELCOME = "Hi! Welcome to GH Test Selection Assistant! Please start with your patient's cancer type and stage."
+
+# Size of a typical rendered recommendation (description, comparison table, links and HTML follow-up)
+RECOMMENDATION_OUTPUT = (
+    "We recommend comparing our two comprehensive liquid biopsy options.\n\n"
+    "| Feature | Guardant360 LDT | Guardant360 CDx |\n|---|---|---|\n"
+    "| FDA status | Not FDA approved | FDA approved |\n| Genes evaluated | 739 | 74 |\n" * 4
+    + "[Guardant360 CDx Specifications](https://example.com/spec_sheets/Guardant360+CDx+Specification+Sheet.pdf)  \n\n"
+    + '<div style="color:#2990e2; font-weight:bold;">We also highly recommend following up with '
+    "'Guardant Reveal' to monitor the patient's response to therapy.</div><br>"
+)
+
+PATIENT_TURNS = [
+    ("Lung cancer", "Can you please provide more details about the Cancer Stage of the patient?"),
+    ("Stage 2", "Can you please provide more details about patient's recent Therapy and Surgery Status?"),
+    ("Had Surgery", RECOMMENDATION_OUTPUT),
+]
+
+
+def run(patients: int):
+    history = [{"role": 'assistant', "text": WELCOME}]
+    attributes = {"cancer_type": "Unknown", "stage": "Unknown", "therapy_status": "Unknown"}
+    print(f"{'turn':>4} {'history msgs':>12} {'full tokens':>12} {'incremental tokens':>19}")
+    turn = 0
+    totals = [0, 0]
+    for _ in range(patients):
+        for user_text, assistant_text in PATIENT_TURNS:
+            turn += 1
+            history.append({"role": 'user', "text": user_text})
+            full = estimate_request_tokens('', build_full_messages(history))
+            incremental = estimate_request_tokens('', build_incremental_messages(history, attributes))
+            totals[0] += full
+            totals[1] += incremental
+            print(f"{turn:>4} {len(history):>12} {full:>12} {incremental:>19}")
+            history.append({"role": 'assistant', "text": assistant_text})
+    print(f"Session total: full={totals[0]} incremental={totals[1]} ({totals[0] / max(totals[1], 1):.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-turn input tokens in full vs incremental context mode")
+    parser.add_argument('--patients', type=int, default=10, help="number of patients walked through in one session")
+    args = parser.parse_args()
+    run(args.patients)
@@ -0,0 +1,111 @@
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import set_admission_controller
+from bedrock import set_bedrock_client
+from engine import Engine
+from fake_bedrock import AsyncFakeBedrockClient, FakeBedrockClient, LatencyModel
+from loadtest import SCRIPTS, WELCOME_MESSAGE, percentile
+from pipeline import process_turn
+from retry import RETRY_ENABLED, AsyncResilientClient, ResilientClient
+
+# Concurrent conversations per process: one thread per conversation (the Streamlit model, capped by
+# --threads) against the asyncio engine, both on the local Bedrock stand-in.
+#
+#   python bot/bench_engine.py --conversations 500 --threads 32
+#
+# Set DESCRIPTION_CACHE_ENABLED=false so every conversation also waits on a description call.
+# Admission control is off, so both runs send calls as fast as they can.
+
+
+def new_conversation(rng: random.Random):
+    chat_history = [{"role": 'assistant', "text": WELCOME_MESSAGE}]
+    attributes = {"cancer_type": "Unknown", "stage": "Unknown", "therapy_status": "Unknown"}
+    return rng.choice(SCRIPTS), chat_history, attributes
+
+
+def fake_client(client_class, args):
+    return client_class(
+        extraction_latency=LatencyModel(args.extraction_latency, seed=args.seed),
+        description_latency=LatencyModel(args.description_latency, seed=args.seed + 1),
+        seed=args.seed,
+    )
+
+
+def run_threaded(args):
+    client = fake_client(FakeBedrockClient, args)
+    set_bedrock_client(ResilientClient(client) if RETRY_ENABLED else client)
+    latencies = []
+    peak_threads = threading.active_count()
+
+    def conversation(index: int):
+        script, chat_history, attributes = new_conversation(random.Random(args.seed + index))
+        for user_input in script:
+            start = time.perf_counter()
+            _, attributes = process_turn(user_input, chat_history, attributes)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        futures = [executor.submit(conversation, index) for index in range(args.conversations)]
+        peak_threads = max(peak_threads, threading.active_count())
+        for future in futures:
+            future.result()
+    return time.perf_counter() - start, latencies, client.peak_in_flight, peak_threads
+
+
+def run_engine(args):
+    client = fake_client(AsyncFakeBedrockClient, args)
+    engine = Engine(
+        client=AsyncResilientClient(client) if RETRY_ENABLED else client,
+        max_model_calls=args.model_calls,
+        max_pending=args.conversations,
+    )
+    latencies = []
+
+    async def conversation(index: int):
+        script, chat_history, attributes = new_conversation(random.Random(args.seed + index))
+        for user_input in script:
+            start = time.perf_counter()
+            _, attributes = await engine.process_turn(user_input, chat_history, attributes)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    futures = [engine.submit(conversation, index) for index in range(args.conversations)]
+    peak_threads = threading.active_count()
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return elapsed, latencies, client.peak_in_flight, peak_threads
+
+
+def report(name: str, elapsed: float, latencies: list, peak_in_flight: int, peak_threads: int):
+    print(
+        f"{name:<10} {len(latencies) / elapsed:8.1f} turns/s  "
+        f"p50={percentile(latencies, 50):.2f}s p95={percentile(latencies, 95):.2f}s  "
+        f"peak model calls in flight={peak_in_flight:<4} threads={peak_threads}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the async engine against thread-per-conversation serving")
+    parser.add_argument('--conversations', type=int, default=500, help="conversations started at once")
+    parser.add_argument('--threads', type=int, default=32, help="worker threads for the thread-per-conversation run")
+    parser.add_argument('--model-calls', type=int, default=256, help="engine limit on model calls in flight")
+    parser.add_argument('--extraction-latency', type=float, default=0.8, help="median fake extraction latency (s)")
+    parser.add_argument('--description-latency', type=float, default=0.6, help="median fake description latency (s)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    set_admission_controller(None)
+    print(f"{args.conversations} conversations")
+    report(f"threads({args.threads})", *run_threaded(args))
+    report("engine", *run_engine(args))
+
+
+if __name__ == '__main__':
+    main()
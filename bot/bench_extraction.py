@@ -0,0 +1,192 @@
+import os
+import io
+import json
+import time
+import logging
+import sys
+import argparse
+from typing import Any, Dict, List
+
+from bedrock import get_bedrock_client, set_bedrock_client
+from cassette import CassetteClient, recorded_latency
+from fake_bedrock import FakeBedrockClient, LatencyModel
+from fast_extract import extract_attributes_locally
+from pipeline import (
+    build_extraction_body,
+    extract_attributes_with_claude,
+    extract_turn_attributes,
+    parse_extraction_response,
+    update_attributes,
+    validate_attributes,
+)
+from routing import BEDROCK_MODEL_ID, EXTRACTION_MODEL_ID
+
+# Extraction accuracy, tokens and model latency per prompt/model variant over the labeled corpus in
+# extraction_corpus.jsonl (each case: the attributes collected so far, the user's message and the
+# attributes expected after it). Model calls go through a cassette: record once against Bedrock,
+# then replays run offline in seconds and give the same numbers every time. Latency is the
+# recorded model latency, so it is comparable between a replay and the live run it was taken from.
+#
+#   python bot/bench_extraction.py --mode once      # replay what is recorded, call Bedrock for the rest
+#   python bot/bench_extraction.py                  # replay only, offline; fails for variants not recorded
+#   python bot/bench_extraction.py --variants local tool:anthropic.claude-3-5-haiku-20241022-v1:0 --show-errors
+#   python bot/bench_extraction.py --mode record --fake --cassette /tmp/cassette    # exercise the harness offline
+#
+# Variants: 'local' (the keyword extractor alone), 'pipeline' (extract_turn_attributes: keyword fast
+# path, then the routed models), 'routed' (extract_attributes_with_claude: the extraction model with
+# its fallback), or '<tool|text>:<model id>' for one prompt mode on one model.
+
+logging.basicConfig(level=logging.ERROR)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extraction_corpus.jsonl')
+CASSETTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassettes', 'extraction')
+WELCOME_MESSAGE = "Hi! Welcome to GH Test Selection Assistant! Please start with your patient's cancer type and stage."
+FIELDS = ("cancer_type", "stage", "therapy_status")
+DEFAULT_VARIANTS = [
+    'local', 'pipeline', 'routed',
+    f'tool:{EXTRACTION_MODEL_ID}', f'text:{EXTRACTION_MODEL_ID}', f'tool:{BEDROCK_MODEL_ID}', f'text:{BEDROCK_MODEL_ID}',
+]
+
+
+class MeteredClient:
+    """
+    Records the tokens and model latency of every invoke_model call made through it.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.calls: List[Dict[str, float]] = []
+
+    def invoke_model(self, **kwargs):
+        start = time.perf_counter()
+        response = self._client.invoke_model(**kwargs)
+        payload = response['body'].read()
+        latency = recorded_latency(response)
+        usage = json.loads(payload).get('usage', {})
+        self.calls.append({
+            "seconds": latency if latency is not None else time.perf_counter() - start,
+            "input_tokens": usage.get('input_tokens', 0),
+            "output_tokens": usage.get('output_tokens', 0),
+        })
+        return {**response, "body": io.BytesIO(payload)}
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def extract(variant: str, case: Dict[str, Any], chat_history: list, attributes: Dict[str, Any]) -> Dict[str, Any]:
+    if variant == 'local':
+        return extract_attributes_locally(case["text"], attributes)[0]
+    if variant == 'pipeline':
+        return extract_turn_attributes(case["text"], chat_history, attributes)
+    if variant == 'routed':
+        return extract_attributes_with_claude(chat_history, attributes)
+    mode, _, model_id = variant.partition(':')
+    try:
+        response = get_bedrock_client().invoke_model(
+            modelId=model_id,
+            accept='application/json',
+            contentType='application/json',
+            body=build_extraction_body(chat_history, attributes, mode)
+        )
+        return parse_extraction_response(json.loads(response['body'].read()))
+    except Exception as e:
+        logging.error(f"{variant} failed on {case['id']}: {e}")
+        return {}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def run_variant(variant: str, corpus: List[Dict[str, Any]], meter: MeteredClient):
+    correct = {field: 0 for field in FIELDS}
+    exact, failed, errors = 0, 0, []
+    case_seconds, input_tokens, output_tokens, calls = [], 0, 0, 0
+    for case in corpus:
+        attributes = dict(case.get("attributes") or {field: "Unknown" for field in FIELDS})
+        chat_history = [{"role": 'assistant', "text": WELCOME_MESSAGE}] + case.get("history", []) + [{"role": 'user', "text": case["text"]}]
+        meter.calls.clear()
+        extracted = extract(variant, case, chat_history, dict(attributes))
+        failed += not extracted
+        predicted = update_attributes(attributes, validate_attributes(extracted))
+        for field in FIELDS:
+            correct[field] += predicted[field] == case["expected"][field]
+        if predicted == case["expected"]:
+            exact += 1
+        else:
+            errors.append((case, predicted))
+        case_seconds.append(sum(call["seconds"] for call in meter.calls))
+        input_tokens += sum(call["input_tokens"] for call in meter.calls)
+        output_tokens += sum(call["output_tokens"] for call in meter.calls)
+        calls += len(meter.calls)
+    cases = len(corpus)
+    return {
+        "exact": exact / cases,
+        **{field: correct[field] / cases for field in FIELDS},
+        "failed": failed,
+        "calls": calls / cases,
+        "input_tokens": input_tokens / cases,
+        "output_tokens": output_tokens / cases,
+        "p50_ms": percentile(case_seconds, 50) * 1000,
+        "p95_ms": percentile(case_seconds, 95) * 1000,
+    }, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extraction accuracy, tokens and latency per prompt/model variant")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--cassette', default=CASSETTE_PATH, help="directory of recorded responses")
+    parser.add_argument('--mode', default='replay', choices=('replay', 'once', 'record'))
+    parser.add_argument('--variants', nargs='+', default=DEFAULT_VARIANTS)
+    parser.add_argument('--fake', action='store_true', help="record from the local Bedrock stand-in instead of Bedrock")
+    parser.add_argument('--show-errors', action='store_true', help="list the cases each variant got wrong")
+    args = parser.parse_args()
+
+    if args.mode == 'replay':
+        recorded_client = None
+    elif args.fake:
+        recorded_client = FakeBedrockClient(LatencyModel(0.05, seed=0), LatencyModel(0.05, seed=1), seconds_per_token=0.001, seed=0)
+    else:
+        recorded_client = get_bedrock_client()
+    cassette = CassetteClient(recorded_client, args.cassette, args.mode, replay_latency=False)
+    meter = MeteredClient(cassette)
+    set_bedrock_client(meter)
+
+    corpus = load_corpus(args.corpus)
+    print(f"{len(corpus)} cases from {args.corpus}, cassette {args.cassette} ({args.mode})\n")
+    print(f"{'variant':<52}{'exact':>7}{'type':>7}{'stage':>7}{'therapy':>8}{'failed':>7}{'calls':>7}{'in tok':>8}{'out tok':>8}{'p50':>8}{'p95':>8}")
+    start = time.perf_counter()
+    unrecorded = []
+    for variant in args.variants:
+        misses = cassette.stats()['misses']
+        result, errors = run_variant(variant, corpus, meter)
+        misses = cassette.stats()['misses'] - misses
+        if misses:
+            # Missing recordings count as failed extractions, so the scores would be meaningless
+            unrecorded.append(variant)
+            print(f"{variant.replace('anthropic.', ''):<52}not recorded ({misses} calls missing from the cassette)")
+            continue
+        print(f"{variant.replace('anthropic.', ''):<52}{result['exact']:7.0%}{result['cancer_type']:7.0%}{result['stage']:7.0%}"
+              f"{result['therapy_status']:8.0%}{result['failed']:7d}{result['calls']:7.2f}{result['input_tokens']:8.0f}"
+              f"{result['output_tokens']:8.0f}{result['p50_ms']:6.0f}ms{result['p95_ms']:6.0f}ms")
+        if args.show_errors:
+            for case, predicted in errors:
+                wrong = ', '.join(f"{field}={predicted[field]} (expected {case['expected'][field]})"
+                                  for field in FIELDS if predicted[field] != case['expected'][field])
+                print(f"    {case['id']}: {wrong}")
+    stats = cassette.stats()
+    print(f"\n{time.perf_counter() - start:.1f}s; cassette: {stats['replayed']} replayed, {stats['recorded']} recorded, {stats['misses']} missing")
+    if unrecorded:
+        sys.exit(f"Not scored, recordings missing: {', '.join(unrecorded)}. "
+                 f"Record them with --mode once (or --mode record --fake to exercise the harness offline).")
+
+
+if __name__ == '__main__':
+    main()
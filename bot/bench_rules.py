@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from recommendation import RECOMMENDATION_RULES_PATH, RULE_ATTRIBUTES, recommend_guardant_test
+from rules import RulesFile, load_rules
+
+OUTPUTS = ("recommendation", "future_recommendation")
+# The six-attribute prototype's rules, to show lookup cost does not grow with the table
+APP2_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app2_rules.json')
+
+# Lookups per second of the compiled recommendation rules against the hand-written nested ifs they
+# replaced, after checking both give the same answer for every combination (and for unrecognised
+# values), plus the cost of compiling the file and of picking up an edited or broken file.
+#
+#   python bot/bench_rules.py --lookups 1000000
+
+
+def nested_if_recommendation(cancer_type: str, stage: str, therapy_status: str):
+    # recommend_guardant_test as it was written before the rules file
+    recommendation = "Further assessment needed"
+    future_recommendation = None
+
+    if cancer_type in ["Lung", "Breast", "Colorectal"]:
+        if stage == "Stage_2_3":
+            if therapy_status == "newly_diagnosed":
+                recommendation = "We recommend **Guardant360 LDT** or **Guardant360 CDx**"
+                future_recommendation = "We also highly recommend following up with 'Guardant Reveal' to monitor the patient's response to therapy."
+            else:
+                recommendation = "We recommend **Guardant Reveal**"
+                future_recommendation = "With 'Guardant Reveal', patients receive up to 3 blood draws starting between 3-13 weeks after curative intent therapy."
+        elif stage == "Stage_4":
+            if therapy_status == "newly_diagnosed" or therapy_status == "therapy_not_working":
+                recommendation = "We recommend **Guardant360 LDT** or **Guardant360 CDx**"
+                future_recommendation = "We also highly recommend following up with 'Guardant360 Response' to monitor the patient's response to therapy."
+            elif therapy_status == "in_therapy":
+                recommendation = "We recommend **Guardant360 Response**"
+                future_recommendation = "Assess response to IO and targeted therapy with a single draw 4 - 10 weeks after starting therapy initiation"
+    else:
+        recommendation = 'We recommend **Guardant360 CDx** & **TissueNext**'
+
+    return recommendation, future_recommendation
+
+
+def rate(name: str, function, inputs, baseline: float = None) -> float:
+    start = time.perf_counter()
+    for attributes in inputs:
+        function(*attributes)
+    elapsed = time.perf_counter() - start
+    note = f"  ({baseline / elapsed:.2f}x nested ifs)" if baseline else ''
+    print(f"{name:<32} {len(inputs) / elapsed / 1e6:6.2f}M lookups/s  {elapsed / len(inputs) * 1e9:6.0f}ns each{note}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compiled recommendation rules against nested ifs")
+    parser.add_argument('--lookups', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Every combination, plus values the extractor could pass through unvalidated
+    values = [domain + ["", "lung", "Stage_1"] for domain in RULE_ATTRIBUTES.values()]
+    combinations = [(c, s, t) for c in values[0] for s in values[1] for t in values[2]]
+    mismatches = [combination for combination in combinations if recommend_guardant_test(*combination) != nested_if_recommendation(*combination)]
+    print(f"{len(combinations)} combinations checked, {len(mismatches)} differ from the nested ifs {mismatches[:3] if mismatches else ''}")
+
+    start = time.perf_counter()
+    rules = load_rules(RECOMMENDATION_RULES_PATH, RULE_ATTRIBUTES, OUTPUTS)
+    print(f"compile: {(time.perf_counter() - start) * 1000:.2f}ms for {len(rules.table)} combinations\n")
+
+    rng = random.Random(args.seed)
+    known = [(rng.choice(RULE_ATTRIBUTES["cancer_type"]), rng.choice(RULE_ATTRIBUTES["stage"]), rng.choice(RULE_ATTRIBUTES["therapy_status"]))
+             for _ in range(args.lookups)]
+    baseline = rate("nested ifs", nested_if_recommendation, known)
+    rate("RuleSet.lookup", rules.lookup, known, baseline)
+    rate("recommend_guardant_test", recommend_guardant_test, known, baseline)
+    unrecognized = [(rng.choice(values[0]), rng.choice(values[1]), rng.choice(values[2])) for _ in range(args.lookups)]
+    rate("recommend_guardant_test (mixed)", recommend_guardant_test, unrecognized, rate("nested ifs (mixed)", nested_if_recommendation, unrecognized))
+    if os.path.exists(APP2_RULES_PATH):
+        app2_rules = load_rules(APP2_RULES_PATH, outputs=("recommendation",))
+        app2_inputs = [tuple(rng.choice(domain) for domain in app2_rules.attributes.values()) for _ in range(args.lookups)]
+        rate(f"app2 rules ({len(app2_rules.table)} combinations)", app2_rules.lookup, app2_inputs, baseline)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rules.json')
+        shutil.copy(RECOMMENDATION_RULES_PATH, path)
+        # Checked by hand here instead of from the watcher thread
+        rules_file = RulesFile(path, RULE_ATTRIBUTES, OUTPUTS, reload_seconds=0)
+        with open(path) as f:
+            spec = json.load(f)
+        spec["version"] = "edited"
+        spec["rules"][-1]["then"] = {"recommendation": "We recommend **Guardant360 TissueNext**"}
+        with open(path, 'w') as f:
+            json.dump(spec, f)
+        start = time.perf_counter()
+        rules_file.check()
+        reload_ms = (time.perf_counter() - start) * 1000
+        print(f"\nedited file: reloaded in {reload_ms:.2f}ms, now version {rules_file.current().version}, "
+              f"Other -> {rules_file.current().lookup('Other', 'Stage_4', 'in_therapy')[0]}")
+        spec["rules"].pop()
+        with open(path, 'w') as f:
+            json.dump(spec, f)
+        rules_file.check()
+        print(f"file with a gap: still serving version {rules_file.current().version} ({rules_file.stats()})")
+
+
+if __name__ == '__main__':
+    main()
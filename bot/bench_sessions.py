@@ -0,0 +1,127 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from recommendation import all_recommendations
+from session_store import SESSION_HISTORY_MAX_MESSAGES, MemorySessionStore, RedisSessionStore, SQLiteSessionStore, default_state
+
+# Memory per node of conversation state for a mix of idle and active sessions: held as Python objects
+# in st.session_state (as before the session store) against packed in the memory backend, plus the
+# SQLite file size, and the load + save cost of one rerun of an active session on each backend.
+#
+#   python bot/bench_sessions.py --sessions 10000 --active 0.2
+#   python bot/bench_sessions.py --redis-url redis://localhost:6379/0    # also time a Redis-compatible server
+
+WELCOME = "Hi! Welcome to GH Test Selection Assistant! Please start with your patient's cancer type and stage."
+QUESTIONS = [
+    "Can you please provide more details about the Cancer Stage of the patient?",
+    "Can you please provide more details about patient's recent Therapy and Surgery Status?",
+    "Please select from the following options: Newly Diagnosed, Not Responding to Therapy, In Therapy",
+]
+ANSWERS = ["lung cancer", "stage 4", "newly diagnosed", "breast, stage 2", "had surgery", "colorectal stage 3 after therapy"]
+
+
+def description(recommendation: str) -> str:
+    # Shaped like a generated description with the app's footer: about 2.5KB of markdown and HTML
+    body = ' '.join(
+        f"{recommendation} provides {topic} from a simple blood draw, with results in about 7 days to guide treatment decisions."
+        for topic in ["comprehensive genomic profiling", "actionable biomarker detection", "therapy selection support",
+                      "tumor mutational burden", "microsatellite instability status", "minimal residual disease monitoring"] * 3
+    )
+    return (f"**{recommendation}**\n\n{body}  \n\n[{recommendation} Specifications](https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/spec_sheets/Specification+Sheet.pdf)  \n\n"
+            '<div style="color:#2990e2; font-weight:bold;">Consider Guardant Reveal for monitoring after therapy</div><br>')
+
+
+def synthetic_state(rng: random.Random, descriptions: list, active: bool, long: bool) -> dict:
+    history = [{"role": 'assistant', "text": WELCOME}]
+    turns = rng.randint(40, 80) if long else (rng.randint(3, 8) if active else rng.randint(0, 2))
+    for turn in range(turns):
+        history.append({"role": 'user', "text": rng.choice(ANSWERS)})
+        if active and turn % 3 == 2:
+            # A fresh string per session, as the app builds it from the cached text and the footer
+            history.append({"role": 'assistant', "text": ''.join(list(rng.choice(descriptions)))})
+        else:
+            history.append({"role": 'assistant', "text": rng.choice(QUESTIONS)})
+    state = default_state()
+    state["chat_history"] = history
+    state["welcome_message_displayed"] = True
+    return state
+
+
+def allocated(build):
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_reruns(store, session_ids, runs: int, rng: random.Random):
+    latencies = []
+    for _ in range(runs):
+        session_id = rng.choice(session_ids)
+        start = time.perf_counter()
+        state = store.load(session_id)
+        state["chat_history"].append({"role": 'user', "text": rng.choice(ANSWERS)})
+        store.save(session_id, state)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark session state memory and load/save cost per node")
+    parser.add_argument('--sessions', type=int, default=10_000)
+    parser.add_argument('--active', type=float, default=0.2, help="fraction of sessions that reached recommendations")
+    parser.add_argument('--long', type=float, default=0.01, help="fraction of very long sessions (beyond the history cap)")
+    parser.add_argument('--runs', type=int, default=2000, help="reruns of active sessions timed per backend")
+    parser.add_argument('--redis-url', default='')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    descriptions = [description(recommendation) for recommendation in all_recommendations()]
+    kinds = [(rng.random() < args.active, rng.random() < args.long) for _ in range(args.sessions)]
+    session_ids = [f"session-{i}" for i in range(args.sessions)]
+
+    states, in_process = allocated(lambda: [synthetic_state(random.Random(i), descriptions, active, long) for i, (active, long) in enumerate(kinds)])
+    messages = sum(len(state["chat_history"]) for state in states)
+    active_ids = [session_id for session_id, (active, _) in zip(session_ids, kinds) if active]
+    print(f"{args.sessions:,} sessions ({len(active_ids):,} active, {sum(long for _, long in kinds)} long), {messages:,} messages, "
+          f"history cap {SESSION_HISTORY_MAX_MESSAGES}")
+
+    def fill(store):
+        for session_id, state in zip(session_ids, states):
+            store.save(session_id, state)
+        return store
+    memory_store, packed = allocated(lambda: fill(MemorySessionStore()))
+    stats = memory_store.stats()
+    print(f"\n{'':<34}{'total':>10}{'per session':>13}")
+    print(f"{'st.session_state objects':<34}{in_process / 1e6:8.1f}MB{in_process / args.sessions:11.0f}B")
+    print(f"{'memory store (packed + texts)':<34}{packed / 1e6:8.1f}MB{packed / args.sessions:11.0f}B   "
+          f"({in_process / packed:.0f}x smaller; records {stats['session_bytes'] / 1e6:.1f}MB, {stats['texts']} shared texts {stats['text_bytes'] / 1e3:.0f}KB)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sessions.db')
+        sqlite_store = fill(SQLiteSessionStore(path))
+        file_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"{'sqlite file (not in process)':<34}{file_size / 1e6:8.1f}MB{file_size / args.sessions:11.0f}B")
+
+        backends = [("memory", memory_store), ("sqlite", sqlite_store)]
+        if args.redis_url:
+            backends.append(("redis", fill(RedisSessionStore(url=args.redis_url))))
+        print(f"\nrerun of an active session (load + save), {args.runs} runs")
+        for name, store in backends:
+            latencies = time_reruns(store, active_ids, args.runs, random.Random(args.seed))
+            print(f"{name:<8} p50={percentile(latencies, 50) * 1000:6.3f}ms p95={percentile(latencies, 95) * 1000:6.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
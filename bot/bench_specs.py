@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from context import estimate_tokens
+from loadtest import percentile
+from pipeline import BASELINE_PRODUCT_FACTS, DESCRIPTION_CACHE_HISTORY, spec_query
+from spec_index import PRODUCTS, SpecIndex, products_in
+
+# Index build and query speed of the spec-sheet retrieval index, and the size of the product facts
+# in the description prompt: the top-k chunks retrieved for the description query (pipeline.spec_query)
+# against the baseline prompt's hard-coded product facts.
+#
+#   python bot/bench_specs.py --specs spec_sheets/
+#
+# Without --specs, synthetic spec sheets are generated, each with its key facts buried among
+# --paragraphs filler paragraphs, and retrieval recall is checked against those facts, both for
+# fact questions and for the description query of each product.
+
+FACTS = {
+    "Guardant360 LDT": ["Guardant360 LDT evaluates 739 genes from a simple blood draw.", "Guardant360 LDT is a laboratory developed test and is not FDA approved."],
+    "Guardant360 CDx": ["Guardant360 CDx evaluates 74 genes and is FDA approved as a companion diagnostic.", "Guardant360 CDx results are reported within 7 days of sample receipt."],
+    "Guardant360 TissueNext": ["Guardant360 TissueNext profiles 498 genes from FFPE tissue samples.", "TissueNext reports tumor mutational burden and microsatellite instability."],
+    "Guardant Reveal": ["Guardant Reveal detects circulating tumor DNA after surgery without a tissue sample.", "Guardant Reveal supports serial draws to monitor for recurrence."],
+    "Guardant360 Response": ["Guardant360 Response measures changes in ctDNA levels 4 to 10 weeks after therapy starts.", "Guardant360 Response can predict response to immunotherapy earlier than imaging."],
+}
+
+QUESTIONS = [
+    ("How many genes does the test evaluate?", "Guardant360 LDT", "739"),
+    ("Is it FDA approved?", "Guardant360 LDT", "not FDA approved"),
+    ("How many genes does it cover?", "Guardant360 CDx", "74 genes"),
+    ("What is the turnaround time for results?", "Guardant360 CDx", "7 days"),
+    ("What sample type is needed?", "Guardant360 TissueNext", "FFPE tissue"),
+    ("Does it need a tissue sample after surgery?", "Guardant Reveal", "without a tissue"),
+    ("When should the blood draw happen after therapy starts?", "Guardant360 Response", "4 to 10 weeks"),
+]
+
+FILLER = [
+    "Specimen collection kits are shipped at no cost to the ordering practice.",
+    "Billing questions are handled by our client services team during business hours.",
+    "Please refer to the ordering portal for the most recent version of the requisition form.",
+    "Our laboratory is CLIA certified and CAP accredited.",
+    "Store collection tubes at room temperature and avoid freezing.",
+    "Results are available through the online portal and by fax.",
+    "Contact your account representative for in-service training.",
+]
+
+
+def write_synthetic_specs(directory: str, paragraphs: int, seed: int = 0):
+    rng = random.Random(seed)
+    for product, _, _ in PRODUCTS:
+        body = [" ".join(rng.sample(FILLER, 3)) for _ in range(paragraphs)]
+        for fact in FACTS[product]:
+            body.insert(rng.randrange(len(body) + 1), fact)
+        with open(os.path.join(directory, f"{product.replace(' ', '+')}+Specification+Sheet.txt"), 'w') as f:
+            f.write("\n\n".join(body))
+
+
+def run(spec_dir: str, queries: int, top_k: int, check_recall: bool):
+    start = time.perf_counter()
+    index = SpecIndex.build(spec_dir)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    SpecIndex.build(spec_dir, previous=index)
+    rebuild_seconds = time.perf_counter() - start
+    print(f"build:    {len(index)} chunks in {build_seconds * 1000:.1f}ms, unchanged rebuild {rebuild_seconds * 1000:.1f}ms")
+
+    latencies = []
+    for i in range(queries):
+        question, product, _ = QUESTIONS[i % len(QUESTIONS)]
+        start = time.perf_counter()
+        index.search(question, [product], top_k)
+        latencies.append(time.perf_counter() - start)
+    print(f"query:    p50={percentile(latencies, 50) * 1000:.2f}ms p95={percentile(latencies, 95) * 1000:.2f}ms over {queries} queries")
+
+    recommendation = "We recommend **Guardant360 LDT** or **Guardant360 CDx**"
+    products = products_in(recommendation)
+    retrieved = index.search(spec_query(recommendation, DESCRIPTION_CACHE_HISTORY), products, top_k)
+    print(
+        f"prompt:   {sum(estimate_tokens(chunk['text']) for _, chunk in retrieved)} tokens of retrieved facts for {' and '.join(products)} "
+        f"vs {estimate_tokens(BASELINE_PRODUCT_FACTS)} tokens of the baseline prompt's product facts"
+    )
+
+    if check_recall:
+        found = sum(
+            any(expected in chunk["text"] for _, chunk in index.search(question, [product], top_k))
+            for question, product, expected in QUESTIONS
+        )
+        print(f"recall:   {found}/{len(QUESTIONS)} questions retrieved the chunk with the answer (k={top_k})")
+        found, facts = 0, 0
+        for product, _, _ in PRODUCTS:
+            query = spec_query(f"We recommend **{product}**", DESCRIPTION_CACHE_HISTORY)
+            texts = [chunk["text"] for _, chunk in index.search(query, [product], top_k)]
+            found += sum(any(fact in text for text in texts) for fact in FACTS[product])
+            facts += len(FACTS[product])
+        print(f"          {found}/{facts} key facts retrieved by the description queries (the baseline prompt covers LDT and CDx only)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the spec-sheet retrieval index")
+    parser.add_argument('--specs', help="directory of spec sheets (default: generate synthetic ones)")
+    parser.add_argument('--paragraphs', type=int, default=200, help="filler paragraphs per synthetic spec sheet")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=3, help="chunks retrieved per product")
+    args = parser.parse_args()
+
+    if args.specs:
+        run(args.specs, args.queries, args.k, check_recall=False)
+        return
+    with tempfile.TemporaryDirectory() as spec_dir:
+        write_synthetic_specs(spec_dir, args.paragraphs)
+        run(spec_dir, args.queries, args.k, check_recall=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+# Startup cost of each Streamlit app, measured in fresh processes the way a new replica or a CI job
+# starts them: interpreter plus streamlit import, the app's first script run (its own imports,
+# clients and stores, up to the first rendered page) and the peak RSS after that run and after
+# background warm-ups have had a moment to finish. Every app is run once untimed first, so bytecode
+# is cached, as it is on a deployed image. No Bedrock calls are made: the first page of each app
+# renders without one.
+#
+#   python bot/bench_startup.py --runs 5
+#   python bot/bench_startup.py --root /tmp/baseline    # the same numbers for another checkout, e.g. a git worktree
+#   python bot/bench_startup.py --apps bot --top 10     # also list the slowest imports of the first run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {
+    "bot": "bot/app.py",
+    "main": "main/app.py",
+    "app2": "app2.py",
+}
+
+# Runs in the fresh process; prints one JSON line of timings
+CHILD = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+rendered = time.perf_counter()
+rss_render = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+time.sleep(float(sys.argv[2]))
+print(json.dumps({
+    "streamlit_ms": (imported - start) * 1000,
+    "first_run_ms": (rendered - imported) * 1000,
+    "rss_render_mb": rss_render / 1024,
+    "rss_settled_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "exception": [str(e.value) for e in app.exception],
+}))
+'''
+
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    # No background Bedrock calls, no metrics server, and sessions kept in memory
+    env.update({
+        'DESCRIPTION_CACHE_PREWARM': 'false',
+        'METRICS_ENABLED': 'false',
+        'SESSION_BACKEND': 'memory',
+        'PYTHONUNBUFFERED': '1',
+    })
+    return env
+
+
+def run_app(script: str, settle: float, importtime: bool = False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD, script, str(settle)]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=os.path.dirname(script), env=child_env(), capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"{script} failed to start:\n{result.stderr[-2000:]}")
+    timings = json.loads(lines[-1])
+    timings["process_ms"] = wall_ms - settle * 1000
+    return timings, result.stderr
+
+
+def slowest_imports(stderr: str, top: int):
+    # Top-level imports of the app's first run (after streamlit), by cumulative time
+    entries, seen_apptest = [], False
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, module = match.groups()
+        if module.startswith('streamlit.testing'):
+            seen_apptest = True
+            continue
+        if seen_apptest and len(indent) == 1:
+            entries.append((int(cumulative) / 1000, module))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app import time, time to first render and RSS after boot")
+    parser.add_argument('--root', default=ROOT, help="checkout to measure")
+    parser.add_argument('--apps', nargs='+', default=list(APPS), choices=list(APPS))
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes per app")
+    parser.add_argument('--settle', type=float, default=1.0, help="seconds to let background warm-ups finish before the second RSS reading")
+    parser.add_argument('--top', type=int, default=0, help="list this many of the slowest imports of each app's first run")
+    args = parser.parse_args()
+
+    print(f"{os.path.abspath(args.root)}, {args.runs} runs per app (median, min)\n")
+    print(f"{'app':<6}{'import streamlit':>20}{'first run':>20}{'first render':>20}{'RSS at render':>18}{'RSS settled':>16}")
+    for name in args.apps:
+        script = os.path.join(os.path.abspath(args.root), APPS[name])
+        if not os.path.exists(script):
+            print(f"{name:<6}  (no {APPS[name]})")
+            continue
+        run_app(script, 0)
+        runs = [run_app(script, args.settle)[0] for _ in range(args.runs)]
+        failed = [run["exception"] for run in runs if run["exception"]]
+        columns = []
+        for key in ("streamlit_ms", "first_run_ms", "process_ms"):
+            values = [run[key] for run in runs]
+            columns.append(f"{statistics.median(values):9.0f}ms {min(values):6.0f}ms")
+        rss = [f"{statistics.median(run[key] for run in runs):14.0f}MB" for key in ("rss_render_mb", "rss_settled_mb")]
+        print(f"{name:<6}{columns[0]:>20}{columns[1]:>20}{columns[2]:>20}{rss[0]:>18}{rss[1]:>16}"
+              f"{'  app raised: ' + failed[0][0][:80] if failed else ''}")
+        if args.top:
+            _, stderr = run_app(script, 0, importtime=True)
+            for cumulative_ms, module in slowest_imports(stderr, args.top):
+                print(f"{'':<8}{cumulative_ms:8.1f}ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Record/replay layer for Bedrock runtime calls. CassetteClient wraps a client: when recording,
+# invoke_model and invoke_model_with_response_stream calls go through to it and each response is
+# stored on disk under a hash of the request (operation, model and body); when replaying, responses
+# are read back from disk and a request that was never recorded raises CassetteMiss without calling
+# out, so prompt changes can be evaluated offline and reproducibly. 'once' replays what has been
+# recorded and records the rest. Each request is one file, <dir>/<hash>.json, holding the request
+# body next to the response, so recordings diff well and can be committed alongside the prompts.
+#
+#   BEDROCK_CASSETTE_MODE=once BEDROCK_CASSETTE_DIR=bot/cassettes/app streamlit run bot/app.py
+#
+# Recorded responses keep Bedrock's invocation latency header, or the measured call time when the
+# recorded client did not send one, so replays can still report model latency.
+
+# Configuration (use environment variables or configuration files in production)
+# '' (off), 'record', 'replay' or 'once'
+BEDROCK_CASSETTE_MODE = os.getenv('BEDROCK_CASSETTE_MODE', '')
+BEDROCK_CASSETTE_DIR = os.getenv('BEDROCK_CASSETTE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassettes'))
+# Wait for the recorded latency when replaying, for timing-dependent runs such as load tests
+BEDROCK_CASSETTE_REPLAY_LATENCY = os.getenv('BEDROCK_CASSETTE_REPLAY_LATENCY', 'false').lower() == 'true'
+
+MODES = ('record', 'replay', 'once')
+LATENCY_HEADER = 'x-amzn-bedrock-invocation-latency'
+# Response headers kept in recordings
+RECORDED_HEADERS = (LATENCY_HEADER, 'x-amzn-bedrock-input-token-count', 'x-amzn-bedrock-output-token-count')
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def request_key(operation: str, model_id: str, body) -> str:
+    """
+    Hash of a request, independent of the body's key order and whitespace.
+    """
+    request = json.loads(body) if isinstance(body, (str, bytes)) else body
+    canonical = json.dumps({"operation": operation, "modelId": model_id, "body": request}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def recorded_latency(response: Dict[str, Any]) -> Optional[float]:
+    """
+    Model latency in seconds from a response's invocation latency header, if it has one.
+    """
+    latency_ms = response.get('ResponseMetadata', {}).get('HTTPHeaders', {}).get(LATENCY_HEADER)
+    return float(latency_ms) / 1000 if latency_ms is not None else None
+
+
+class CassetteClient:
+    """
+    Wraps a Bedrock runtime client with recording and replay of its model calls. In 'replay' mode
+    the wrapped client is never called and may be None.
+    """
+
+    def __init__(self, client, directory: str = BEDROCK_CASSETTE_DIR, mode: str = 'once',
+                 replay_latency: bool = BEDROCK_CASSETTE_REPLAY_LATENCY):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        self._client = client
+        self.directory = directory
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._stats = {"replayed": 0, "recorded": 0, "misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def invoke_model(self, **kwargs):
+        key = request_key('invoke_model', kwargs.get('modelId', ''), kwargs.get('body', '{}'))
+        entry = self._replay(key)
+        if entry is not None:
+            return {"body": io.BytesIO(entry["response"]["body"].encode()), "contentType": entry["response"].get("contentType", 'application/json'),
+                    "ResponseMetadata": {"HTTPHeaders": entry["response"]["headers"]}}
+        start = time.perf_counter()
+        response = self._client.invoke_model(**kwargs)
+        payload = response['body'].read()
+        headers = self._headers(response, time.perf_counter() - start)
+        self._record(key, 'invoke_model', kwargs, {
+            "body": payload.decode(), "contentType": response.get('contentType', 'application/json'), "headers": headers,
+        })
+        return {**response, "body": io.BytesIO(payload), "ResponseMetadata": {**response.get('ResponseMetadata', {}), "HTTPHeaders": headers}}
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        key = request_key('invoke_model_with_response_stream', kwargs.get('modelId', ''), kwargs.get('body', '{}'))
+        entry = self._replay(key)
+        if entry is not None:
+            events = ({"chunk": {"bytes": chunk.encode()}} for chunk in entry["response"]["chunks"])
+            return {"body": events, "contentType": entry["response"].get("contentType", 'application/json'),
+                    "ResponseMetadata": {"HTTPHeaders": entry["response"]["headers"]}}
+        start = time.perf_counter()
+        response = self._client.invoke_model_with_response_stream(**kwargs)
+        return {**response, "body": self._recording_stream(key, kwargs, response, start)}
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _replay(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the recorded entry for the request, or None when it should be recorded.
+        """
+        if self.mode == 'record':
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            if self.mode == 'replay':
+                self._count("misses")
+                raise CassetteMiss(f"No recording for request {key} in {self.directory}")
+            return None
+        self._count("replayed")
+        if self.replay_latency:
+            time.sleep(float(entry["response"]["headers"].get(LATENCY_HEADER, 0)) / 1000)
+        return entry
+
+    def _headers(self, response: Dict[str, Any], seconds: float) -> Dict[str, str]:
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        recorded = {name: headers[name] for name in RECORDED_HEADERS if name in headers}
+        recorded.setdefault(LATENCY_HEADER, str(round(seconds * 1000)))
+        return recorded
+
+    def _recording_stream(self, key: str, kwargs: Dict[str, Any], response: Dict[str, Any], start: float):
+        # Stored once the stream has been read to the end; an abandoned stream is not recorded
+        chunks = []
+        for event in response['body']:
+            if 'chunk' in event:
+                chunks.append(event['chunk']['bytes'].decode())
+            yield event
+        self._record(key, 'invoke_model_with_response_stream', kwargs, {
+            "chunks": chunks, "contentType": response.get('contentType', 'application/json'),
+            "headers": self._headers(response, time.perf_counter() - start),
+        })
+
+    def _record(self, key: str, operation: str, kwargs: Dict[str, Any], response: Dict[str, Any]):
+        body = kwargs.get('body', '{}')
+        entry = {
+            "key": key,
+            "operation": operation,
+            "modelId": kwargs.get('modelId', ''),
+            "request": json.loads(body) if isinstance(body, (str, bytes)) else body,
+            "response": response,
+            "recorded_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        path = self._path(key)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(temporary, path)
+        self._count("recorded")
@@ -0,0 +1,130 @@
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommendation import SUPPORTED_CANCER_TYPES, STAGES, THERAPY_STATUSES, recommend_guardant_test, recommendation_rules
+
+# Bulk recommendations for patient lists (CSV or Parquet).
+#
+#   python bot/cohort.py patients.csv -o recommendations.parquet
+#
+# Each attribute column is encoded as categorical codes and the (cancer_type, stage, therapy_status)
+# code triple indexes a lookup table precomputed from recommend_guardant_test, so a whole table is
+# scored in one vectorized pass with exactly the answers of the scalar function. The table is rebuilt
+# when the recommendation rules file is reloaded.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE_CATEGORIES = {
+    "cancer_type": SUPPORTED_CANCER_TYPES,
+    "stage": STAGES,
+    "therapy_status": THERAPY_STATUSES,
+}
+
+# Stand-in for any value outside the known categories. The scalar rules treat every unrecognised
+# value of an attribute the same way, so one extra slot per axis covers them all.
+UNRECOGNIZED = "Unknown"
+
+
+def build_lookup():
+    """
+    Precomputes the recommendation and follow-up codes for every attribute combination.
+
+    Returns (recommendation_codes, future_codes, recommendations, futures). The code arrays have one
+    axis per attribute, each with one extra trailing slot for unrecognised values, so a categorical
+    code of -1 lands on it directly.
+    """
+    axes = [categories + [UNRECOGNIZED] for categories in ATTRIBUTE_CATEGORIES.values()]
+    shape = tuple(len(axis) for axis in axes)
+    recommendation_codes = np.empty(shape, dtype=np.int16)
+    future_codes = np.empty(shape, dtype=np.int16)
+    recommendations = []
+    futures = []
+    for index in np.ndindex(*shape):
+        recommendation, future_recommendation = recommend_guardant_test(*(axis[i] for axis, i in zip(axes, index)))
+        if recommendation not in recommendations:
+            recommendations.append(recommendation)
+        recommendation_codes[index] = recommendations.index(recommendation)
+        if future_recommendation is None:
+            future_codes[index] = -1
+        else:
+            if future_recommendation not in futures:
+                futures.append(future_recommendation)
+            future_codes[index] = futures.index(future_recommendation)
+    return recommendation_codes, future_codes, recommendations, futures
+
+
+_lookup = (None, None)  # (rules the tables were built from, build_lookup() result)
+
+
+def lookup_tables():
+    """
+    build_lookup() for the current recommendation rules.
+    """
+    global _lookup
+    rules = recommendation_rules.current()
+    if _lookup[0] is not rules:
+        _lookup = (rules, build_lookup())
+    return _lookup[1]
+
+
+def recommend_cohort(patients: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds 'recommendation' and 'future_recommendation' columns for every row of a
+    (cancer_type, stage, therapy_status) table. Rows without a follow-up get a missing value.
+    """
+    missing = [column for column in ATTRIBUTE_CATEGORIES if column not in patients.columns]
+    if missing:
+        raise ValueError(f"Missing attribute columns: {', '.join(missing)}")
+
+    # get_indexer gives -1 for values outside the categories (including missing values)
+    codes = tuple(
+        pd.Index(categories).get_indexer(patients[column])
+        for column, categories in ATTRIBUTE_CATEGORIES.items()
+    )
+    recommendation_table, future_table, recommendations, futures = lookup_tables()
+    recommendation_codes = recommendation_table[codes]
+    future_codes = future_table[codes]
+
+    result = patients.copy()
+    result["recommendation"] = pd.Categorical.from_codes(recommendation_codes, categories=recommendations)
+    result["future_recommendation"] = pd.Categorical.from_codes(future_codes, categories=futures)
+    return result
+
+
+def read_table(path: str) -> pd.DataFrame:
+    columns = list(ATTRIBUTE_CATEGORIES)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype={column: 'string' for column in columns})
+
+
+def write_table(table: pd.DataFrame, path: str):
+    if path.endswith('.parquet'):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a patient list (CSV or Parquet) with the Guardant test recommendation rules")
+    parser.add_argument('input', help="table with cancer_type, stage and therapy_status columns")
+    parser.add_argument('-o', '--output', help="output path (.csv or .parquet); defaults to <input>_recommendations.csv")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}_recommendations.csv"
+    start = time.perf_counter()
+    patients = read_table(args.input)
+    result = recommend_cohort(patients)
+    write_table(result, output)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Scored {len(result)} patients in {elapsed:.2f}s, written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import os
+import re
+from typing import Dict, Any, List
+
+# How much of the conversation is sent to the model on each turn.
+# 'full' resends the whole chat history (the original behaviour), 'incremental' sends only the
+# latest user turn plus a compact summary of the attributes collected so far.
+CONTEXT_MODE = os.getenv('CONTEXT_MODE', 'incremental')
+# Approximate input-token budget for the user content of an incremental request
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '300'))
+# Which part of an over-budget message to keep: 'head', 'tail' or 'middle' (keeps both ends)
+CONTEXT_TRUNCATION = os.getenv('CONTEXT_TRUNCATION', 'tail')
+
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = ' [...] '
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (about four characters per token for English text).
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def estimate_request_tokens(system_prompt: str, messages: List[Dict[str, Any]]) -> int:
+    """
+    Estimates the input tokens of a Bedrock messages request.
+    """
+    total = estimate_tokens(system_prompt)
+    for message in messages:
+        for block in message['content']:
+            total += estimate_tokens(block.get('text', ''))
+    return total
+
+
+def truncate_to_budget(text: str, token_budget: int, policy: str = CONTEXT_TRUNCATION) -> str:
+    """
+    Trims text to roughly token_budget tokens according to the truncation policy.
+    """
+    max_chars = max(token_budget, 0) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    keep = max(max_chars - len(TRUNCATION_MARKER), 0)
+    if policy == 'head':
+        return text[:keep] + TRUNCATION_MARKER.rstrip()
+    if policy == 'middle':
+        head = keep // 2
+        return text[:head] + TRUNCATION_MARKER + text[len(text) - (keep - head):]
+    return TRUNCATION_MARKER.lstrip() + text[len(text) - keep:]
+
+
+def summarize_attributes(attributes: Dict[str, Any]) -> str:
+    """
+    One-line summary of the attributes collected so far in the session.
+    """
+    known = ', '.join(f"{key}={value}" for key, value in attributes.items())
+    return f"(Context only, already collected from earlier messages: {known})"
+
+
+def build_full_messages(chat_history: list) -> List[Dict[str, Any]]:
+    """
+    Converts the whole chat history into Bedrock messages.
+    """
+    messages = []
+    for message in chat_history:
+        messages.append({
+            "role": message['role'],
+            "content": [{
+                "type": "text",
+                "text": message['text']
+            }]
+        })
+    return messages
+
+
+def build_incremental_messages(
+    chat_history: list,
+    attributes: Dict[str, Any],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    truncation: str = CONTEXT_TRUNCATION,
+) -> List[Dict[str, Any]]:
+    """
+    Builds a single user message with the attribute summary and the latest user turn, capped at token_budget.
+    """
+    latest = next((message['text'] for message in reversed(chat_history) if message['role'] == 'user'), '')
+    latest = HTML_TAG_RE.sub('', latest)
+    summary = summarize_attributes(attributes) if attributes else ''
+    remaining = token_budget - estimate_tokens(summary)
+    if remaining <= 0:
+        summary = ''
+        remaining = token_budget
+    content = []
+    if summary:
+        content.append({"type": "text", "text": summary})
+    content.append({"type": "text", "text": truncate_to_budget(latest, remaining, truncation) or '(empty message)'})
+    return [{"role": 'user', "content": content}]
+
+
+def build_messages(chat_history: list, attributes: Dict[str, Any] = None, mode: str = CONTEXT_MODE) -> List[Dict[str, Any]]:
+    """
+    Builds the messages for a model call according to the configured context mode.
+    """
+    if mode == 'full':
+        return build_full_messages(chat_history)
+    return build_incremental_messages(chat_history, attributes or {})
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from metrics import register_gauges
+
+logger = logging.getLogger(__name__)
+
+# Configuration (use environment variables or configuration files in production)
+DESCRIPTION_CACHE_ENABLED = os.getenv('DESCRIPTION_CACHE_ENABLED', 'true').lower() == 'true'
+DESCRIPTION_CACHE_TTL = float(os.getenv('DESCRIPTION_CACHE_TTL', str(24 * 60 * 60)))
+DESCRIPTION_CACHE_SIZE = int(os.getenv('DESCRIPTION_CACHE_SIZE', '64'))
+# Optional JSON file backing the cache so descriptions survive restarts (empty keeps it in memory only)
+DESCRIPTION_CACHE_PATH = os.getenv('DESCRIPTION_CACHE_PATH', '')
+DESCRIPTION_CACHE_PREWARM = os.getenv('DESCRIPTION_CACHE_PREWARM', 'true').lower() == 'true'
+
+CacheKey = Tuple[str, str, str]
+
+
+class DescriptionCache:
+    """
+    Thread-safe LRU cache of product descriptions keyed by (recommendation, prompt version, model id),
+    with a time-to-live per entry and an optional on-disk copy.
+    """
+
+    def __init__(self, max_entries: int = DESCRIPTION_CACHE_SIZE, ttl_seconds: float = DESCRIPTION_CACHE_TTL, path: str = ''):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    @staticmethod
+    def make_key(recommendation: str, prompt_version: str, model_id: str) -> CacheKey:
+        return (recommendation, prompt_version, model_id)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: CacheKey, text: str):
+        with self._lock:
+            self._entries[key] = (time.time(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path:
+                self._save()
+
+    def __contains__(self, key: CacheKey) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.time() - entry[0] <= self.ttl_seconds
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read description cache {self.path}: {e}")
+            return
+        # Expired entries are dropped, and of the rest only the newest max_entries kept, oldest first as in LRU order
+        now = time.time()
+        fresh = sorted((entry for entry in stored if now - entry['created'] <= self.ttl_seconds), key=lambda entry: entry['created'])
+        for entry in fresh[max(0, len(fresh) - self.max_entries):]:
+            self._entries[tuple(entry['key'])] = (entry['created'], entry['text'])
+        if len(self._entries) < len(stored):
+            logger.info(f"Loaded {len(self._entries)} of {len(stored)} stored descriptions from {self.path}, skipping expired and excess entries")
+
+    def _save(self):
+        stored = [{"key": list(key), "created": created, "text": text} for key, (created, text) in self._entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not write description cache {self.path}: {e}")
+
+
+# Process-wide cache shared by every Streamlit session and rerun
+description_cache = DescriptionCache(path=DESCRIPTION_CACHE_PATH)
+register_gauges('bot_description_cache', description_cache.stats)
+
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
+
+
+def prewarm(cache: DescriptionCache, keys: Iterable[CacheKey], generate: Callable[[str], Optional[str]]):
+    """
+    Generates and stores descriptions for every key that is not cached yet.
+    generate receives the recommendation and returns the text, or None if it failed.
+    """
+    for key in keys:
+        if key in cache:
+            continue
+        text = generate(key[0])
+        if text:
+            cache.set(key, text)
+    logger.info(f"Description cache pre-warm finished: {cache.stats()}")
+
+
+def start_prewarm(keys: Iterable[CacheKey], generate: Callable[[str], Optional[str]], cache: DescriptionCache = description_cache):
+    """
+    Starts the pre-warm in a background thread, once per process.
+    """
+    global _prewarm_started
+    with _prewarm_lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    threading.Thread(target=prewarm, args=(cache, list(keys), generate), name='description-prewarm', daemon=True).start()
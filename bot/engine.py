@@ -0,0 +1,309 @@
+import os
+import json
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future
+from contextlib import AsyncExitStack
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+from admission import BedrockBusy, admission_priority
+from bedrock import BEDROCK_MAX_POOL_CONNECTIONS, create_async_bedrock_client
+from metrics import increment, register_gauges
+from pipeline import (
+    DESCRIPTION_ERROR_TEXT,
+    DescriptionStream,
+    ModelCall,
+    Steps,
+    build_description_body,
+    cached_description_steps,
+    description_steps,
+    extraction_steps,
+    remember_description,
+    semantic_description,
+    turn_extraction_steps,
+    turn_steps,
+)
+from routing import DESCRIPTION_MODEL_ID
+
+logger = logging.getLogger(__name__)
+
+# asyncio serving engine for the chat pipeline. One event loop, running in a background thread,
+# carries every conversation's model calls, so a waiting conversation costs a coroutine instead of
+# a blocked thread. Streamlit session threads (or any other synchronous caller) hand work over with
+# run(), submit() and stream().
+#
+# Two limits give bounded concurrency and backpressure:
+#   ENGINE_MAX_MODEL_CALLS  Bedrock calls in flight at once; further calls wait on the loop.
+#   ENGINE_MAX_PENDING      submitted jobs (turns, descriptions) in the engine at once; callers
+#                           block for up to ENGINE_SUBMIT_TIMEOUT for a slot, then get EngineBusy.
+#
+# Model calls are admitted by the Bedrock client (admission.py) at their step's priority, so the
+# engine shares the Bedrock rate limits with the synchronous pipeline; a call waiting for admission
+# holds its model slot. Jobs run in a copy of the submitting thread's context, so an admission
+# ticket taken by the caller, and its metric tags, carry over to the loop.
+#
+# The coroutines run pipeline.py's step generators, so the turn logic is shared with the synchronous
+# path: model calls are awaited on the loop and blocking steps (cache lookups, spec retrieval) run in
+# the loop's thread pool. Failures come back as return values, except BedrockBusy, which propagates
+# so the caller can retry once the queue drains.
+
+# Configuration (use environment variables or configuration files in production)
+ENGINE_ENABLED = os.getenv('ENGINE_ENABLED', 'true').lower() == 'true'
+ENGINE_MAX_MODEL_CALLS = int(os.getenv('ENGINE_MAX_MODEL_CALLS', str(BEDROCK_MAX_POOL_CONNECTIONS)))
+ENGINE_MAX_PENDING = int(os.getenv('ENGINE_MAX_PENDING', '1000'))
+ENGINE_SUBMIT_TIMEOUT = float(os.getenv('ENGINE_SUBMIT_TIMEOUT', '5'))
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class EngineBusy(Exception):
+    """
+    Raised when the engine has ENGINE_MAX_PENDING jobs and no slot freed up in time.
+    """
+
+
+class Engine:
+    """
+    Runs the extraction, recommendation and description pipeline on a dedicated asyncio loop.
+    client is an aiobotocore-style Bedrock runtime client; by default one is created on first use.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        max_model_calls: int = ENGINE_MAX_MODEL_CALLS,
+        max_pending: int = ENGINE_MAX_PENDING,
+        submit_timeout: float = ENGINE_SUBMIT_TIMEOUT,
+    ):
+        self.max_model_calls = max_model_calls
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+        self._client = client
+        self._stack = AsyncExitStack()
+        self._admission = threading.BoundedSemaphore(max_pending)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "pending": 0,
+            "peak_pending": 0,
+            "model_calls": 0,
+            "peak_model_calls": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+        }
+        self._loop = asyncio.new_event_loop()
+        self._model_slots = asyncio.Semaphore(max_model_calls)
+        self._client_lock = asyncio.Lock()
+        self._thread = threading.Thread(target=self._run_loop, name='engine-loop', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _count(self, name: str, amount: int = 1, peak: str = None):
+        with self._stats_lock:
+            self._stats[name] += amount
+            if peak:
+                self._stats[peak] = max(self._stats[peak], self._stats[name])
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    # Entry points for synchronous callers
+
+    def submit(self, coroutine_function: Callable, *args, **kwargs) -> Future:
+        """
+        Schedules coroutine_function(*args, **kwargs) on the engine loop and returns its future.
+        Blocks while the engine is full and raises EngineBusy if no slot frees up in time.
+        """
+        if not self._admission.acquire(timeout=self.submit_timeout):
+            self._count("rejected")
+            increment('bot_engine_rejected_total')
+            raise EngineBusy(f"Engine has {self.max_pending} pending jobs")
+        self._count("pending", peak="peak_pending")
+        future = asyncio.run_coroutine_threadsafe(
+            self._in_context(contextvars.copy_context(), coroutine_function(*args, **kwargs)), self._loop
+        )
+        future.add_done_callback(self._finished)
+        return future
+
+    @staticmethod
+    async def _in_context(context: contextvars.Context, coroutine):
+        # Tasks start from the loop thread's context; take on the caller's variables instead
+        for variable, value in context.items():
+            variable.set(value)
+        return await coroutine
+
+    def _finished(self, future: Future):
+        self._count("pending", -1)
+        self._count("failed" if future.cancelled() or future.exception() else "completed")
+        self._admission.release()
+
+    def run(self, coroutine_function: Callable, *args, timeout: float = None, **kwargs):
+        """
+        Runs coroutine_function(*args, **kwargs) on the engine loop and waits for its result.
+        """
+        return self.submit(coroutine_function, *args, **kwargs).result(timeout)
+
+    def stream(self, generator_function: Callable, *args, **kwargs) -> Iterator[Any]:
+        """
+        Iterates an async generator running on the engine loop, e.g. for st.write_stream.
+        """
+        items = queue.Queue()
+        finished = object()
+
+        async def pump():
+            async for item in generator_function(*args, **kwargs):
+                items.put(item)
+
+        future = self.submit(pump)
+        future.add_done_callback(lambda _: items.put(finished))
+        while True:
+            item = items.get()
+            if item is finished:
+                break
+            yield item
+        future.result()
+
+    def close(self):
+        """
+        Closes the Bedrock client and stops the loop.
+        """
+        asyncio.run_coroutine_threadsafe(self._stack.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    # Coroutines, run on the engine loop
+
+    async def _get_client(self):
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = await create_async_bedrock_client(self._stack)
+        return self._client
+
+    async def _invoke(self, call: ModelCall) -> Dict[str, Any]:
+        async with self._model_slots:
+            self._count("model_calls", peak="peak_model_calls")
+            try:
+                client = await self._get_client()
+                with admission_priority(call.priority):
+                    response = await client.invoke_model(
+                        modelId=call.model_id,
+                        accept='application/json',
+                        contentType='application/json',
+                        body=call.body
+                    )
+                return json.loads(await response['body'].read())
+            finally:
+                self._count("model_calls", -1)
+
+    async def _blocking(self, function: Callable, *args):
+        """
+        Runs a blocking function (cache lookups, spec retrieval) in the loop's default thread pool.
+        """
+        return await self._loop.run_in_executor(None, contextvars.copy_context().run, partial(function, *args))
+
+    async def _run(self, steps: Steps):
+        """
+        Carries out a pipeline step generator's calls on the engine loop and returns its result.
+        """
+        reply, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(reply)
+            except StopIteration as stop:
+                return stop.value
+            reply, error = None, None
+            try:
+                reply = await (self._invoke(step) if isinstance(step, ModelCall) else self._blocking(step.function, *step.args))
+            except Exception as e:
+                error = e
+
+    async def extract_attributes(self, chat_history: list, attributes: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Coroutine version of pipeline.extract_attributes_with_claude.
+        """
+        return await self._run(extraction_steps(chat_history, attributes))
+
+    async def extract_turn_attributes(self, user_input: str, chat_history: list, attributes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Coroutine version of pipeline.extract_turn_attributes.
+        """
+        return await self._run(turn_extraction_steps(user_input, chat_history, attributes))
+
+    async def describe(self, recommendation: str, chat_history, attributes: Dict[str, Any] = None, priority: str = 'description') -> str:
+        """
+        Coroutine version of pipeline.get_product_description.
+        """
+        return await self._run(description_steps(recommendation, chat_history, attributes, priority))
+
+    async def stream_description(self, recommendation: str, chat_history, attributes: Dict[str, Any] = None) -> AsyncIterator[str]:
+        """
+        Async generator version of pipeline.stream_product_description.
+        """
+        text_output = await self._blocking(semantic_description, recommendation, chat_history, attributes)
+        if text_output is not None:
+            yield text_output
+            return
+        body = await self._blocking(build_description_body, recommendation, chat_history, attributes)
+
+        stream = DescriptionStream()
+        try:
+            async with self._model_slots:
+                self._count("model_calls", peak="peak_model_calls")
+                try:
+                    client = await self._get_client()
+                    with admission_priority('description'):
+                        response = await client.invoke_model_with_response_stream(
+                            modelId=DESCRIPTION_MODEL_ID,
+                            accept='application/json',
+                            contentType='application/json',
+                            body=body
+                        )
+                    async for event in response['body']:
+                        text = stream.text(event)
+                        if text is not None:
+                            yield text
+                    text_output = stream.finished()
+                finally:
+                    self._count("model_calls", -1)
+        except BedrockBusy:
+            raise
+        except Exception as e:
+            stream.failed(e)
+            yield DESCRIPTION_ERROR_TEXT
+            return
+        await self._blocking(remember_description, recommendation, chat_history, attributes, text_output)
+
+    async def cached_description(self, recommendation: str, chat_history: list = None, attributes: Dict[str, Any] = None) -> str:
+        """
+        Coroutine version of pipeline.cached_product_description.
+        """
+        return await self._run(cached_description_steps(recommendation, chat_history, attributes))
+
+    async def process_turn(self, user_input: str, chat_history: list, attributes: Dict[str, Any], with_description: bool = True):
+        """
+        Coroutine version of pipeline.process_turn.
+        """
+        return await self._run(turn_steps(user_input, chat_history, attributes, with_description))
+
+
+def get_engine() -> Engine:
+    """
+    Returns the process-wide engine, starting it on first use.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = Engine()
+                register_gauges('bot_engine', _engine.stats)
+    return _engine
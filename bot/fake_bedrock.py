@@ -0,0 +1,251 @@
+import io
+import json
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from botocore.exceptions import ClientError
+
+from bedrock import AsyncBody
+from fast_extract import extract_attributes_locally
+
+# In-process stand-in for the bedrock-runtime client, for load tests and offline runs.
+# Install it with bedrock.set_bedrock_client(FakeBedrockClient(...)).
+
+CANNED_DESCRIPTION = (
+    "We offer two options for comprehensive genomic profiling from a simple blood draw.\n\n"
+    "| | Guardant360 LDT | Guardant360 CDx |\n|---|---|---|\n"
+    "| FDA status | Not FDA approved | FDA approved |\n"
+    "| Genes evaluated | 739 | 74 |\n\n"
+    "Our results are typically returned within 7 days of sample receipt."
+)
+
+
+class LatencyModel:
+    """
+    Log-normal latency with a given median and spread, which matches the long right tail of model calls.
+    """
+
+    def __init__(self, median_seconds: float, sigma: float = 0.4, seed: Optional[int] = None):
+        self.median_seconds = median_seconds
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.median_seconds <= 0:
+            return 0.0
+        with self._lock:
+            return self.median_seconds * self._random.lognormvariate(0.0, self.sigma)
+
+
+class FakeBedrockClient:
+    """
+    Answers invoke_model and invoke_model_with_response_stream like Bedrock's Anthropic models.
+
+    Extraction requests get JSON built from the local keyword extractor, so conversations progress
+    realistically; every other request gets CANNED_DESCRIPTION. Requests fail with a
+    ThrottlingException at throttle_rate, or whenever more than max_concurrency are in flight.
+
+    model_latency and invalid_rate, keyed by modelId, stand in for a different model on a route:
+    its extraction latency, and the fraction of its extraction answers with a value outside the
+    schema (which validate_attributes rejects).
+    """
+
+    def __init__(
+        self,
+        extraction_latency: LatencyModel = None,
+        description_latency: LatencyModel = None,
+        seconds_per_token: float = 0.01,
+        throttle_rate: float = 0.0,
+        max_concurrency: int = 0,
+        description_text: str = CANNED_DESCRIPTION,
+        model_latency: Dict[str, LatencyModel] = None,
+        invalid_rate: Dict[str, float] = None,
+        seed: Optional[int] = None,
+    ):
+        self.extraction_latency = extraction_latency or LatencyModel(0.8, seed=seed)
+        self.description_latency = description_latency or LatencyModel(0.6, seed=seed)
+        self.seconds_per_token = seconds_per_token
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.description_text = description_text
+        self.model_latency = model_latency or {}
+        self.invalid_rate = invalid_rate or {}
+        self.calls = 0
+        self.throttled = 0
+        self.peak_in_flight = 0
+        self._in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId: str = '', body: str = '{}', **kwargs) -> Dict[str, Any]:
+        request = json.loads(body)
+        self._admit('InvokeModel')
+        try:
+            text_output, latency = self._answer(request, modelId)
+            time.sleep(latency + self.seconds_per_token * len(text_output.split()))
+        finally:
+            self._release()
+        return {"body": io.BytesIO(self._response_payload(request, text_output)), "contentType": 'application/json'}
+
+    def invoke_model_with_response_stream(self, modelId: str = '', body: str = '{}', **kwargs) -> Dict[str, Any]:
+        request = json.loads(body)
+        self._admit('InvokeModelWithResponseStream')
+        text_output, latency = self._answer(request, modelId)
+        return {"body": self._stream(request, text_output, latency), "contentType": 'application/json'}
+
+    def _stream(self, request: Dict[str, Any], text_output: str, latency: float):
+        try:
+            for delay, event in self._stream_events(request, text_output, latency):
+                time.sleep(delay)
+                yield event
+        finally:
+            self._release()
+
+    def _response_payload(self, request: Dict[str, Any], text_output: str) -> bytes:
+        if request.get('tools'):
+            content = [{"type": "tool_use", "id": "toolu_fake", "name": request['tools'][0]['name'], "input": json.loads(text_output)}]
+        else:
+            content = [{"type": "text", "text": text_output}]
+        response_body = {
+            "content": content,
+            "stop_reason": "tool_use" if request.get('tools') else "end_turn",
+            "usage": self._usage(request, text_output),
+        }
+        return json.dumps(response_body).encode()
+
+    def _stream_events(self, request: Dict[str, Any], text_output: str, latency: float):
+        """
+        Yields (seconds to wait, event) pairs for a streamed response.
+        """
+        yield latency, self._event({"type": "message_start", "message": {"usage": {"input_tokens": self._usage(request, '')["input_tokens"]}}})
+        for word in text_output.split(' '):
+            yield self.seconds_per_token, self._event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word + ' '}})
+        yield 0, self._event({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": self._usage(request, text_output)["output_tokens"]}})
+        yield 0, self._event({"type": "message_stop"})
+
+    @staticmethod
+    def _event(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {"chunk": {"bytes": json.dumps(payload).encode()}}
+
+    def _admit(self, operation: str):
+        with self._lock:
+            self.calls += 1
+            throttled = self._random.random() < self.throttle_rate or (
+                self.max_concurrency and self._in_flight >= self.max_concurrency
+            )
+            if throttled:
+                self.throttled += 1
+            else:
+                self._in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self._in_flight)
+        if throttled:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."}}, operation)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _answer(self, request: Dict[str, Any], model_id: str = ''):
+        if 'extracts' in request.get('system', ''):
+            latest = request['messages'][-1]['content'][-1]['text']
+            attributes, _ = extract_attributes_locally(latest)
+            with self._lock:
+                invalid = self._random.random() < self.invalid_rate.get(model_id, 0.0)
+            if invalid:
+                attributes["stage"] = "Stage IV"
+            return json.dumps(attributes), self.model_latency.get(model_id, self.extraction_latency).sample()
+        return self.description_text, self.description_latency.sample()
+
+    @staticmethod
+    def _usage(request: Dict[str, Any], text_output: str) -> Dict[str, int]:
+        input_chars = len(request.get('system', '')) + sum(
+            len(block.get('text', '')) for message in request.get('messages', []) for block in message['content']
+        )
+        return {"input_tokens": input_chars // 4, "output_tokens": len(text_output) // 4}
+
+
+class AsyncFakeBedrockClient(FakeBedrockClient):
+    """
+    FakeBedrockClient with aiobotocore's coroutine call shapes, for the async engine.
+    Waiting happens on the event loop, so in-flight requests cost no threads.
+    """
+
+    async def invoke_model(self, modelId: str = '', body: str = '{}', **kwargs) -> Dict[str, Any]:
+        request = json.loads(body)
+        self._admit('InvokeModel')
+        try:
+            text_output, latency = self._answer(request, modelId)
+            await asyncio.sleep(latency + self.seconds_per_token * len(text_output.split()))
+        finally:
+            self._release()
+        return {"body": AsyncBody(self._response_payload(request, text_output)), "contentType": 'application/json'}
+
+    async def invoke_model_with_response_stream(self, modelId: str = '', body: str = '{}', **kwargs) -> Dict[str, Any]:
+        request = json.loads(body)
+        self._admit('InvokeModelWithResponseStream')
+        text_output, latency = self._answer(request, modelId)
+        return {"body": self._async_stream(request, text_output, latency), "contentType": 'application/json'}
+
+    async def _async_stream(self, request: Dict[str, Any], text_output: str, latency: float):
+        try:
+            for delay, event in self._stream_events(request, text_output, latency):
+                await asyncio.sleep(delay)
+                yield event
+        finally:
+            self._release()
+
+
+AGENT_ANSWERS = {
+    "ldt": ("Guardant360 LDT evaluates 739 genes from a simple blood draw and is not FDA approved.", "Guardant360+Specification+Sheet.pdf"),
+    "cdx": ("Guardant360 CDx evaluates 74 genes and is FDA approved.", "Guardant360+CDx+Specification+Sheet.pdf"),
+    "tissuenext": ("Guardant360 TissueNext profiles tumor tissue and complements our blood tests.", "Guardant360+TissueNext+Specification+Sheet.pdf"),
+    "reveal": ("Guardant Reveal detects residual disease and recurrence from blood, without a tissue sample.", "Guardant+Reveal+Specification+Sheet.pdf"),
+    "response": ("Guardant360 Response measures the change in ctDNA 4 to 10 weeks after starting therapy.", "Guardant360+Response+Specification+Sheet.pdf"),
+}
+
+
+class FakeAgentClient:
+    """
+    Answers invoke_agent like a Bedrock knowledge-base agent: a completion event stream of text
+    chunks with citations. Like the real service, it rejects a second invocation on a session that
+    is still answering with a ConflictException.
+    """
+
+    def __init__(self, latency: LatencyModel = None, seconds_per_token: float = 0.01, spec_bucket: str = 's3://spec-sheets'):
+        self.latency = latency or LatencyModel(2.0)
+        self.seconds_per_token = seconds_per_token
+        self.spec_bucket = spec_bucket
+        self.calls = 0
+        self.sessions = set()
+        self._busy_sessions = set()
+        self._lock = threading.Lock()
+
+    def invoke_agent(self, agentId: str = '', agentAliasId: str = '', sessionId: str = '', inputText: str = '', **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if sessionId in self._busy_sessions:
+                raise ClientError({"Error": {"Code": "ConflictException", "Message": "The session is already processing a request."}}, 'InvokeAgent')
+            self.calls += 1
+            self.sessions.add(sessionId)
+            self._busy_sessions.add(sessionId)
+        answers = [answer for keyword, answer in AGENT_ANSWERS.items() if keyword in inputText.lower()]
+        if not answers:
+            answers = [("We offer blood and tissue based tests for comprehensive genomic profiling, residual disease detection and therapy response monitoring.", None)]
+        return {"completion": self._completion(sessionId, answers), "sessionId": sessionId, "contentType": 'application/json'}
+
+    def _completion(self, session_id: str, answers):
+        try:
+            time.sleep(self.latency.sample())
+            for text, source in answers:
+                time.sleep(self.seconds_per_token * len(text.split()))
+                chunk = {"bytes": (text + ' ').encode()}
+                if source:
+                    uri = f"{self.spec_bucket}/{source}"
+                    chunk["attribution"] = {"citations": [{"retrievedReferences": [{"location": {"s3Location": {"uri": uri}}}]}]}
+                yield {"chunk": chunk}
+        finally:
+            with self._lock:
+                self._busy_sessions.discard(session_id)
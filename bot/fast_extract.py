@@ -0,0 +1,179 @@
+import re
+from typing import Dict, Any, List, Tuple
+
+# Deterministic keyword extractor used ahead of the Bedrock call.
+# Most user turns are replies to our own option prompts ("Lung", "Stage 4",
+# "Not Responding to Therapy"), which can be resolved without a model call.
+
+UNKNOWN = "Unknown"
+
+CANCER_TYPE_SYNONYMS = {
+    "Lung": [
+        "lung", "nsclc", "sclc", "non small cell lung", "non-small cell lung",
+        "small cell lung", "lung adenocarcinoma", "luad", "lusc",
+    ],
+    "Breast": ["breast", "bc", "mbc", "hr+", "her2+", "her2 positive", "tnbc", "triple negative"],
+    "Colorectal": ["colorectal", "crc", "mcrc", "colon", "rectal", "bowel"],
+    "Other": ["other", "other cancer", "other cancer type", "other type"],
+}
+
+THERAPY_STATUS_SYNONYMS = {
+    "newly_diagnosed": [
+        "newly diagnosed", "newly_diagnosed", "new diagnosis", "just diagnosed",
+        "recently diagnosed", "treatment naive", "treatment-naive", "untreated",
+    ],
+    "had_surgery": [
+        "had surgery", "had_surgery", "surgery", "resected", "resection", "post-op", "post op",
+    ],
+    "had_therapy": [
+        "had therapy", "had_therapy", "had chemo", "chemo", "chemotherapy",
+        "adjuvant", "neoadjuvant", "radiation", "radiotherapy",
+    ],
+    "had_both": [
+        "had both surgery and therapy", "had both", "had_both", "both surgery and therapy",
+        "surgery and therapy", "surgery and chemo", "both",
+    ],
+    "therapy_not_working": [
+        "not responding to therapy", "not responding", "therapy not working",
+        "therapy_not_working", "treatment not working", "progressing", "progression",
+        "progressed", "resistant", "refractory",
+    ],
+    "in_therapy": [
+        "in therapy", "in_therapy", "on therapy", "on treatment", "in treatment",
+        "currently on therapy", "currently on treatment", "undergoing therapy", "undergoing treatment",
+    ],
+}
+
+# Therapy statuses are only meaningful for one stage (see the extraction prompt).
+STAGE_THERAPY_STATUSES = {
+    "Stage_2_3": {"newly_diagnosed", "had_surgery", "had_therapy", "had_both"},
+    "Stage_4": {"newly_diagnosed", "therapy_not_working", "in_therapy"},
+}
+
+STAGE_PATTERNS = [
+    (re.compile(r"\bstage[\s_-]*(?:ii|2)\s*(?:/|-|or|to|_)\s*(?:iii|3)[abc]?\b"), "Stage_2_3"),
+    (re.compile(r"\bstage[\s_-]*(?:iv|4)[abc]?\b"), "Stage_4"),
+    (re.compile(r"\bstage[\s_-]*(?:iii|ii|3|2)[abc]?\b"), "Stage_2_3"),
+    (re.compile(r"\b(?:metastatic|mets|advanced metastatic)\b"), "Stage_4"),
+]
+
+# Bare replies to the stage question, e.g. "4" or "IV".
+BARE_STAGE_REPLIES = {"iv": "Stage_4", "4": "Stage_4", "ii": "Stage_2_3", "iii": "Stage_2_3", "2": "Stage_2_3", "3": "Stage_2_3"}
+
+STOPWORDS = {
+    "a", "an", "and", "the", "is", "has", "have", "had", "with", "of", "my", "our",
+    "patient", "patients", "pt", "cancer", "tumor", "tumour", "carcinoma", "type",
+    "currently", "was", "who", "it", "its", "in", "on", "she", "he", "they", "her", "his",
+    "their", "diagnosed", "diagnosis", "please", "yes", "ok", "okay", "thanks", "so", "also",
+}
+
+NEGATIONS = {"not", "no", "never", "without", "unsure", "unknown", "don't", "dont", "isn't", "isnt", "maybe", "or"}
+
+TOKEN_RE = re.compile(r"[a-z0-9+'_-]+")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().replace(",", " , ").split())
+
+
+def _match_phrases(text: str, synonyms: Dict[str, List[str]], consumed: List[Tuple[int, int]]) -> List[str]:
+    """
+    Finds every synonym in the text, longest phrases first, and records the matched spans.
+    """
+    matches = []
+    phrases = sorted(
+        ((phrase, value) for value, values in synonyms.items() for phrase in values),
+        key=lambda item: len(item[0]),
+        reverse=True,
+    )
+    for phrase, value in phrases:
+        pattern = r"(?<![a-z0-9+_-])" + re.escape(phrase) + r"(?![a-z0-9+_-])"
+        for match in re.finditer(pattern, text):
+            span = match.span()
+            if any(start < span[1] and span[0] < end for start, end in consumed):
+                continue
+            consumed.append(span)
+            matches.append(value)
+    return matches
+
+
+def _resolve(values: List[str]) -> Tuple[str, bool]:
+    """
+    Collapses the matched values for one attribute. Returns the value and whether it was ambiguous.
+    """
+    unique = set(values)
+    if not unique:
+        return UNKNOWN, False
+    if len(unique) == 1:
+        return unique.pop(), False
+    return UNKNOWN, True
+
+
+def extract_attributes_locally(text: str, known_attributes: Dict[str, Any] = None) -> Tuple[Dict[str, str], float]:
+    """
+    Extracts cancer_type, stage and therapy_status from a single user message without calling the model.
+
+    Returns the attributes (using "Unknown" for anything not mentioned) and a confidence score between 0 and 1.
+    The confidence is the share of meaningful words that were explained by a known keyword; it drops to 0
+    when the message is ambiguous, negated, or mentions nothing we recognise.
+    """
+    known_attributes = known_attributes or {}
+    attributes = {"cancer_type": UNKNOWN, "stage": UNKNOWN, "therapy_status": UNKNOWN}
+    normalized = _normalize(text)
+    if not normalized:
+        return attributes, 0.0
+
+    consumed = []
+
+    # Stage
+    stage_values = []
+    for pattern, value in STAGE_PATTERNS:
+        for match in pattern.finditer(normalized):
+            span = match.span()
+            if any(start < span[1] and span[0] < end for start, end in consumed):
+                continue
+            consumed.append(span)
+            stage_values.append(value)
+    bare = normalized.strip(" .!,")
+    if not stage_values and bare in BARE_STAGE_REPLIES:
+        stage_values.append(BARE_STAGE_REPLIES[bare])
+        consumed.append((0, len(normalized)))
+    attributes["stage"], stage_ambiguous = _resolve(stage_values)
+
+    # Therapy status is matched before cancer type so "had both surgery and therapy"
+    # is not split up, and "Other" is only accepted when nothing else claims the word.
+    status_values = _match_phrases(normalized, THERAPY_STATUS_SYNONYMS, consumed)
+    if "had_surgery" in status_values and "had_therapy" in status_values:
+        status_values = [value for value in status_values if value not in ("had_surgery", "had_therapy")] + ["had_both"]
+    attributes["therapy_status"], status_ambiguous = _resolve(status_values)
+
+    cancer_values = _match_phrases(normalized, CANCER_TYPE_SYNONYMS, consumed)
+    attributes["cancer_type"], cancer_ambiguous = _resolve(cancer_values)
+
+    if stage_ambiguous or status_ambiguous or cancer_ambiguous:
+        return attributes, 0.0
+    if all(value == UNKNOWN for value in attributes.values()):
+        return attributes, 0.0
+
+    # A therapy status that does not exist for the patient's stage needs the model to interpret it.
+    stage = attributes["stage"] if attributes["stage"] != UNKNOWN else known_attributes.get("stage", UNKNOWN)
+    status = attributes["therapy_status"]
+    if status != UNKNOWN and stage in STAGE_THERAPY_STATUSES and status not in STAGE_THERAPY_STATUSES[stage]:
+        return attributes, 0.0
+
+    # Score how much of the message the keywords explain.
+    matched_tokens = 0
+    unmatched_tokens = 0
+    for match in TOKEN_RE.finditer(normalized):
+        token = match.group()
+        start, end = match.span()
+        if any(span_start <= start and end <= span_end for span_start, span_end in consumed):
+            matched_tokens += 1
+        elif token in NEGATIONS:
+            return attributes, 0.0
+        elif token not in STOPWORDS:
+            unmatched_tokens += 1
+
+    total = matched_tokens + unmatched_tokens
+    confidence = matched_tokens / total if total else 0.0
+    return attributes, round(confidence, 3)
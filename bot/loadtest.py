@@ -0,0 +1,168 @@
+import argparse
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from admission import (
+    ADMISSION_MAX_WAIT,
+    ADMISSION_QUEUE_SIZE,
+    BEDROCK_INPUT_TOKENS_PER_MINUTE,
+    BEDROCK_REQUESTS_PER_SECOND,
+    AdmissionController,
+    AdmittedClient,
+    get_admission_controller,
+    set_admission_controller,
+)
+from bedrock import set_bedrock_client
+from fake_bedrock import FakeBedrockClient, LatencyModel
+from pipeline import process_turn
+from retry import RETRY_ENABLED, ResilientClient, retry_stats
+from routing import extraction_route, route_stats
+
+# Load generator for the chat pipeline. Simulates concurrent sessions walking through the
+# bot/app.py flow against the local Bedrock stand-in (or live Bedrock with --live) and reports
+# per-turn latency percentiles, throughput and error rates.
+#
+#   python bot/loadtest.py --sessions 50 --conversations 5 --throttle-rate 0.02
+#   python bot/loadtest.py --small-model-latency 0.3 --small-model-invalid-rate 0.05    # extraction routed to a small model
+#   python bot/loadtest.py --sessions 100 --rps 20 --queue-size 50    # admission control under a burst
+#
+# Set DESCRIPTION_CACHE_ENABLED=false to measure uncached description calls.
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+WELCOME_MESSAGE = "Hi! Welcome to GH Test Selection Assistant! Please start with your patient's cancer type and stage."
+
+# Mix of replies to our option prompts (local fast path) and free text that needs the model
+SCRIPTS = [
+    ["Lung, stage 4", "Newly Diagnosed"],
+    ["Colorectal", "Stage III", "Had Surgery"],
+    ["My patient was recently found to have breast cancer, imaging suggests stage 4", "In Therapy"],
+    ["NSCLC stage IV", "Not Responding to Therapy"],
+    ["Breast cancer, stage 2", "Had Both Surgery and Therapy"],
+    ["We are seeing a colon cancer patient who just finished a resection, stage 3", "Had Surgery"],
+    ["Other", "Stage 4", "Newly Diagnosed"],
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LoadResults:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.busy = 0
+        self.conversations = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool, busy: bool = False):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.errors += error
+            self.busy += busy
+
+
+def run_session(session_id: int, conversations: int, think_time: float, results: LoadResults, seed: int):
+    rng = random.Random(seed + session_id)
+    for _ in range(conversations):
+        chat_history = [{"role": 'assistant', "text": WELCOME_MESSAGE}]
+        attributes = {"cancer_type": "Unknown", "stage": "Unknown", "therapy_status": "Unknown"}
+        for user_input in rng.choice(SCRIPTS):
+            start = time.perf_counter()
+            try:
+                turn, attributes = process_turn(user_input, chat_history, attributes)
+                error, busy = "error" in turn, turn.get("error") == "busy"
+            except Exception as e:
+                logger.error(f"Session {session_id} turn failed: {e}")
+                error, busy = True, False
+            results.record(time.perf_counter() - start, error, busy)
+            if think_time:
+                time.sleep(rng.uniform(0, 2 * think_time))
+        with results._lock:
+            results.conversations += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chat pipeline against a local Bedrock stand-in")
+    parser.add_argument('--sessions', type=int, default=20, help="concurrent simulated sessions")
+    parser.add_argument('--conversations', type=int, default=5, help="conversations per session")
+    parser.add_argument('--think-time', type=float, default=0.0, help="mean seconds a user waits between turns")
+    parser.add_argument('--extraction-latency', type=float, default=0.8, help="median fake extraction latency (s)")
+    parser.add_argument('--description-latency', type=float, default=0.6, help="median fake time to first token of a description (s)")
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help="log-normal spread of the fake latencies")
+    parser.add_argument('--small-model-latency', type=float, default=0.0, help="median fake latency of the extraction model when it differs from the fallback (0 for --extraction-latency)")
+    parser.add_argument('--small-model-invalid-rate', type=float, default=0.0, help="fraction of the extraction model's answers that fail validation")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of fake requests that fail with ThrottlingException")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="fake requests in flight before throttling (0 for unlimited)")
+    parser.add_argument('--rps', type=float, default=BEDROCK_REQUESTS_PER_SECOND, help="admission limit on Bedrock requests per second (0 for none)")
+    parser.add_argument('--tpm', type=float, default=BEDROCK_INPUT_TOKENS_PER_MINUTE, help="admission limit on estimated input tokens per minute (0 for none)")
+    parser.add_argument('--queue-size', type=int, default=ADMISSION_QUEUE_SIZE, help="calls that may wait for admission before turns are rejected as busy")
+    parser.add_argument('--max-wait', type=float, default=ADMISSION_MAX_WAIT, help="seconds a call waits for admission before it is rejected as busy")
+    parser.add_argument('--no-admission', action='store_true', help="send every call straight to Bedrock")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--live', action='store_true', help="call the real Bedrock endpoint instead of the stand-in")
+    args = parser.parse_args()
+
+    fake_client = None
+    if not args.live:
+        fake_client = FakeBedrockClient(
+            extraction_latency=LatencyModel(args.extraction_latency, args.latency_sigma, args.seed),
+            description_latency=LatencyModel(args.description_latency, args.latency_sigma, args.seed + 1),
+            throttle_rate=args.throttle_rate,
+            max_concurrency=args.max_concurrency,
+            model_latency={extraction_route.model_id: LatencyModel(args.small_model_latency, args.latency_sigma, args.seed + 2)}
+            if args.small_model_latency and extraction_route.fallback_model_id else None,
+            invalid_rate={extraction_route.model_id: args.small_model_invalid_rate} if extraction_route.fallback_model_id else None,
+            seed=args.seed,
+        )
+        # Same admission and retry/hedging policy the real client gets (configured through RETRY_* and HEDGE_* variables)
+        client = AdmittedClient(fake_client)
+        set_bedrock_client(ResilientClient(client) if RETRY_ENABLED else client)
+
+    set_admission_controller(None if args.no_admission else AdmissionController(
+        requests_per_second=args.rps, input_tokens_per_minute=args.tpm, queue_size=args.queue_size, max_wait=args.max_wait,
+    ))
+
+    results = LoadResults()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        for session_id in range(args.sessions):
+            executor.submit(run_session, session_id, args.conversations, args.think_time, results, args.seed)
+    elapsed = time.perf_counter() - start
+
+    turns = len(results.latencies)
+    print(f"sessions:       {args.sessions}")
+    print(f"conversations:  {results.conversations}")
+    print(f"turns:          {turns} in {elapsed:.1f}s ({turns / elapsed:.1f} turns/s)")
+    print(f"turn latency:   p50={percentile(results.latencies, 50):.3f}s p95={percentile(results.latencies, 95):.3f}s p99={percentile(results.latencies, 99):.3f}s")
+    print(f"errors:         {results.errors} ({results.errors / max(turns, 1):.1%} of turns, {results.busy} busy)")
+    if fake_client:
+        print(f"model calls:    {fake_client.calls} ({fake_client.throttled} throttled)")
+    if RETRY_ENABLED:
+        stats = retry_stats()
+        print(f"retries:        {stats['retries']} retries, {stats['failures']} failed calls, {stats['backoff_seconds']:.1f}s added backoff")
+        print(f"hedging:        {stats['hedges']} hedges fired, {stats['hedges_won']} won")
+    stats = route_stats()
+    print(f"extraction:     {stats['extraction_calls']} calls, fallback rate {stats['extraction_fallback_rate']:.1%}, "
+          f"p50/p95 {stats['extraction_primary_p50_ms']:.0f}/{stats['extraction_primary_p95_ms']:.0f}ms primary, "
+          f"{stats.get('extraction_fallback_p50_ms', 0):.0f}/{stats.get('extraction_fallback_p95_ms', 0):.0f}ms fallback")
+    print(f"description:    {stats['description_calls']} calls, p50/p95 {stats['description_primary_p50_ms']:.0f}/{stats['description_primary_p95_ms']:.0f}ms")
+    if get_admission_controller():
+        stats = get_admission_controller().stats()
+        print(f"admission:      {stats['admitted']} admitted ({stats['queued']} queued, peak queue {stats['peak_queue_depth']}), "
+              f"wait p50/p95 {stats['wait_p50_ms']:.0f}/{stats['wait_p95_ms']:.0f}ms, "
+              f"{stats['rejected_full']} rejected full, {stats['rejected_timeout']} timed out")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lightweight timers and counters around the pipeline stages, exported in the Prometheus text format.
+# When METRICS_ENABLED is false, timer() returns a shared no-op context manager, timed() leaves the
+# function undecorated and the record functions return immediately.
+
+# Configuration (use environment variables or configuration files in production)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+# Serve /metrics on this port (0 disables the endpoint)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Add session and turn labels to every series. Useful when debugging one conversation, but the
+# number of series grows with traffic, so keep it off in production.
+METRICS_TAG_SESSIONS = os.getenv('METRICS_TAG_SESSIONS', 'false').lower() == 'true'
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_context = contextvars.ContextVar('metrics_context', default=())
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, Labels], list] = {}
+_counters: Dict[Tuple[str, Labels], float] = {}
+_gauge_collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+_NOOP_TIMER = nullcontext()
+_server_started = False
+
+
+def tag(session: str, turn: int):
+    """
+    Tags everything recorded from the current thread or task with the session and turn.
+    """
+    _context.set((("session", str(session)), ("turn", str(turn))))
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    items = tuple(sorted((key, str(value)) for key, value in labels.items()))
+    if METRICS_TAG_SESSIONS:
+        items += _context.get()
+    return items
+
+
+def observe(name: str, seconds: float, **labels):
+    """
+    Adds a duration to the histogram `name`.
+    """
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0.0, 0] + [0] * len(BUCKETS)
+        histogram[0] += seconds
+        histogram[1] += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[2 + i] += 1
+
+
+def increment(name: str, amount: float = 1, **labels):
+    """
+    Adds to the counter `name`.
+    """
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def record_usage(stage: str, usage: Dict[str, int]):
+    """
+    Counts the input and output tokens reported in a Bedrock response's `usage` block.
+    """
+    if not METRICS_ENABLED or not usage:
+        return
+    for direction in ('input', 'output'):
+        if f'{direction}_tokens' in usage:
+            increment('bot_tokens_total', usage[f'{direction}_tokens'], stage=stage, direction=direction)
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe('bot_stage_seconds', time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+def timer(stage: str):
+    """
+    Context manager that records the duration of a pipeline stage.
+    """
+    return _Timer(stage) if METRICS_ENABLED else _NOOP_TIMER
+
+
+def timed(stage: str):
+    """
+    Decorator version of timer(); returns the function unchanged when metrics are disabled.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_gauges(prefix: str, collect: Callable[[], Dict[str, float]]):
+    """
+    Exports the numeric values returned by collect() as gauges named <prefix>_<key> on every scrape.
+    """
+    _gauge_collectors[prefix] = collect
+
+
+def _escape_label_value(value) -> str:
+    # Backslash first, so the escapes added for quotes and newlines are not escaped again
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + '}'
+
+
+def render_prometheus() -> str:
+    """
+    Renders every metric in the Prometheus text exposition format.
+    """
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (series, labels), values in sorted(histograms.items()):
+            if series != name:
+                continue
+            for bound, bucket_count in zip(BUCKETS, values[2:]):
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {values[1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[0]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[1]}")
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for prefix, collect in sorted(_gauge_collectors.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            logger.error(f"Metrics collector {prefix} failed: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        payload = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """
+    Serves /metrics from a background thread, once per process.
+    """
+    global _server_started
+    if not METRICS_ENABLED or not port:
+        return
+    with _lock:
+        if _server_started:
+            return
+        _server_started = True
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint on port {port}: {e}")
+        return
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving metrics on :{port}/metrics")
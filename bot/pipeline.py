@@ -0,0 +1,618 @@
+import os
+import re
+import json
+import time
+import logging
+
+from typing import Any, Callable, Dict, Generator, Optional
+
+from admission import BedrockBusy, admission_priority
+from bedrock import get_bedrock_client
+from context import build_messages, estimate_request_tokens
+from description_cache import DESCRIPTION_CACHE_ENABLED, DescriptionCache, description_cache
+from fast_extract import extract_attributes_locally
+from metrics import increment, observe, record_usage, timed, timer
+from routing import DESCRIPTION_MODEL_ID, description_route, extraction_route
+from spec_index import products_in, spec_excerpts, spec_index_available
+from recommendation import SUPPORTED_CANCER_TYPES, STAGES, THERAPY_STATUSES, recommend_guardant_test
+
+# Model calls and attribute handling behind the chat app. Kept free of Streamlit page code so the
+# same pipeline can run headless (batch runner, load tests); failures are returned (an empty
+# extraction, DESCRIPTION_ERROR_TEXT) and shown by the app.
+#
+# Extraction, descriptions and whole turns are written once, as step generators shared with the
+# serving engine (engine.py). A step generator yields what it needs done, a ModelCall (answered
+# with the parsed response body) or a BlockingCall (cache lookups and spec retrieval, answered with
+# their return value), and returns its result. run_steps carries the steps out in the calling
+# thread; the engine awaits the model calls on its event loop and runs blocking calls in threads.
+
+logger = logging.getLogger(__name__)
+
+# Configuration (use environment variables or configuration files in production)
+# The models each stage calls are configured in routing.py
+# Minimum local extractor confidence needed to skip the model call (set above 1 to always call the model)
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv('FAST_PATH_MIN_CONFIDENCE', '0.8'))
+# Ground descriptions in spec-sheet excerpts retrieved from the index built by spec_index.py
+SPEC_RETRIEVAL_ENABLED = os.getenv('SPEC_RETRIEVAL_ENABLED', 'true').lower() == 'true' and spec_index_available()
+# Bump whenever the product description prompt changes so cached descriptions are regenerated
+DESCRIPTION_PROMPT_VERSION = 'v3-specs' if SPEC_RETRIEVAL_ENABLED else 'v1'
+DESCRIPTION_ERROR_TEXT = "An error occurred while generating the product description. Please try again later."
+# Cached descriptions are shared across sessions, so they are generated without the user's chat context
+DESCRIPTION_CACHE_HISTORY = [{"role": 'user', "text": "Please describe the recommended tests."}]
+# What every description covers, searched for in the spec sheets of the recommended products
+SPEC_QUERY_TOPICS = "what the test detects, FDA approval status, number of genes evaluated, sample type and turnaround time"
+# Product facts of the description prompt when no spec-sheet excerpts are retrieved
+BASELINE_PRODUCT_FACTS = '''If the recommendation has LDT: be sure to mention that its not FDA approved, it evaluates 739 gene types.
+If the recommendation has CDx: be sure to mention that its FDA approved, it evaluates 74 gene types. 
+If comparing between LDT and CDx, make a table with the differences. Do not give any individual information about tests if comparing.'''
+# 'tool' forces the model to answer through EXTRACTION_TOOL's schema, 'text' asks for JSON in prose
+EXTRACTION_MODE = os.getenv('EXTRACTION_MODE', 'tool')
+# Three short enum fields fit comfortably in this many output tokens
+EXTRACTION_MAX_TOKENS = int(os.getenv('EXTRACTION_MAX_TOKENS', '150'))
+
+EXTRACTION_TOOL = {
+    "name": "record_patient_attributes",
+    "description": "Record the patient attributes mentioned in the latest user message. Use \"Unknown\" for anything not mentioned.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "cancer_type": {"type": "string", "enum": SUPPORTED_CANCER_TYPES + ["Unknown"]},
+            "stage": {"type": "string", "enum": STAGES + ["Unknown"]},
+            "therapy_status": {
+                "type": "string",
+                "enum": THERAPY_STATUSES + ["Unknown"],
+                "description": "Stage_2_3: newly_diagnosed, had_surgery, had_therapy or had_both. "
+                               "Stage_4: newly_diagnosed, therapy_not_working or in_therapy.",
+            },
+        },
+        "required": ["cancer_type", "stage", "therapy_status"],
+    },
+}
+
+ATTRIBUTE_PAIR_RE = re.compile(r'"(cancer_type|stage|therapy_status)"\s*:\s*"([^"]*)"')
+
+def parse_attributes_json(text_output: str) -> Dict[str, Any]:
+    """
+    Parses the attribute JSON from model text, tolerating markdown fences, surrounding prose and
+    truncated objects. Raises json.JSONDecodeError when no attribute can be recovered.
+    """
+    text = text_output.strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        text = text[text.find('\n') + 1:] if '\n' in text else text
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(text[start:end + 1])
+            if isinstance(parsed, dict):
+                return parsed
+        except json.JSONDecodeError:
+            pass
+    # Fall back to the key/value pairs that did make it, e.g. when max_tokens cut the object short
+    pairs = dict(ATTRIBUTE_PAIR_RE.findall(text))
+    if not pairs:
+        raise json.JSONDecodeError("No attributes found in model output", text_output, 0)
+    return pairs
+
+def parse_extraction_response(response_body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the attributes from a tool_use block, or parses them from the text blocks.
+    """
+    for block in response_body.get('content', []):
+        if block.get('type') == 'tool_use':
+            return block.get('input', {})
+    text_output = ''.join(block.get('text', '') for block in response_body.get('content', []))
+    return parse_attributes_json(text_output)
+
+def build_extraction_body(chat_history: list, attributes: Dict[str, Any] = None, mode: str = EXTRACTION_MODE) -> str:
+    """
+    Builds the Bedrock request body for attribute extraction, in the given EXTRACTION_MODE.
+    Depending on CONTEXT_MODE, the model sees either the entire chat history or only the latest
+    user turn plus a summary of the attributes collected so far.
+    """
+    # Define the system prompt
+    if mode == 'tool':
+        system_prompt = '''
+You are an AI assistant that extracts specific attributes from user input.
+Record the cancer type, stage and therapy status with the record_patient_attributes tool.
+Always choose "Unknown" if the user didn't provide the information.
+ONLY USE THE LATEST CHAT MESSAGE. DO NOT HALLUCINATE OR MAKE UP INFORMATION.
+'''
+    else:
+        system_prompt = '''
+You are an AI assistant that extracts specific attributes from user input.
+
+Extract the following attributes from the user input and output them as a JSON object:
+
+{{
+    "cancer_type": "Lung" / "Breast" / "Colorectal" / "Other" / "Unknown",
+    "stage": "Stage_2_3" / "Stage_4" / "Unknown",
+    "therapy_status": if stage_2_3: "newly_diagnosed" / "had_surgery" / "had_therapy" / "had_both" / "Unknown"
+                        if stage_4: "newly_diagnosed" / "therapy_not_working" / "in_therapy" / "Unknown",
+}}
+Always choose "Unknown" if the user didn't provide the information.
+DO NOT INCLUDE ANY INFORMATION FROM THE PREVIOUS CHAT MESSAGES. ONLY USE THE LATEST CHAT MESSAGE TO GENERATE THE JSON.
+DO NOT HALLUCINATE OR MAKE UP INFORMATION. ONLY EXTRACT THE ATTRIBUTES IF THEY ARE MENTIONED IN THE USER INPUT.
+Make sure the output is valid JSON.
+'''
+# If the use prompt asks for more information on a test and not a new recommendation, just generate a JSON saying new_recommendation: False
+
+    # Build the messages list from the chat history
+    messages = build_messages(chat_history, attributes)
+    logger.info(f"Extraction input tokens (estimated): {estimate_request_tokens(system_prompt, messages)}")
+
+    request = {
+        "messages": messages,
+        "anthropic_version": "bedrock-2023-05-31",
+        "system":            system_prompt,
+        "max_tokens":        EXTRACTION_MAX_TOKENS,
+        "temperature":       0.1,
+        "top_p":             0.9
+    }
+    if mode == 'tool':
+        request["tools"] = [EXTRACTION_TOOL]
+        request["tool_choice"] = {"type": "tool", "name": EXTRACTION_TOOL["name"]}
+    return json.dumps(request)
+
+def rejected_attributes(extracted_attributes: Dict[str, Any]) -> list:
+    """
+    Lists the attributes a model left out or gave values validate_attributes does not accept.
+    """
+    validated_attributes = validate_attributes(extracted_attributes)
+    return [key for key, value in validated_attributes.items() if extracted_attributes.get(key) != value]
+
+class ModelCall:
+    """
+    A step's Bedrock invoke_model call, at an admission priority.
+    """
+
+    def __init__(self, model_id: str, body: str, priority: str):
+        self.model_id = model_id
+        self.body = body
+        self.priority = priority
+
+class BlockingCall:
+    """
+    A step's call to a function that may block (cache lookups, spec retrieval), kept off event loops.
+    """
+
+    def __init__(self, function: Callable, *args):
+        self.function = function
+        self.args = args
+
+Steps = Generator[Any, Any, Any]
+
+def invoke_model(call: ModelCall) -> Dict[str, Any]:
+    """
+    Makes a step's model call with the process-wide client and returns the parsed response body.
+    """
+    with admission_priority(call.priority):
+        response = get_bedrock_client().invoke_model(
+            modelId=call.model_id,
+            accept='application/json',
+            contentType='application/json',
+            body=call.body
+        )
+    return json.loads(response['body'].read())
+
+def run_steps(steps: Steps):
+    """
+    Carries out a step generator's calls in the calling thread and returns its result.
+    """
+    reply, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(reply)
+        except StopIteration as stop:
+            return stop.value
+        reply, error = None, None
+        try:
+            reply = invoke_model(step) if isinstance(step, ModelCall) else step.function(*step.args)
+        except Exception as e:
+            error = e
+
+def extraction_steps(chat_history: list, attributes: Dict[str, Any] = None) -> Steps:
+    """
+    Extracts the attributes with Bedrock Claude, calling the extraction route's fallback model when
+    the first model's output does not parse or fails validation. Returns {} if the model call failed
+    and raises BedrockBusy when it is not admitted.
+    """
+    body = build_extraction_body(chat_history, attributes)
+
+    for model_id in extraction_route.models:
+        can_fall_back = model_id != extraction_route.models[-1]
+        start = time.perf_counter()
+        try:
+            with timer('extraction_invoke_model'):
+                response_body = yield ModelCall(model_id, body, 'extraction')
+            record_usage('extraction', response_body.get('usage'))
+
+            # Log the output for debugging
+            logger.info(f"Output from {model_id}: {json.dumps(response_body.get('content', []))}")
+
+            # Take the attributes from the tool call, or parse them from the text output
+            with timer('extraction_json_parse'):
+                extracted_attributes = parse_extraction_response(response_body)
+        except BedrockBusy:
+            raise
+        except json.JSONDecodeError as e:
+            extraction_route.record(model_id, time.perf_counter() - start, 'invalid')
+            increment('bot_errors_total', stage='extraction_json_parse')
+            logger.error(f"JSON decoding error: {e}")
+            if can_fall_back:
+                extraction_route.record_fallback('unparseable output')
+                continue
+            return {}
+        except Exception as e:
+            extraction_route.record(model_id, time.perf_counter() - start, 'error')
+            increment('bot_errors_total', stage='extraction_invoke_model')
+            logger.error(f"Error invoking Bedrock model: {e}")
+            return {}
+
+        rejected = rejected_attributes(extracted_attributes)
+        extraction_route.record(model_id, time.perf_counter() - start, 'invalid' if rejected else 'ok')
+        if rejected and can_fall_back:
+            extraction_route.record_fallback(f"invalid {', '.join(rejected)}")
+            continue
+        return extracted_attributes
+
+def turn_extraction_steps(user_input: str, chat_history: list, attributes: Dict[str, Any]) -> Steps:
+    """
+    Extracts the attributes of the latest user turn, trying the local extractor first and only
+    falling back to Bedrock Claude when it is not confident. Returns {} if the model call failed.
+    """
+    with timer('fast_path_extraction'):
+        extracted_attributes, confidence = extract_attributes_locally(user_input, attributes)
+    if confidence >= FAST_PATH_MIN_CONFIDENCE:
+        logger.info(f"Fast-path extraction (confidence {confidence}): {extracted_attributes}")
+        increment('bot_fast_path_total', outcome='hit')
+        return extracted_attributes
+    increment('bot_fast_path_total', outcome='miss')
+    return (yield from extraction_steps(chat_history, attributes))
+
+def extract_attributes_with_claude(chat_history: list, attributes: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    extraction_steps, run in the calling thread.
+    """
+    return run_steps(extraction_steps(chat_history, attributes))
+
+def extract_turn_attributes(user_input: str, chat_history: list, attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    turn_extraction_steps, run in the calling thread.
+    """
+    return run_steps(turn_extraction_steps(user_input, chat_history, attributes))
+
+def build_description_body(recommendation: str, chat_history, attributes: Dict[str, Any] = None) -> str:
+    """
+    Builds the Bedrock request body for a product description.
+    """
+    messages = build_messages(chat_history, attributes)
+
+    excerpts = ''
+    if SPEC_RETRIEVAL_ENABLED:
+        with timer('spec_retrieval'):
+            excerpts = spec_excerpts(recommendation, spec_query(recommendation, chat_history, attributes))
+    if excerpts:
+        product_facts = f'''If comparing products, make a table with the differences. Do not give any individual information about tests if comparing.
+Only state product facts that appear in these spec sheet excerpts:
+{excerpts}'''
+    else:
+        product_facts = BASELINE_PRODUCT_FACTS
+
+    system_prompt = f'''
+You are an AI assistant that generates a product description based on the recommendation provided.
+Only talk in 'we' and 'our' and do not use any first person pronouns.
+
+Given the recommendation: "{recommendation}", generate a product description for the user.
+
+If there are multiple recommendations, generate a detailed comparison between the products.
+{product_facts}
+
+Be concise. Do not repeat information.
+
+DO NOT AUTOMATICALLY PICK ONE TEST TO DESCRIBE. DESCRIBE ALL TESTS IN THE RECOMMENDATION.
+'''
+
+    logger.info(f"Description input tokens (estimated): {estimate_request_tokens(system_prompt, messages)}")
+
+    return json.dumps({
+        "messages": messages,
+        "anthropic_version": "bedrock-2023-05-31",
+        "system":            system_prompt,
+        "max_tokens":        500,
+        "temperature":       0.1,
+        "top_p":             0.9
+    })
+
+def description_question(chat_history) -> str:
+    """
+    The latest user message, which is what a description is generated in answer to.
+    """
+    return next((chat['text'] for chat in reversed(chat_history) if chat['role'] == 'user'), '')
+
+def description_context(recommendation: str, chat_history, attributes: Dict[str, Any] = None) -> str:
+    """
+    Semantic cache context of a description: everything in its prompt except the latest user message,
+    which is matched by similarity. Descriptions generated from a chat are then only reused for the
+    same patient attributes and the same conversation before the question.
+    """
+    from semantic_cache import SemanticCache
+    question_at = max((i for i, chat in enumerate(chat_history) if chat['role'] == 'user'), default=len(chat_history))
+    earlier = '\n'.join(f"{chat['role']}: {chat['text']}" for chat in chat_history[:question_at])
+    return SemanticCache.make_context(recommendation, DESCRIPTION_MODEL_ID, json.dumps(attributes or {}, sort_keys=True), earlier)
+
+def spec_query(recommendation: str, chat_history, attributes: Dict[str, Any] = None) -> str:
+    """
+    Spec retrieval query for a description: the recommended products, what a description covers and
+    the patient's known attributes, plus the latest user message when it is a question (most are
+    option replies such as "Had Surgery", which say nothing about the products).
+    """
+    query = f"{' and '.join(products_in(recommendation))}: {SPEC_QUERY_TOPICS}"
+    known = [value.replace('_', ' ') for value in (attributes or {}).values() if value != "Unknown"]
+    if known:
+        query += f", for a patient with {', '.join(known)}"
+    question = description_question(chat_history)
+    if question.rstrip().endswith('?'):
+        query += f". {question}"
+    return query
+
+def semantic_description(recommendation: str, chat_history, attributes: Dict[str, Any] = None) -> Optional[str]:
+    """
+    Returns a stored description for a similar question in the same context, if any.
+    """
+    # Imported here so that numpy loads with the first description rather than with the app
+    from semantic_cache import SEMANTIC_CACHE_ENABLED, get_semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with timer('semantic_cache_lookup'):
+        return get_semantic_cache(DESCRIPTION_PROMPT_VERSION).get(
+            description_question(chat_history), description_context(recommendation, chat_history, attributes)
+        )
+
+def remember_description(recommendation: str, chat_history, attributes: Dict[str, Any], text_output: str):
+    from semantic_cache import SEMANTIC_CACHE_ENABLED, get_semantic_cache
+    if SEMANTIC_CACHE_ENABLED and text_output and DESCRIPTION_ERROR_TEXT not in text_output:
+        get_semantic_cache(DESCRIPTION_PROMPT_VERSION).set(
+            description_question(chat_history), description_context(recommendation, chat_history, attributes), text_output
+        )
+
+def description_steps(recommendation: str, chat_history, attributes: Dict[str, Any] = None, priority: str = 'description') -> Steps:
+    """
+    Generates the product description at the given admission priority. Returns
+    DESCRIPTION_ERROR_TEXT if the model call failed and raises BedrockBusy when it is not admitted.
+    """
+    text_output = yield BlockingCall(semantic_description, recommendation, chat_history, attributes)
+    if text_output is not None:
+        return text_output
+    body = yield BlockingCall(build_description_body, recommendation, chat_history, attributes)
+
+    start = time.perf_counter()
+    try:
+        with timer('description_invoke_model'):
+            response_body = yield ModelCall(DESCRIPTION_MODEL_ID, body, priority)
+        text_output = response_body['content'][0]['text']
+    except BedrockBusy:
+        raise
+    except Exception as e:
+        description_route.record(DESCRIPTION_MODEL_ID, time.perf_counter() - start, 'error')
+        increment('bot_errors_total', stage='description_invoke_model')
+        logger.error(f"Error invoking Bedrock model: {e}")
+        return DESCRIPTION_ERROR_TEXT
+    elapsed = time.perf_counter() - start
+    description_route.record(DESCRIPTION_MODEL_ID, elapsed, 'ok')
+    record_usage('description', response_body.get('usage'))
+    logger.info(f"Description full-response latency: {elapsed:.2f}s")
+    yield BlockingCall(remember_description, recommendation, chat_history, attributes, text_output)
+    return text_output
+
+def cached_description_steps(recommendation: str, chat_history: list = None, attributes: Dict[str, Any] = None) -> Steps:
+    """
+    Returns the product description from the process-wide cache, generating and storing it on a miss.
+    Without the cache, the description is generated from the given chat context.
+    """
+    if not DESCRIPTION_CACHE_ENABLED:
+        return (yield from description_steps(recommendation, chat_history or DESCRIPTION_CACHE_HISTORY, attributes))
+    cache_key = DescriptionCache.make_key(recommendation, DESCRIPTION_PROMPT_VERSION, DESCRIPTION_MODEL_ID)
+    text_output = yield BlockingCall(description_cache.get, cache_key)
+    if text_output is None:
+        text_output = yield from description_steps(recommendation, DESCRIPTION_CACHE_HISTORY)
+        if text_output != DESCRIPTION_ERROR_TEXT:
+            yield BlockingCall(description_cache.set, cache_key, text_output)
+    return text_output
+
+def get_product_description(recommendation: str, chat_history, attributes: Dict[str, Any] = None, priority: str = 'description') -> str:
+    """
+    description_steps, run in the calling thread.
+    """
+    return run_steps(description_steps(recommendation, chat_history, attributes, priority))
+
+def cached_product_description(recommendation: str, chat_history: list = None, attributes: Dict[str, Any] = None) -> str:
+    """
+    cached_description_steps, run in the calling thread.
+    """
+    return run_steps(cached_description_steps(recommendation, chat_history, attributes))
+
+def description_stream_text(event: Dict[str, Any]):
+    """
+    Returns the text of a streamed description event, or None for events without text.
+    Token usage reported by the stream is recorded along the way.
+    """
+    if 'chunk' not in event:
+        return None
+    chunk = json.loads(event['chunk']['bytes'])
+    if chunk.get('type') == 'content_block_delta' and chunk['delta'].get('type') == 'text_delta':
+        return chunk['delta']['text']
+    if chunk.get('type') == 'message_start':
+        record_usage('description', {'input_tokens': chunk['message'].get('usage', {}).get('input_tokens', 0)})
+    elif chunk.get('type') == 'message_delta':
+        record_usage('description', chunk.get('usage'))
+    return None
+
+class DescriptionStream:
+    """
+    Timing, metrics and logging of one streamed description, shared by the synchronous stream
+    below and the engine's. The caller reads the events and remembers the finished text.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.streamed = []
+
+    def text(self, event: Dict[str, Any]) -> Optional[str]:
+        """
+        The event's text, or None for events without text.
+        """
+        text = description_stream_text(event)
+        if text is not None:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+                observe('bot_stage_seconds', self.first_token_at - self.start, stage='description_first_token')
+                logger.info(f"Description time to first token: {self.first_token_at - self.start:.2f}s")
+            self.streamed.append(text)
+        return text
+
+    def finished(self) -> str:
+        """
+        Records a completed stream and returns its text.
+        """
+        elapsed = time.perf_counter() - self.start
+        observe('bot_stage_seconds', elapsed, stage='description_stream')
+        description_route.record(DESCRIPTION_MODEL_ID, elapsed, 'ok')
+        logger.info(f"Description streamed-response latency: {elapsed:.2f}s")
+        return ''.join(self.streamed)
+
+    def failed(self, error: Exception):
+        description_route.record(DESCRIPTION_MODEL_ID, time.perf_counter() - self.start, 'error')
+        increment('bot_errors_total', stage='description_stream')
+        logger.error(f"Error invoking Bedrock model: {error}")
+
+def stream_product_description(recommendation: str, chat_history, attributes: Dict[str, Any] = None):
+    """
+    Yields the product description text as Bedrock streams it, for use with st.write_stream.
+    Yields DESCRIPTION_ERROR_TEXT on failure and raises BedrockBusy before the first chunk when the
+    call is not admitted.
+    """
+    text_output = semantic_description(recommendation, chat_history, attributes)
+    if text_output is not None:
+        yield text_output
+        return
+    body = build_description_body(recommendation, chat_history, attributes)
+
+    stream = DescriptionStream()
+    try:
+        with admission_priority('description'):
+            response = get_bedrock_client().invoke_model_with_response_stream(
+                modelId=DESCRIPTION_MODEL_ID,
+                accept='application/json',
+                contentType='application/json',
+                body=body
+            )
+        for event in response['body']:
+            text = stream.text(event)
+            if text is not None:
+                yield text
+        text_output = stream.finished()
+    except BedrockBusy:
+        raise
+    except Exception as e:
+        stream.failed(e)
+        yield DESCRIPTION_ERROR_TEXT
+        return
+    remember_description(recommendation, chat_history, attributes, text_output)
+
+def generate_cacheable_description(recommendation: str):
+    """
+    Generates a context-free product description for the cache, or None if the model call failed.
+    Runs behind user-facing calls in the admission queue and gives up when Bedrock is busy.
+    """
+    try:
+        text_output = get_product_description(recommendation, DESCRIPTION_CACHE_HISTORY, priority='background')
+    except BedrockBusy:
+        return None
+    return None if text_output == DESCRIPTION_ERROR_TEXT else text_output
+
+@timed('validate_attributes')
+def validate_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates and normalizes the extracted attributes.
+    """
+    validated_attributes = {}
+
+    # Validate 'cancer_type'
+    cancer_type = attributes.get('cancer_type', 'Unknown')
+    if cancer_type in SUPPORTED_CANCER_TYPES + ['Other', 'Unknown']:
+        validated_attributes['cancer_type'] = cancer_type
+    else:
+        validated_attributes['cancer_type'] = 'Unknown'
+
+    # Validate 'stage'
+    stage = attributes.get('stage', 'Unknown')
+    if stage in STAGES:
+        validated_attributes['stage'] = stage
+    else:
+        validated_attributes['stage'] = 'Unknown'
+
+    # Validate 'therapy_status'
+    therapy_status = attributes.get('therapy_status', 'Unknown')
+    if therapy_status in THERAPY_STATUSES:
+        validated_attributes['therapy_status'] = therapy_status
+    else:
+        validated_attributes['therapy_status'] = 'Unknown'
+
+    return validated_attributes
+
+def update_attributes(attributes: Dict[str, Any], validated_attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merges newly validated attributes into the collected ones; "Unknown" never overwrites a known value.
+    """
+    for key in attributes:
+        if validated_attributes.get(key, "Unknown") != "Unknown":
+            attributes[key] = validated_attributes[key]
+    return attributes
+
+def all_attributes_collected(attributes: Dict[str, Any]) -> bool:
+    """
+    Checks if all attributes have been collected.
+    """
+    return all(value != "Unknown" for value in attributes.values())
+
+def turn_steps(user_input: str, chat_history: list, attributes: Dict[str, Any], with_description: bool = True) -> Steps:
+    """
+    Runs one user turn headless, following the chat app's logic: extraction, validation,
+    and once every attribute is known, recommendation and product description.
+
+    Appends to chat_history and returns (turn result, attributes for the next turn). A turn that
+    Bedrock admission control turned away has the error "busy".
+    """
+    chat_history.append({"role": 'user', "text": user_input})
+    try:
+        extracted_attributes = yield from turn_extraction_steps(user_input, chat_history, attributes)
+    except BedrockBusy:
+        return {"user": user_input, "error": "busy"}, attributes
+    if not extracted_attributes:
+        return {"user": user_input, "error": "extraction failed"}, attributes
+    update_attributes(attributes, validate_attributes(extracted_attributes))
+    result = {"user": user_input, "attributes": dict(attributes)}
+    if not all_attributes_collected(attributes):
+        return result, attributes
+
+    with timer('recommendation'):
+        recommendation, future_recommendation = recommend_guardant_test(**attributes)
+    result["recommendation"] = recommendation
+    result["future_recommendation"] = future_recommendation
+    if with_description:
+        try:
+            result["description"] = yield from cached_description_steps(recommendation, chat_history, attributes)
+        except BedrockBusy:
+            result["error"] = "busy"
+        if result.get("description") == DESCRIPTION_ERROR_TEXT:
+            result["error"] = "description failed"
+    chat_history.append({"role": 'assistant', "text": result.get("description", recommendation)})
+    return result, {key: "Unknown" for key in attributes}
+
+def process_turn(user_input: str, chat_history: list, attributes: Dict[str, Any], with_description: bool = True):
+    """
+    turn_steps, run in the calling thread.
+    """
+    return run_steps(turn_steps(user_input, chat_history, attributes, with_description))
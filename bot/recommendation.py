@@ -0,0 +1,55 @@
+import os
+from typing import Optional, Tuple
+
+from metrics import register_gauges
+from rules import RulesFile
+
+# Recommendation rules shared by the chat app and the batch tools. The rules themselves are in
+# recommendation_rules.json (see rules.py), compiled into a table over every attribute combination
+# and reloaded when the file changes.
+
+# Constants
+SUPPORTED_CANCER_TYPES = ["Lung", "Breast", "Colorectal", "Other"]
+STAGES = ["Stage_2_3", "Stage_4"]
+THERAPY_STATUSES = ["newly_diagnosed", "had_surgery", "had_therapy", "had_both", "therapy_not_working", "in_therapy"]
+UNKNOWN = "Unknown"
+
+# Configuration (use environment variables or configuration files in production)
+RECOMMENDATION_RULES_PATH = os.getenv(
+    'RECOMMENDATION_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recommendation_rules.json')
+)
+
+# Every value the rules must cover, including "Unknown" for anything unrecognised
+RULE_ATTRIBUTES = {
+    "cancer_type": SUPPORTED_CANCER_TYPES + [UNKNOWN],
+    "stage": STAGES + [UNKNOWN],
+    "therapy_status": THERAPY_STATUSES + [UNKNOWN],
+}
+
+recommendation_rules = RulesFile(RECOMMENDATION_RULES_PATH, RULE_ATTRIBUTES, outputs=("recommendation", "future_recommendation"))
+register_gauges('bot_recommendation_rules', recommendation_rules.stats)
+
+def recommend_guardant_test(
+    cancer_type: str,
+    stage: str,
+    therapy_status: str,
+) -> Tuple[str, Optional[str]]:
+    """
+    Recommends a Guardant test based on the provided attributes.
+    """
+    rules = recommendation_rules.rules
+    outcome = rules.table.get((cancer_type, stage, therapy_status))
+    return outcome if outcome is not None else rules.lookup(cancer_type, stage, therapy_status)
+
+def all_recommendations() -> list:
+    """
+    Lists every distinct recommendation recommend_guardant_test can return.
+    """
+    recommendations = []
+    for cancer_type in SUPPORTED_CANCER_TYPES:
+        for stage in STAGES:
+            for therapy_status in THERAPY_STATUSES:
+                recommendation, _ = recommend_guardant_test(cancer_type, stage, therapy_status)
+                if recommendation not in recommendations:
+                    recommendations.append(recommendation)
+    return recommendations
@@ -0,0 +1,256 @@
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict
+
+from metrics import increment, observe, register_gauges
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for Bedrock runtime calls: jittered exponential backoff bounded by a per-call
+# deadline, plus optional hedging, where a second identical request is fired once the first has
+# been running longer than the recent p95 latency and whichever answers first wins.
+#
+# The deadline bounds each attempt too: synchronous attempts run on a worker pool and the caller
+# stops waiting for them when the deadline passes (the abandoned request finishes in the
+# background, within the client's read timeout), and async attempts are cancelled. Attempts run in
+# a copy of the caller's context, so admission priorities and metric tags carry over to them.
+
+# Configuration (use environment variables or configuration files in production)
+RETRY_ENABLED = os.getenv('RETRY_ENABLED', 'true').lower() == 'true'
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '4'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.25'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '4'))
+# Total time budget for one logical call, including all attempts and backoff
+RETRY_DEADLINE = float(os.getenv('RETRY_DEADLINE', '45'))
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'false').lower() == 'true'
+# Hedge after this percentile of recent latencies, but never sooner than HEDGE_MIN_DELAY
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '1.0'))
+# Threads running synchronous attempts, hedges included; calls beyond this wait for a free one
+RETRY_MAX_WORKERS = int(os.getenv('RETRY_MAX_WORKERS', '256'))
+
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+}
+
+_attempt_executor = ThreadPoolExecutor(max_workers=RETRY_MAX_WORKERS, thread_name_prefix='bedrock-attempt')
+
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "attempts": 0,
+    "retries": 0,
+    "failures": 0,
+    "hedges": 0,
+    "hedges_won": 0,
+    "backoff_seconds": 0.0,
+}
+
+
+def _count(name: str, amount: float = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def retry_stats() -> Dict[str, float]:
+    """
+    Process-wide retry and hedging counters. backoff_seconds is the latency added by waiting between attempts.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+register_gauges('bot_bedrock_retry', retry_stats)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a call is still waiting on an attempt at its RETRY_DEADLINE.
+    """
+
+
+def is_retryable(error: Exception) -> bool:
+    # Imported here, like boto3 in bedrock.py, so that botocore loads with the first Bedrock call rather than with the app
+    from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES
+    return isinstance(error, (ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError))
+
+
+class LatencyWindow:
+    """
+    Rolling window of recent call latencies used to pick the hedging delay.
+    """
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class ResilientClient:
+    """
+    Wraps a Bedrock runtime client with the retry policy. invoke_model can also be hedged;
+    streaming calls are only retried, since a second stream cannot be merged with the first.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        deadline: float = RETRY_DEADLINE,
+        hedge: bool = HEDGE_ENABLED,
+    ):
+        self._client = client
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.latency = LatencyWindow()
+
+    def invoke_model(self, **kwargs):
+        return self._with_retries('invoke_model', lambda: self._client.invoke_model(**kwargs), hedge=self.hedge)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._with_retries('invoke_model_with_response_stream', lambda: self._client.invoke_model_with_response_stream(**kwargs))
+
+    def invoke_agent(self, **kwargs):
+        # Retries the call only; the completion stream is read by the caller
+        return self._with_retries('invoke_agent', lambda: self._client.invoke_agent(**kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _with_retries(self, operation: str, call: Callable, hedge: bool = False):
+        _count("calls")
+        give_up_at = time.monotonic() + self.deadline
+        for attempt in range(1, self.max_attempts + 1):
+            _count("attempts")
+            increment('bot_bedrock_attempts_total', operation=operation)
+            start = time.monotonic()
+            try:
+                response = self._attempt(operation, call, give_up_at, hedge)
+                self.latency.add(time.monotonic() - start)
+                return response
+            except Exception as e:
+                delay = self._backoff(operation, attempt, e, give_up_at)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def _backoff(self, operation: str, attempt: int, error: Exception, give_up_at: float):
+        """
+        Returns how long to wait before the next attempt, or None when the error should be raised.
+        """
+        if not is_retryable(error) or attempt == self.max_attempts:
+            _count("failures")
+            return None
+        # Full jitter: sleep a random time up to the exponential backoff cap
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if time.monotonic() + delay >= give_up_at:
+            _count("failures")
+            logger.error(f"{operation} deadline of {self.deadline}s reached after {attempt} attempts")
+            return None
+        logger.info(f"{operation} attempt {attempt} failed ({error}), retrying in {delay:.2f}s")
+        _count("retries")
+        _count("backoff_seconds", delay)
+        observe('bot_bedrock_backoff_seconds', delay, operation=operation)
+        return delay
+
+    def _attempt(self, operation: str, call: Callable, give_up_at: float, hedge: bool):
+        """
+        Runs one attempt on the worker pool and waits for it until give_up_at at the latest. When
+        hedging, a second identical request is fired once the first runs past the hedging delay.
+        """
+        hedge_at = time.monotonic() + max(HEDGE_MIN_DELAY, self.latency.percentile(HEDGE_PERCENTILE)) if hedge else None
+        first = _attempt_executor.submit(contextvars.copy_context().run, call)
+        pending = {first}
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= give_up_at:
+                logger.error(f"{operation} deadline of {self.deadline}s reached while waiting on an attempt")
+                raise DeadlineExceeded(f"{operation} did not finish within {self.deadline}s")
+            timeout = give_up_at - now if hedge_at is None else min(give_up_at, hedge_at) - now
+            done, pending = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        _count("hedges_won")
+                        increment('bot_bedrock_hedges_won_total')
+                    return future.result()
+                error = future.exception()
+            if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+                hedge_at = None
+                _count("hedges")
+                increment('bot_bedrock_hedges_total')
+                pending.add(_attempt_executor.submit(contextvars.copy_context().run, call))
+        raise error
+
+
+class AsyncResilientClient(ResilientClient):
+    """
+    Coroutine version of ResilientClient for aiobotocore-style clients. Calls are retried with the
+    same policy and counters, but not hedged.
+    """
+
+    def __init__(self, client, **kwargs):
+        super().__init__(client, hedge=False, **kwargs)
+
+    async def invoke_model(self, **kwargs):
+        return await self._with_retries('invoke_model', lambda: self._client.invoke_model(**kwargs))
+
+    async def invoke_model_with_response_stream(self, **kwargs):
+        return await self._with_retries('invoke_model_with_response_stream', lambda: self._client.invoke_model_with_response_stream(**kwargs))
+
+    async def _with_retries(self, operation: str, call: Callable):
+        _count("calls")
+        give_up_at = time.monotonic() + self.deadline
+        for attempt in range(1, self.max_attempts + 1):
+            _count("attempts")
+            increment('bot_bedrock_attempts_total', operation=operation)
+            start = time.monotonic()
+            try:
+                response = await self._attempt_async(operation, call, give_up_at)
+                self.latency.add(time.monotonic() - start)
+                return response
+            except Exception as e:
+                delay = self._backoff(operation, attempt, e, give_up_at)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def _attempt_async(self, operation: str, call: Callable, give_up_at: float):
+        """
+        Awaits one attempt, cancelling it at give_up_at.
+        """
+        try:
+            return await asyncio.wait_for(call(), max(0.0, give_up_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            logger.error(f"{operation} deadline of {self.deadline}s reached while waiting on an attempt")
+            raise DeadlineExceeded(f"{operation} did not finish within {self.deadline}s")
@@ -0,0 +1,98 @@
+import os
+import logging
+import threading
+from typing import Dict, List
+
+from metrics import increment, observe, register_gauges
+from retry import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# Model per pipeline stage. Extracting three enum fields does not need the model that writes the
+# product descriptions, so each stage has its own route: a model, and optionally a fallback model
+# that is called when the first one's answer is unusable (for extraction: output that does not
+# parse or that validate_attributes has to reset). Every call is recorded per route and model, as
+# latency percentiles and outcome counts in stats() (exported as bot_routes_* gauges) and as
+# bot_model_seconds / bot_model_calls_total series labelled with the route and model.
+
+# Configuration (use environment variables or configuration files in production)
+# The large model: descriptions, and the extraction fallback, unless configured otherwise
+BEDROCK_MODEL_ID = os.getenv('BEDROCK_MODEL_ID', 'anthropic.claude-3-5-sonnet-20241022-v2:0')
+EXTRACTION_MODEL_ID = os.getenv('EXTRACTION_MODEL_ID', 'anthropic.claude-3-5-haiku-20241022-v1:0')
+# Called when the extraction model's output fails validation (empty disables the fallback)
+EXTRACTION_FALLBACK_MODEL_ID = os.getenv('EXTRACTION_FALLBACK_MODEL_ID', BEDROCK_MODEL_ID)
+DESCRIPTION_MODEL_ID = os.getenv('DESCRIPTION_MODEL_ID', BEDROCK_MODEL_ID)
+# Recent calls per route and model that the latency percentiles are taken over
+ROUTE_LATENCY_WINDOW = int(os.getenv('ROUTE_LATENCY_WINDOW', '1000'))
+
+OUTCOMES = ('ok', 'invalid', 'error')
+
+
+class ModelRoute:
+    """
+    The model, and optional fallback model, a stage calls, with latency and outcome stats per model.
+    """
+
+    def __init__(self, stage: str, model_id: str, fallback_model_id: str = '', window: int = ROUTE_LATENCY_WINDOW):
+        self.stage = stage
+        self.model_id = model_id
+        self.fallback_model_id = fallback_model_id if fallback_model_id != model_id else ''
+        # Models in the order they are tried
+        self.models: List[str] = [model_id] + ([self.fallback_model_id] if self.fallback_model_id else [])
+        self._latency = {model: LatencyWindow(window) for model in self.models}
+        self._counts = {(model, outcome): 0 for model in self.models for outcome in OUTCOMES}
+        self._fallbacks = 0
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, seconds: float, outcome: str):
+        """
+        Records one call to model_id: 'ok', 'invalid' (answered, but unusable) or 'error' (the call failed).
+        """
+        observe('bot_model_seconds', seconds, route=self.stage, model=model_id)
+        increment('bot_model_calls_total', route=self.stage, model=model_id, outcome=outcome)
+        if model_id not in self._latency:
+            return
+        self._latency[model_id].add(seconds)
+        with self._lock:
+            self._counts[(model_id, outcome)] += 1
+
+    def record_fallback(self, reason: str):
+        """
+        Records that the fallback model is called because the first model's answer was unusable.
+        """
+        logger.info(f"{self.stage}: falling back from {self.model_id} to {self.fallback_model_id} ({reason})")
+        increment('bot_model_fallbacks_total', route=self.stage)
+        with self._lock:
+            self._fallbacks += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self._counts)
+            fallbacks = self._fallbacks
+        primary_calls = sum(counts[(self.model_id, outcome)] for outcome in OUTCOMES)
+        stats = {
+            "calls": sum(counts.values()),
+            "fallbacks": fallbacks,
+            "fallback_rate": fallbacks / primary_calls if primary_calls else 0.0,
+        }
+        for role, model in zip(('primary', 'fallback'), self.models):
+            for outcome in OUTCOMES:
+                stats[f"{role}_{outcome}"] = counts[(model, outcome)]
+            stats[f"{role}_p50_ms"] = self._latency[model].percentile(50) * 1000
+            stats[f"{role}_p95_ms"] = self._latency[model].percentile(95) * 1000
+        return stats
+
+
+extraction_route = ModelRoute('extraction', EXTRACTION_MODEL_ID, EXTRACTION_FALLBACK_MODEL_ID)
+description_route = ModelRoute('description', DESCRIPTION_MODEL_ID)
+routes = {route.stage: route for route in (extraction_route, description_route)}
+
+
+def route_stats() -> Dict[str, float]:
+    """
+    Stats of every route, keyed <stage>_<stat>.
+    """
+    return {f"{stage}_{key}": value for stage, route in routes.items() for key, value in route.stats().items()}
+
+
+register_gauges('bot_routes', route_stats)
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import logging
+import argparse
+import itertools
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Declarative rule sets. A rules file names the attributes with every value they can take, and a list
+# of rules, each matching a set of values per attribute (all values when an attribute is left out)
+# and giving an outcome. Loading compiles the rules into a table over the full cross-product of the
+# attribute values, so a lookup is one dict access, and rejects files whose rules leave a combination
+# uncovered (a gap) or match one combination twice (an overlap). RulesFile watches the file from a
+# background thread, recompiles it when it changes and keeps serving the previous rules if the new
+# ones do not load.
+#
+#   python bot/rules.py bot/recommendation_rules.json    # check a rules file and print its table size
+#
+# File layout:
+#   {"version": "...", "attributes": {"stage": ["Stage_2_3", "Stage_4", "Unknown"], ...},
+#    "unrecognized": "Unknown",
+#    "rules": [{"id": "...", "when": {"stage": ["Stage_4"], ...}, "then": {"recommendation": "..."}}, ...]}
+#
+# Values a lookup gets that are not listed for an attribute are looked up as the "unrecognized" value.
+
+# Configuration (use environment variables or configuration files in production)
+# Seconds between checks of a rules file for changes
+RULES_RELOAD_SECONDS = float(os.getenv('RULES_RELOAD_SECONDS', '5'))
+
+# Combinations listed per gap or overlap in load errors
+MAX_REPORTED = 5
+
+
+class RulesError(ValueError):
+    pass
+
+
+class RuleSet:
+    """
+    A compiled rules file: outcome per combination of attribute values.
+    """
+
+    def __init__(self, spec: Dict[str, Any], source: str = '<rules>', outputs: Sequence[str] = None):
+        self.source = source
+        self.outputs = outputs
+        self.version = str(spec.get("version", ''))
+        self.attributes: Dict[str, List[str]] = spec.get("attributes") or {}
+        self.unrecognized = spec.get("unrecognized")
+        self.names = list(self.attributes)
+        # Combination -> the rule's outcome, as a tuple of the outputs' values when outputs are given
+        self.table: Dict[Tuple[str, ...], Any] = {}
+        self.rule_of: Dict[Tuple[str, ...], str] = {}
+        self._compile(spec.get("rules") or [])
+        self._domains = [frozenset(values) for values in self.attributes.values()]
+
+    def _compile(self, rules: List[Dict[str, Any]]):
+        if not self.attributes:
+            raise RulesError(f"{self.source}: no attributes")
+        if self.unrecognized is not None and any(self.unrecognized not in values for values in self.attributes.values()):
+            raise RulesError(f"{self.source}: every attribute must list the unrecognized value {self.unrecognized!r}")
+        overlaps = []
+        for number, rule in enumerate(rules, 1):
+            rule_id = str(rule.get("id", f"rule {number}"))
+            when = rule.get("when") or {}
+            unknown = [name for name in when if name not in self.attributes]
+            if unknown:
+                raise RulesError(f"{self.source}: {rule_id} uses unknown attributes {unknown}")
+            outcome = rule.get("then")
+            if not isinstance(outcome, dict):
+                raise RulesError(f"{self.source}: {rule_id} has no 'then' outcome")
+            if self.outputs is not None:
+                if self.outputs[0] not in outcome:
+                    raise RulesError(f"{self.source}: {rule_id} has no {self.outputs[0]!r}")
+                outcome = tuple(outcome.get(output) for output in self.outputs)
+            axes = []
+            for name, domain in self.attributes.items():
+                values = when.get(name, domain)
+                values = [values] if isinstance(values, str) else list(values)
+                invalid = [value for value in values if value not in domain]
+                if invalid:
+                    raise RulesError(f"{self.source}: {rule_id} has values {invalid} not listed for {name}")
+                axes.append(values)
+            for key in itertools.product(*axes):
+                if key in self.table:
+                    overlaps.append((key, self.rule_of[key], rule_id))
+                    continue
+                self.table[key] = outcome
+                self.rule_of[key] = rule_id
+        if overlaps:
+            listed = '; '.join(f"{self.describe(key)} in {first} and {second}" for key, first, second in overlaps[:MAX_REPORTED])
+            raise RulesError(f"{self.source}: {len(overlaps)} combinations match more than one rule: {listed}")
+        gaps = [key for key in itertools.product(*self.attributes.values()) if key not in self.table]
+        if gaps:
+            listed = '; '.join(self.describe(key) for key in gaps[:MAX_REPORTED])
+            raise RulesError(f"{self.source}: {len(gaps)} combinations match no rule: {listed}")
+
+    def describe(self, key: Sequence[str]) -> str:
+        return ', '.join(f"{name}={value}" for name, value in zip(self.names, key))
+
+    def lookup(self, *values: str):
+        """
+        Outcome of the rule matching the values, given in attribute order.
+        """
+        outcome = self.table.get(values)
+        if outcome is None:
+            if len(values) != len(self.names):
+                raise TypeError(f"expected {len(self.names)} attribute values ({', '.join(self.names)}), got {len(values)}")
+            normalized = tuple([value if value in domain else self.unrecognized for value, domain in zip(values, self._domains)])
+            outcome = self.table.get(normalized)
+            if outcome is None:
+                raise KeyError(f"{self.describe(values)} is not covered by {self.source} and it has no unrecognized value")
+        return outcome
+
+    def outcomes(self) -> list:
+        """
+        Distinct outcomes, in the order their rules are listed.
+        """
+        distinct = []
+        for outcome in self.table.values():
+            if outcome not in distinct:
+                distinct.append(outcome)
+        return distinct
+
+
+def load_rules(path: str, attributes: Dict[str, List[str]] = None, outputs: Sequence[str] = None) -> RuleSet:
+    """
+    Loads and compiles a rules file. When attributes is given, the file must declare exactly those
+    attributes, in that order, with those values (the vocabulary the calling code extracts and validates).
+    When outputs is given, lookups return tuples of those fields of the outcome (the first is required).
+    """
+    with open(path) as f:
+        try:
+            spec = json.load(f)
+        except ValueError as e:
+            raise RulesError(f"{path}: {e}") from e
+    if attributes is not None:
+        declared = {name: sorted(values) for name, values in (spec.get("attributes") or {}).items()}
+        expected = {name: sorted(values) for name, values in attributes.items()}
+        if list(declared) != list(expected) or declared != expected:
+            raise RulesError(f"{path}: attributes {declared} do not match the expected {expected}")
+    return RuleSet(spec, path, outputs)
+
+
+class RulesFile:
+    """
+    The compiled rules of a file, recompiled when the file changes. A file that fails to load is
+    logged and the previous rules stay in use.
+    """
+
+    def __init__(self, path: str, attributes: Dict[str, List[str]] = None, outputs: Sequence[str] = None,
+                 reload_seconds: float = RULES_RELOAD_SECONDS):
+        self.path = path
+        self.attributes = attributes
+        self.outputs = outputs
+        self.reload_seconds = reload_seconds
+        self.reloads = 0
+        self.reload_errors = 0
+        self._stamp = self._file_stamp()
+        self.rules = load_rules(path, attributes, outputs)
+        self._lock = threading.Lock()
+        if reload_seconds > 0:
+            threading.Thread(target=self._watch, name='rules-reload', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_seconds)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking {self.path} for changes: {e}")
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def current(self) -> RuleSet:
+        return self.rules
+
+    def check(self) -> bool:
+        """
+        Recompiles the file if it changed since it was last loaded. Returns whether new rules were loaded.
+        """
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp is None or stamp == self._stamp:
+                return False
+            self._stamp = stamp
+            try:
+                rules = load_rules(self.path, self.attributes, self.outputs)
+            except (OSError, RulesError) as e:
+                self.reload_errors += 1
+                logger.error(f"Keeping rules version {self.rules.version}: {e}")
+                return False
+            self.reloads += 1
+            logger.info(f"Loaded rules version {rules.version} from {self.path} ({len(rules.table)} combinations)")
+            self.rules = rules
+            return True
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "combinations": len(self.rules.table),
+            "rules": len(set(self.rules.rule_of.values())),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check rules files for gaps and overlaps")
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.paths:
+        try:
+            rules = load_rules(path)
+        except (OSError, RulesError) as e:
+            print(f"FAIL {e}")
+            failed = True
+            continue
+        print(f"OK   {path}: version {rules.version}, {len(set(rules.rule_of.values()))} rules, "
+              f"{len(rules.table)} combinations, {len(rules.outcomes())} outcomes")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import os
+import re
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import register_gauges
+
+logger = logging.getLogger(__name__)
+
+# Semantic cache for model answers. Questions are embedded locally into 384-dim vectors and looked up
+# by cosine similarity among the answers stored for the same context (recommendation, prompt version
+# and model), so near-duplicate questions reuse one answer instead of calling the model again.
+#
+# The index is Milvus Lite (pymilvus) when installed, as prototyped in test.ipynb, and an in-memory
+# numpy index otherwise. The default embedder hashes word and character n-grams: it needs no model
+# download and matches rewordings that share most of their words ("what's the difference between
+# LDT and CDx?", "difference between ldt and cdx"). Set SEMANTIC_CACHE_EMBEDDER=minilm to use
+# sentence-transformers' all-MiniLM-L6-v2, which also matches paraphrases ("how is LDT different
+# from CDx?"); lower SEMANTIC_CACHE_THRESHOLD to around 0.75 with it.
+
+try:
+    from pymilvus import MilvusClient
+except ImportError:  # Optional: fall back to the in-memory index
+    MilvusClient = None
+
+# Configuration (use environment variables or configuration files in production)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+# Minimum cosine similarity between two questions for one to reuse the other's answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.8'))
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', '1000'))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', str(24 * 60 * 60)))
+# Milvus Lite database file (empty keeps the index in memory only)
+SEMANTIC_CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', '')
+SEMANTIC_CACHE_EMBEDDER = os.getenv('SEMANTIC_CACHE_EMBEDDER', 'hashing')
+
+EMBEDDING_DIM = 384
+COLLECTION_NAME = 'semantic_cache'
+WORD_RE = re.compile(r"[a-z0-9+]+")
+
+Match = Tuple[int, float, str, float]  # (id, similarity, answer, created)
+
+
+class HashingEmbedder:
+    """
+    Embeds text by hashing words, word pairs and character trigrams into EMBEDDING_DIM signed buckets.
+    Deterministic across processes, so vectors stored in a Milvus file stay comparable after restarts.
+    """
+
+    dim = EMBEDDING_DIM
+
+    def embed(self, text: str) -> np.ndarray:
+        words = WORD_RE.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        features += [f"#{word[i:i + 3]}" for word in words for i in range(max(1, len(word) - 2))]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            digest = zlib.crc32(feature.encode())
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class MiniLMEmbedder:
+    """
+    sentence-transformers all-MiniLM-L6-v2, loaded on first use.
+    """
+
+    dim = EMBEDDING_DIM
+
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def make_embedder(name: str = SEMANTIC_CACHE_EMBEDDER):
+    if name == 'minilm':
+        return MiniLMEmbedder()
+    return HashingEmbedder()
+
+
+class MemoryIndex:
+    """
+    Exact cosine search over normalized vectors held in memory.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self._ids: List[int] = []
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._rows: Dict[int, Dict] = {}
+
+    def search(self, vector: np.ndarray, context: str) -> Optional[Match]:
+        if not self._ids:
+            return None
+        scores = self._vectors @ vector
+        for position in np.argsort(-scores):
+            row = self._rows[self._ids[position]]
+            if row["context"] == context:
+                return self._ids[position], float(scores[position]), row["answer"], row["created"]
+        return None
+
+    def insert(self, entry_id: int, vector: np.ndarray, row: Dict):
+        self._ids.append(entry_id)
+        self._vectors = np.vstack([self._vectors, vector])
+        self._rows[entry_id] = row
+
+    def delete(self, entry_ids: List[int]):
+        dropped = set(entry_ids)
+        keep = [i for i, entry_id in enumerate(self._ids) if entry_id not in dropped]
+        self._ids = [self._ids[i] for i in keep]
+        self._vectors = self._vectors[keep]
+        for entry_id in entry_ids:
+            self._rows.pop(entry_id, None)
+
+    def entries(self) -> List[Dict]:
+        return [{"id": entry_id, **row} for entry_id, row in self._rows.items()]
+
+
+class MilvusIndex:
+    """
+    Milvus Lite collection with cosine similarity, filtered by context hash.
+    """
+
+    def __init__(self, path: str, dim: int = EMBEDDING_DIM, collection_name: str = COLLECTION_NAME):
+        self.collection_name = collection_name
+        self._client = MilvusClient(path)
+        if not self._client.has_collection(collection_name):
+            self._client.create_collection(collection_name=collection_name, dimension=dim, metric_type='COSINE', auto_id=False)
+
+    def search(self, vector: np.ndarray, context: str) -> Optional[Match]:
+        results = self._client.search(
+            collection_name=self.collection_name,
+            data=[vector.tolist()],
+            filter=f'context == "{context}"',
+            limit=1,
+            output_fields=["answer", "created"],
+        )
+        if not results or not results[0]:
+            return None
+        hit = results[0][0]
+        return hit["id"], float(hit["distance"]), hit["entity"]["answer"], hit["entity"]["created"]
+
+    def insert(self, entry_id: int, vector: np.ndarray, row: Dict):
+        self._client.insert(collection_name=self.collection_name, data=[{"id": entry_id, "vector": vector.tolist(), **row}])
+
+    def delete(self, entry_ids: List[int]):
+        if entry_ids:
+            self._client.delete(collection_name=self.collection_name, ids=list(entry_ids))
+
+    def entries(self) -> List[Dict]:
+        return self._client.query(
+            collection_name=self.collection_name,
+            filter='id >= 0',
+            output_fields=["id", "context", "prompt_version", "created"],
+        )
+
+
+class SemanticCache:
+    """
+    Thread-safe semantic cache of answers keyed by question similarity within a context.
+    Evicts the least recently used entries beyond max_entries and expires entries after ttl_seconds.
+    Entries stored under another prompt version are dropped when the cache is created.
+    """
+
+    def __init__(
+        self,
+        prompt_version: str,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL,
+        path: str = SEMANTIC_CACHE_PATH,
+        embedder=None,
+    ):
+        self.prompt_version = prompt_version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder or make_embedder()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._next_id = time.time_ns()
+        if path and MilvusClient is not None:
+            self._index = MilvusIndex(path, self.embedder.dim)
+        else:
+            if path:
+                logger.warning("pymilvus is not installed, keeping the semantic cache in memory")
+            self._index = MemoryIndex(self.embedder.dim)
+        # Recency order of the live entries, oldest first
+        self._recency: "OrderedDict[int, float]" = OrderedDict()
+        self._invalidate_other_versions()
+
+    @staticmethod
+    def make_context(*parts: str) -> str:
+        """
+        Hashes the parts that must match exactly (e.g. recommendation and model id) into a filter key.
+        """
+        return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+    def _invalidate_other_versions(self):
+        stale = []
+        for entry in sorted(self._index.entries(), key=lambda entry: entry["created"]):
+            if entry.get("prompt_version") != self.prompt_version:
+                stale.append(entry["id"])
+            else:
+                self._recency[entry["id"]] = entry["created"]
+        self._index.delete(stale)
+        if stale:
+            logger.info(f"Dropped {len(stale)} semantic cache entries from other prompt versions")
+
+    def _versioned(self, context: str) -> str:
+        return self.make_context(context, self.prompt_version)
+
+    def get(self, question: str, context: str) -> Optional[str]:
+        vector = self.embedder.embed(question)
+        with self._lock:
+            match = self._index.search(vector, self._versioned(context))
+            if match is not None:
+                entry_id, similarity, answer, created = match
+                if time.time() - created > self.ttl_seconds:
+                    self._index.delete([entry_id])
+                    self._recency.pop(entry_id, None)
+                elif similarity >= self.threshold:
+                    self._recency.move_to_end(entry_id)
+                    self.hits += 1
+                    return answer
+            self.misses += 1
+            return None
+
+    def set(self, question: str, context: str, answer: str):
+        vector = self.embedder.embed(question)
+        with self._lock:
+            self._next_id += 1
+            created = time.time()
+            self._index.insert(self._next_id, vector, {
+                "context": self._versioned(context),
+                "prompt_version": self.prompt_version,
+                "answer": answer,
+                "created": created,
+            })
+            self._recency[self._next_id] = created
+            evicted = []
+            while len(self._recency) > self.max_entries:
+                evicted.append(self._recency.popitem(last=False)[0])
+            self._index.delete(evicted)
+            self.evictions += len(evicted)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._recency),
+            }
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache(prompt_version: str) -> SemanticCache:
+    """
+    Returns the process-wide semantic cache, creating it on first use.
+    """
+    global _semantic_cache
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(prompt_version)
+                register_gauges('bot_semantic_cache', _semantic_cache.stats)
+    return _semantic_cache
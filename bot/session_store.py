@@ -0,0 +1,468 @@
+import os
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from metrics import register_gauges
+
+logger = logging.getLogger(__name__)
+
+# Conversation state kept outside the Streamlit process, so any replica behind a load balancer can
+# serve any session and idle sessions cost a few hundred bytes instead of live Python objects.
+# A session's state is loaded when one of its reruns starts and saved when it ends.
+#
+# State is packed into a small binary record (optionally zlib-compressed). History is capped to the
+# welcome message plus the latest SESSION_HISTORY_MAX_MESSAGES, and message texts longer than
+# SESSION_INTERN_BYTES (product descriptions with their HTML footer, which are the same for every
+# session given the same recommendation) are stored once per store by content hash and referenced
+# from each session.
+#
+# Backends: "memory" (per process, the default), "sqlite" (a file shared by replicas on one host)
+# and "redis" (any Redis-compatible server such as Redis, Valkey or KeyDB; needs the redis package).
+
+try:
+    import redis
+except ImportError:  # Optional: only needed for SESSION_BACKEND=redis
+    redis = None
+
+# Configuration (use environment variables or configuration files in production)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+SESSION_TTL = float(os.getenv('SESSION_TTL', str(24 * 60 * 60)))
+SESSION_HISTORY_MAX_MESSAGES = int(os.getenv('SESSION_HISTORY_MAX_MESSAGES', '40'))
+SESSION_INTERN_BYTES = int(os.getenv('SESSION_INTERN_BYTES', '512'))
+SESSION_COMPRESS_BYTES = int(os.getenv('SESSION_COMPRESS_BYTES', '256'))
+# Sessions kept by the memory backend before the least recently used are dropped
+SESSION_MEMORY_MAX_SESSIONS = int(os.getenv('SESSION_MEMORY_MAX_SESSIONS', '100000'))
+SESSION_SQLITE_PATH = os.getenv('SESSION_SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db'))
+SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+SESSION_REDIS_PREFIX = os.getenv('SESSION_REDIS_PREFIX', 'tsb:')
+# Decoded interned texts kept in process, shared by every session that shows them
+SESSION_BLOB_CACHE_SIZE = int(os.getenv('SESSION_BLOB_CACHE_SIZE', '256'))
+
+# Keys of st.session_state that are persisted
+SESSION_KEYS = ('chat_history', 'attributes', 'welcome_message_displayed')
+
+FORMAT_VERSION = 1
+FLAG_COMPRESSED = 0x80
+FLAG_WELCOME = 0x01
+ROLES = ('user', 'assistant')
+ROLE_INTERNED = 0x80
+HASH_BYTES = 16
+# Expired sessions and unused texts are swept every this many saves
+SWEEP_EVERY = 1000
+
+
+def default_state() -> Dict[str, Any]:
+    return {
+        "chat_history": [],
+        "attributes": {"cancer_type": "Unknown", "stage": "Unknown", "therapy_status": "Unknown"},
+        "welcome_message_displayed": False,
+    }
+
+
+def text_hash(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()[:HASH_BYTES]
+
+
+def cap_history(chat_history: List[Dict[str, str]], max_messages: int = SESSION_HISTORY_MAX_MESSAGES) -> List[Dict[str, str]]:
+    """
+    Keeps the first message (the welcome) and the latest max_messages.
+    """
+    if len(chat_history) <= max_messages + 1:
+        return chat_history
+    return chat_history[:1] + chat_history[-max_messages:]
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def pack_state(state: Dict[str, Any], blobs: Dict[bytes, bytes], intern_bytes: int = SESSION_INTERN_BYTES) -> bytes:
+    """
+    Packs the session state. Texts of at least intern_bytes are replaced by their hash and added to blobs.
+
+    Layout: flags byte, attribute count, (key, value) strings, message count, then per message a role
+    byte and either a length-prefixed text or, for interned texts, the text's hash.
+    """
+    flags = FLAG_WELCOME if state.get("welcome_message_displayed") else 0
+    attributes = state.get("attributes", {})
+    parts = [struct.pack('<B', len(attributes))]
+    for key, value in attributes.items():
+        parts += [_pack_str(key), _pack_str(value)]
+    history = state.get("chat_history", [])
+    parts.append(struct.pack('<I', len(history)))
+    for message in history:
+        role = ROLES.index(message["role"])
+        data = message["text"].encode('utf-8')
+        if len(data) >= intern_bytes:
+            digest = text_hash(data)
+            blobs[digest] = data
+            parts += [struct.pack('<B', role | ROLE_INTERNED), digest]
+        else:
+            parts += [struct.pack('<BI', role, len(data)), data]
+    body = b''.join(parts)
+    if len(body) >= SESSION_COMPRESS_BYTES:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            flags |= FLAG_COMPRESSED
+            body = compressed
+    return struct.pack('<BB', FORMAT_VERSION, flags) + body
+
+
+def unpack_state(record: bytes, resolve) -> Dict[str, Any]:
+    """
+    Unpacks a record from pack_state. resolve maps a list of interned text hashes to the texts.
+    """
+    version, flags = struct.unpack_from('<BB', record)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported session format {version}")
+    body = zlib.decompress(record[2:]) if flags & FLAG_COMPRESSED else record[2:]
+    offset = 0
+
+    def read_str():
+        nonlocal offset
+        (length,) = struct.unpack_from('<H', body, offset)
+        offset += 2 + length
+        return body[offset - length:offset].decode('utf-8')
+
+    (count,) = struct.unpack_from('<B', body, offset)
+    offset += 1
+    attributes = {}
+    for _ in range(count):
+        key = read_str()
+        attributes[key] = read_str()
+    (count,) = struct.unpack_from('<I', body, offset)
+    offset += 4
+    history = []
+    for _ in range(count):
+        (role,) = struct.unpack_from('<B', body, offset)
+        offset += 1
+        if role & ROLE_INTERNED:
+            text = body[offset:offset + HASH_BYTES]
+            offset += HASH_BYTES
+        else:
+            (length,) = struct.unpack_from('<I', body, offset)
+            offset += 4 + length
+            text = body[offset - length:offset].decode('utf-8')
+        history.append({"role": ROLES[role & ~ROLE_INTERNED], "text": text})
+    texts = resolve([message["text"] for message in history if isinstance(message["text"], bytes)])
+    for message in history:
+        if isinstance(message["text"], bytes):
+            message["text"] = texts[message["text"]]
+    return {"chat_history": history, "attributes": attributes, "welcome_message_displayed": bool(flags & FLAG_WELCOME)}
+
+
+class SessionStore:
+    """
+    Loads and saves session state through a backend's raw record and text operations.
+    Subclasses implement _read, _write, _remove, _read_blobs, _write_blobs and _counts.
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL, max_messages: int = SESSION_HISTORY_MAX_MESSAGES):
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.loads = 0
+        self.saves = 0
+        self.missing = 0
+        self.bytes_saved = 0
+        self._blob_cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._stats_lock = threading.Lock()
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        """
+        The session's state, or a fresh one for a new or expired session.
+        """
+        record = self._read(session_id)
+        with self._stats_lock:
+            self.loads += 1
+            if record is None:
+                self.missing += 1
+        if record is None:
+            return default_state()
+        try:
+            return unpack_state(record, self._resolve)
+        except (KeyError, ValueError, struct.error, zlib.error) as e:
+            logger.error(f"Discarding unreadable state of session {session_id}: {e}")
+            return default_state()
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        state = {**state, "chat_history": cap_history(state.get("chat_history", []), self.max_messages)}
+        blobs = {}
+        record = pack_state(state, blobs)
+        if blobs:
+            self._write_blobs(blobs)
+        self._write(session_id, record)
+        with self._stats_lock:
+            self.saves += 1
+            self.bytes_saved += len(record)
+            sweep = self.saves % SWEEP_EVERY == 0
+        if sweep:
+            self.sweep()
+
+    def delete(self, session_id: str):
+        self._remove(session_id)
+
+    def sweep(self):
+        """
+        Drops expired sessions and texts no session references. Backends with native expiry do nothing.
+        """
+
+    def _resolve(self, hashes: List[bytes]) -> Dict[bytes, str]:
+        texts, missing = {}, []
+        with self._stats_lock:
+            for digest in hashes:
+                if digest in self._blob_cache:
+                    self._blob_cache.move_to_end(digest)
+                    texts[digest] = self._blob_cache[digest]
+                else:
+                    missing.append(digest)
+        if missing:
+            fetched = self._read_blobs(missing)
+            with self._stats_lock:
+                for digest in missing:
+                    if fetched.get(digest) is None:
+                        raise KeyError(f"interned text {digest.hex()} is missing")
+                    text = fetched[digest].decode('utf-8')
+                    texts[digest] = self._blob_cache.setdefault(digest, text)
+                while len(self._blob_cache) > SESSION_BLOB_CACHE_SIZE:
+                    self._blob_cache.popitem(last=False)
+        return texts
+
+    def stats(self) -> Dict[str, float]:
+        counts = self._counts()
+        with self._stats_lock:
+            return {
+                "loads": self.loads,
+                "saves": self.saves,
+                "new_sessions": self.missing,
+                "avg_record_bytes": self.bytes_saved / self.saves if self.saves else 0.0,
+                **counts,
+            }
+
+    def _read(self, session_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _write(self, session_id: str, record: bytes):
+        raise NotImplementedError
+
+    def _remove(self, session_id: str):
+        raise NotImplementedError
+
+    def _read_blobs(self, hashes: List[bytes]) -> Dict[bytes, bytes]:
+        raise NotImplementedError
+
+    def _write_blobs(self, blobs: Dict[bytes, bytes]):
+        raise NotImplementedError
+
+    def _counts(self) -> Dict[str, int]:
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Packed sessions in this process, least recently used dropped beyond max_sessions.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MEMORY_MAX_SESSIONS, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (saved at, record)
+        self._blobs: Dict[bytes, list] = {}  # hash -> [last used, text]
+        self._lock = threading.Lock()
+
+    def _read(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def _write(self, session_id, record):
+        with self._lock:
+            self._sessions[session_id] = (time.time(), record)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _remove(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _read_blobs(self, hashes):
+        with self._lock:
+            return {digest: self._blobs[digest][1] for digest in hashes}
+
+    def _write_blobs(self, blobs):
+        now = time.time()
+        with self._lock:
+            for digest, data in blobs.items():
+                self._blobs.setdefault(digest, [now, data])[0] = now
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            for session_id in [session_id for session_id, (saved, _) in self._sessions.items() if now - saved > self.ttl_seconds]:
+                del self._sessions[session_id]
+            # A text is re-marked as used every time a session referencing it is saved
+            for digest in [digest for digest, (used, _) in self._blobs.items() if now - used > self.ttl_seconds]:
+                del self._blobs[digest]
+
+    def _counts(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "session_bytes": sum(len(record) for _, record in self._sessions.values()),
+                "texts": len(self._blobs),
+                "text_bytes": sum(len(data) for _, data in self._blobs.values()),
+            }
+
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, saved_at REAL NOT NULL, record BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_sessions_saved_at ON sessions (saved_at);
+CREATE TABLE IF NOT EXISTS texts (hash BLOB PRIMARY KEY, used_at REAL NOT NULL, data BLOB NOT NULL);
+'''
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite file that every replica on the host opens. Each thread gets its own connection.
+    """
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _read(self, session_id):
+        row = self._connection().execute(
+            'SELECT record FROM sessions WHERE id = ? AND saved_at >= ?', (session_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _write(self, session_id, record):
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO sessions (id, saved_at, record) VALUES (?, ?, ?)', (session_id, time.time(), record))
+
+    def _remove(self, session_id):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def _read_blobs(self, hashes):
+        placeholders = ','.join('?' * len(hashes))
+        rows = self._connection().execute(f'SELECT hash, data FROM texts WHERE hash IN ({placeholders})', hashes).fetchall()
+        return {bytes(digest): data for digest, data in rows}
+
+    def _write_blobs(self, blobs):
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany('INSERT OR IGNORE INTO texts (hash, used_at, data) VALUES (?, ?, ?)', [(digest, now, data) for digest, data in blobs.items()])
+            connection.executemany('UPDATE texts SET used_at = ? WHERE hash = ?', [(now, digest) for digest in blobs])
+
+    def sweep(self):
+        # A text is re-marked as used every time a session referencing it is saved
+        cutoff = time.time() - self.ttl_seconds
+        with self._connection() as connection:
+            connection.execute('DELETE FROM sessions WHERE saved_at < ?', (cutoff,))
+            connection.execute('DELETE FROM texts WHERE used_at < ?', (cutoff,))
+
+    def _counts(self):
+        connection = self._connection()
+        sessions, session_bytes = connection.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(record)), 0) FROM sessions').fetchone()
+        texts, text_bytes = connection.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM texts').fetchone()
+        return {"sessions": sessions, "session_bytes": session_bytes, "texts": texts, "text_bytes": text_bytes}
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in a Redis-compatible server, expired by the server after ttl_seconds without a save.
+    """
+
+    def __init__(self, client=None, url: str = SESSION_REDIS_URL, prefix: str = SESSION_REDIS_PREFIX, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("SESSION_BACKEND=redis requires the redis package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._ttl = max(1, int(self.ttl_seconds))
+        # Texts this process stored recently, only their expiry is extended on later saves
+        self._written: Dict[bytes, float] = {}
+
+    def _key(self, kind: str, name) -> str:
+        return f"{self.prefix}{kind}:{name.hex() if isinstance(name, bytes) else name}"
+
+    def _read(self, session_id):
+        return self.client.get(self._key('s', session_id))
+
+    def _write(self, session_id, record):
+        self.client.set(self._key('s', session_id), record, ex=self._ttl)
+
+    def _remove(self, session_id):
+        self.client.delete(self._key('s', session_id))
+
+    def _read_blobs(self, hashes):
+        return dict(zip(hashes, self.client.mget([self._key('t', digest) for digest in hashes])))
+
+    def _write_blobs(self, blobs):
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for digest, data in blobs.items():
+            if now - self._written.get(digest, 0) < self._ttl / 2:
+                pipeline.expire(self._key('t', digest), self._ttl)
+            else:
+                pipeline.set(self._key('t', digest), data, ex=self._ttl)
+                self._written[digest] = now
+        pipeline.execute()
+
+
+def make_session_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend == 'redis':
+        return RedisSessionStore()
+    return MemorySessionStore()
+
+
+def persisted_state(state: Dict[str, Any], keys: Iterable[str] = SESSION_KEYS) -> Dict[str, Any]:
+    """
+    The persisted part of a st.session_state (or any mapping).
+    """
+    return {key: state[key] for key in keys if key in state}
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """
+    Returns the process-wide session store, creating it on first use.
+    """
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = make_session_store()
+                register_gauges('bot_sessions', _session_store.stats)
+    return _session_store
@@ -0,0 +1,243 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Retrieval index over the product spec sheets. `build` chunks and embeds every spec sheet in a
+# directory into a persistent index (<path>.npz with the vectors, <path>.json with the chunks);
+# at answer time `search` returns only the top-k chunks of the recommended products, which go into
+# the description prompt instead of hard-coded product facts.
+#
+#   python bot/spec_index.py build spec_sheets/
+#   python bot/spec_index.py query "How many genes does CDx evaluate?" --products "Guardant360 CDx"
+#
+# Spec sheets can be PDF (needs pypdf), .txt or .md. The product is taken from the file name,
+# e.g. Guardant360+CDx+Specification+Sheet.pdf.
+#
+# numpy and the embedders are imported by SpecIndex itself, so spec_index_available, which the
+# pipeline checks at import, does not load them.
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # Optional: only needed to ingest PDF spec sheets
+    PdfReader = None
+
+# Configuration (use environment variables or configuration files in production)
+SPEC_SHEETS_DIR = os.getenv('SPEC_SHEETS_DIR', 'spec_sheets')
+SPEC_INDEX_PATH = os.getenv('SPEC_INDEX_PATH', 'spec_index')
+SPEC_CHUNK_TOKENS = int(os.getenv('SPEC_CHUNK_TOKENS', '120'))
+# Chunks retrieved per recommended product
+SPEC_TOP_K = int(os.getenv('SPEC_TOP_K', '3'))
+
+SPEC_EXTENSIONS = ('.pdf', '.txt', '.md')
+
+# Product names as they appear in recommendations, with the file-name keywords of their spec sheets.
+# Checked in order, so the plain Guardant360 (LDT) sheet comes last.
+PRODUCTS = [
+    ("Guardant360 TissueNext", "TissueNext", ("tissuenext",)),
+    ("Guardant360 CDx", "CDx", ("cdx",)),
+    ("Guardant Reveal", "Reveal", ("reveal",)),
+    ("Guardant360 Response", "Response", ("response",)),
+    ("Guardant360 LDT", "LDT", ("ldt", "guardant360")),
+]
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+FILE_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def product_for_file(filename: str) -> Optional[str]:
+    words = FILE_WORD_RE.sub(' ', os.path.splitext(os.path.basename(filename))[0].lower())
+    for product, _, keywords in PRODUCTS:
+        if any(keyword in words for keyword in keywords):
+            return product
+    return None
+
+
+def products_in(recommendation: str) -> List[str]:
+    """
+    Lists the products named in a recommendation, e.g. "We recommend **Guardant360 LDT** or **Guardant360 CDx**".
+    """
+    return [product for product, mention, _ in PRODUCTS if mention in recommendation]
+
+
+def read_spec_sheet(path: str) -> str:
+    if path.lower().endswith('.pdf'):
+        if PdfReader is None:
+            raise RuntimeError(f"pypdf is required to read {path}")
+        return '\n\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def chunk_text(text: str, max_tokens: int = SPEC_CHUNK_TOKENS) -> List[str]:
+    """
+    Packs paragraphs into chunks of up to max_tokens, splitting long paragraphs at sentence ends.
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(SENTENCE_RE.split(paragraph))
+
+    chunks, current = [], ''
+    for piece in pieces:
+        candidate = f"{current}\n{piece}" if current else piece
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            candidate = piece
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SpecIndex:
+    """
+    Embedded spec-sheet chunks with exact cosine search, filtered by product.
+    """
+
+    def __init__(self, chunks: List[Dict] = None, vectors=None, embedder=None):
+        import numpy as np
+        from semantic_cache import make_embedder
+        self.embedder = embedder or make_embedder()
+        self.chunks = chunks or []
+        self.vectors = vectors if vectors is not None else np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._products = np.array([chunk["product"] for chunk in self.chunks], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @classmethod
+    def build(cls, spec_dir: str, previous: "SpecIndex" = None, embedder=None) -> "SpecIndex":
+        """
+        Chunks and embeds every spec sheet in spec_dir. Files whose content is unchanged since the
+        previous index reuse its chunks and vectors.
+        """
+        import numpy as np
+        from semantic_cache import make_embedder
+        embedder = embedder or (previous.embedder if previous else make_embedder())
+        reusable = {}
+        if previous is not None:
+            for i, chunk in enumerate(previous.chunks):
+                reusable.setdefault(chunk["sha1"], []).append(i)
+
+        chunks, vectors = [], []
+        for filename in sorted(os.listdir(spec_dir)):
+            path = os.path.join(spec_dir, filename)
+            product = product_for_file(filename)
+            if not filename.lower().endswith(SPEC_EXTENSIONS) or product is None:
+                logger.info(f"Skipping {filename}: not a spec sheet of a known product")
+                continue
+            with open(path, 'rb') as f:
+                sha1 = hashlib.sha1(f.read()).hexdigest()
+            if sha1 in reusable:
+                chunks.extend(previous.chunks[i] for i in reusable[sha1])
+                vectors.extend(previous.vectors[i] for i in reusable[sha1])
+                continue
+            for text in chunk_text(read_spec_sheet(path)):
+                chunks.append({"product": product, "source": filename, "sha1": sha1, "text": text})
+                vectors.append(embedder.embed(text))
+            logger.info(f"Indexed {filename} as {product}")
+        matrix = np.vstack(vectors).astype(np.float32) if vectors else None
+        return cls(chunks, matrix, embedder)
+
+    def search(self, query: str, products: List[str] = None, top_k: int = SPEC_TOP_K) -> List[Tuple[float, Dict]]:
+        """
+        Returns the top_k most similar chunks of each product (or of the whole index) as (score, chunk).
+        The product names are added to the query, since spec sheets name their product near its facts.
+        """
+        import numpy as np
+        if not self.chunks:
+            return []
+        scores = self.vectors @ self.embedder.embed(' '.join([query] + (products or [])))
+        results = []
+        for product in products or [None]:
+            candidates = np.arange(len(self.chunks)) if product is None else np.flatnonzero(self._products == product)
+            best = candidates[np.argsort(-scores[candidates])[:top_k]]
+            results.extend((float(scores[i]), self.chunks[i]) for i in best)
+        return results
+
+    def save(self, path: str = SPEC_INDEX_PATH):
+        import numpy as np
+        np.savez(f"{path}.npz", vectors=self.vectors)
+        with open(f"{path}.json", 'w') as f:
+            json.dump(self.chunks, f)
+
+    @classmethod
+    def load(cls, path: str = SPEC_INDEX_PATH, embedder=None) -> "SpecIndex":
+        import numpy as np
+        with open(f"{path}.json") as f:
+            chunks = json.load(f)
+        with np.load(f"{path}.npz") as stored:
+            vectors = stored["vectors"]
+        return cls(chunks, vectors, embedder)
+
+
+_spec_index = None
+_spec_index_lock = threading.Lock()
+
+
+def spec_index_available(path: str = SPEC_INDEX_PATH) -> bool:
+    return os.path.exists(f"{path}.json") and os.path.exists(f"{path}.npz")
+
+
+def get_spec_index(path: str = SPEC_INDEX_PATH) -> SpecIndex:
+    """
+    Returns the process-wide spec index, loading it on first use.
+    """
+    global _spec_index
+    if _spec_index is None:
+        with _spec_index_lock:
+            if _spec_index is None:
+                _spec_index = SpecIndex.load(path)
+                logger.info(f"Loaded spec index with {len(_spec_index)} chunks from {path}")
+    return _spec_index
+
+
+def spec_excerpts(recommendation: str, question: str = '', top_k: int = SPEC_TOP_K) -> str:
+    """
+    Formats the spec-sheet chunks most relevant to the question for each recommended product.
+    """
+    products = products_in(recommendation)
+    results = get_spec_index().search(question, products, top_k)
+    return '\n\n'.join(f"[{chunk['product']}] {chunk['text']}" for _, chunk in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the spec-sheet retrieval index")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="chunk and embed the spec sheets in a directory")
+    build_parser.add_argument('spec_dir', nargs='?', default=SPEC_SHEETS_DIR)
+    build_parser.add_argument('--index', default=SPEC_INDEX_PATH, help="index path prefix")
+    query_parser = subparsers.add_parser('query', help="print the chunks retrieved for a question")
+    query_parser.add_argument('question')
+    query_parser.add_argument('--products', nargs='*', help="restrict to these products")
+    query_parser.add_argument('--index', default=SPEC_INDEX_PATH, help="index path prefix")
+    query_parser.add_argument('-k', type=int, default=SPEC_TOP_K)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        previous = SpecIndex.load(args.index) if spec_index_available(args.index) else None
+        index = SpecIndex.build(args.spec_dir, previous)
+        index.save(args.index)
+        print(f"Indexed {len(index)} chunks from {args.spec_dir} into {args.index}")
+    else:
+        for score, chunk in SpecIndex.load(args.index).search(args.question, args.products, args.k):
+            print(f"{score:.3f} [{chunk['product']}] {chunk['text']}\n")
+
+
+if __name__ == '__main__':
+    main()
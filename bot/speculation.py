@@ -0,0 +1,124 @@
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict, Iterable, Optional
+
+from context import estimate_tokens
+from metrics import register_gauges
+
+logger = logging.getLogger(__name__)
+
+# Configuration (use environment variables or configuration files in production)
+SPECULATIVE_DESCRIPTIONS = os.getenv('SPECULATIVE_DESCRIPTIONS', 'false').lower() == 'true'
+# Only speculate when the remaining unknowns lead to at most this many distinct recommendations
+SPECULATION_MAX_BRANCHES = int(os.getenv('SPECULATION_MAX_BRANCHES', '3'))
+# Stop speculating for a session once this many generated descriptions were thrown away
+SPECULATION_MAX_WASTED_CALLS = int(os.getenv('SPECULATION_MAX_WASTED_CALLS', '6'))
+SPECULATION_MAX_WORKERS = int(os.getenv('SPECULATION_MAX_WORKERS', '8'))
+# How long the final turn waits for a speculative description that is still running
+SPECULATION_CLAIM_TIMEOUT = float(os.getenv('SPECULATION_CLAIM_TIMEOUT', '30'))
+
+# Shared pool so speculative calls from all sessions are bounded together
+_executor = ThreadPoolExecutor(max_workers=SPECULATION_MAX_WORKERS, thread_name_prefix='speculation')
+
+_stats_lock = threading.Lock()
+_stats = {
+    "started": 0,
+    "hits": 0,
+    "misses": 0,
+    "discarded": 0,
+    "discarded_tokens": 0,
+}
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def speculation_stats() -> Dict[str, float]:
+    """
+    Process-wide speculation counters. discarded_tokens estimates the output tokens generated for branches the user never took.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    claims = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / claims if claims else 0.0
+    return stats
+
+
+class Speculator:
+    """
+    Per-session set of in-flight speculative product descriptions, keyed by recommendation.
+    """
+
+    def __init__(self, generate: Callable[[str], Optional[str]], max_wasted_calls: int = SPECULATION_MAX_WASTED_CALLS):
+        self.generate = generate
+        self.max_wasted_calls = max_wasted_calls
+        self.wasted_calls = 0
+        self._futures: Dict[str, Future] = {}
+
+    def speculate(self, recommendations: Iterable[str]):
+        """
+        Starts generating a description for every recommendation that is not already in flight,
+        and drops in-flight branches that are no longer reachable.
+        """
+        recommendations = list(recommendations)
+        for recommendation in list(self._futures):
+            if recommendation not in recommendations:
+                self._drop(self._futures.pop(recommendation))
+        recommendations = [recommendation for recommendation in recommendations if recommendation not in self._futures]
+        if not recommendations:
+            return
+        if self.wasted_calls + len(recommendations) > self.max_wasted_calls:
+            logger.info(f"Speculation budget exhausted ({self.wasted_calls} wasted calls)")
+            return
+        for recommendation in recommendations:
+            self._futures[recommendation] = _executor.submit(self.generate, recommendation)
+            _count("started")
+        logger.info(f"Speculating descriptions for: {recommendations}")
+
+    def claim(self, recommendation: str, timeout: float = SPECULATION_CLAIM_TIMEOUT) -> Optional[str]:
+        """
+        Returns the speculative description for the recommendation (waiting for it if needed) and discards the others.
+        """
+        future = self._futures.pop(recommendation, None)
+        text_output = None
+        if future is not None:
+            try:
+                text_output = future.result(timeout=timeout)
+            except TimeoutError:
+                logger.info(f"Speculative description for {recommendation} did not finish in {timeout}s")
+            except Exception as e:
+                logger.error(f"Speculative description failed: {e}")
+        _count("hits" if text_output else "misses")
+        self.discard()
+        return text_output
+
+    def discard(self):
+        """
+        Drops every remaining branch, cancelling calls that have not started yet.
+        """
+        for future in self._futures.values():
+            self._drop(future)
+        self._futures = {}
+
+    def _drop(self, future: Future):
+        if future.cancel():
+            return
+        self.wasted_calls += 1
+        _count("discarded")
+        future.add_done_callback(_count_discarded_tokens)
+
+
+def _count_discarded_tokens(future: Future):
+    try:
+        text_output = future.result()
+    except Exception:
+        return
+    if text_output:
+        _count("discarded_tokens", estimate_tokens(text_output))
+
+
+register_gauges('bot_speculation', speculation_stats)
@@ -1,9 +1,13 @@
 import streamlit as st
-import pandas as pd
-import base64
 import warnings
 warnings.filterwarnings("ignore")
 
+from assets import image_bytes
+from patient_store import PATIENT_PAGE_SIZE, PatientStore, get_patient_store, journey_summary
+
+# pandas (and territory.py, which needs it) take about half a second to import and are only used by
+# the tabs shown after login, so they are imported there rather than before the login page renders.
+
 # Set page title and layout
 st.set_page_config(page_title="Customer Order", layout="wide")
 
@@ -38,6 +42,80 @@ h1 {
 </style>
 '''
 
+# Display widths for the images; assets.py serves each image resized to these
+JOURNEY_IMAGE_WIDTH = 1200
+TERRITORY_IMAGE_WIDTH = 1200
+
+@st.cache_data(show_spinner=False, max_entries=256, ttl=600)
+def load_journey(patient_id: int):
+    # Only the selected patient's test history is read
+    return get_patient_store().get_journey(patient_id)
+
+def existing_patient_tab(physician_id: str):
+    store = get_patient_store()
+    prefix = st.text_input("Search patients by name:")
+    # Cursor of the patient before each page visited, for Previous/Next; reset when the search changes
+    if st.session_state.get('patient_search') != prefix:
+        st.session_state.patient_search = prefix
+        st.session_state.patient_page_cursors = [None]
+    cursors = st.session_state.patient_page_cursors
+    page = store.search_patients(physician_id, prefix, after=cursors[-1], limit=PATIENT_PAGE_SIZE + 1)
+    has_next_page = len(page) > PATIENT_PAGE_SIZE
+    page = page[:PATIENT_PAGE_SIZE]
+    if not page:
+        st.write("No patients found.")
+        return
+
+    names = {patient["id"]: patient["name"] for patient in page}
+    selected_id = st.selectbox("Select an existing Patient:", list(names), format_func=names.get)
+    previous_col, next_col = st.columns(2)
+    with previous_col:
+        if st.button("Previous page", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with next_col:
+        if st.button("Next page", disabled=not has_next_page):
+            cursors.append(PatientStore.cursor(page[-1]))
+            st.rerun()
+
+    journey = load_journey(selected_id)
+    st.header('Patient Summary:')
+    st.write(journey_summary(journey))
+    if journey["journey_image"]:
+        st.image(image_bytes(journey["journey_image"], JOURNEY_IMAGE_WIDTH), caption=f"{journey['name']}'s Patient Journey")
+    elif journey["tests"]:
+        import pandas as pd
+        st.dataframe(pd.DataFrame(journey["tests"]), hide_index=True)
+
+def territory_tab(rep_id: str, display_name: str):
+    import pandas as pd
+    from territory import REP_TERRITORIES, TERRITORY_TREND_WEEKS, get_territory_analytics
+    analytics = get_territory_analytics()
+    territory, region = analytics.rep_territories.get(rep_id, REP_TERRITORIES.get(rep_id, ("your", "")))
+    st.title(f'{display_name}, Here is your **{territory}** Territory Overview')
+    if rep_id not in analytics.reps():
+        # No order events loaded for this rep yet
+        st.image(image_bytes('territory_overview', TERRITORY_IMAGE_WIDTH), caption="My Territory Performance")
+        return
+
+    summary = analytics.rep_summary(rep_id)
+    st.caption(f"{region} region, weeks through {summary['as_of']}")
+    recent = f"orders_last_{TERRITORY_TREND_WEEKS}w"
+    for col, (level, row) in zip(st.columns(3), summary["totals"].iterrows()):
+        name = "Your" if level == 'rep' else row['name']
+        with col:
+            st.metric(f"{name} orders, last {TERRITORY_TREND_WEEKS} weeks", f"{row[recent]:,}",
+                      delta=None if pd.isna(row['change']) else f"{row['change']:+.0%} on the {TERRITORY_TREND_WEEKS} weeks before",
+                      help=f"{row['orders']:,} orders in total")
+            st.metric(f"{name} ordering NPIs", f"{row['npis']:,}")
+    st.subheader("Orders by test")
+    st.bar_chart(summary["orders_by_test"][['rep']])
+    st.dataframe(summary["orders_by_test"].rename(columns={'rep': 'You', 'territory': territory, 'region': region}))
+    st.subheader("Weekly orders")
+    st.line_chart(summary["weekly"][['rep']])
+    st.subheader("New ordering NPIs per week")
+    st.bar_chart(summary["new_npis_weekly"])
+
 # Function to check user credentials
 def check_credentials(username):
     # Allow access only for specific users
@@ -88,15 +166,6 @@ def main():
                         "salesrep1": "Rob",
                         "salesrep2": "Alice"
                     }
-                    territory = {
-                        'salesrep1': 'Albany',
-                        'salesrep2': 'San Francisco'
-                    }
-                    region = {
-                        'salesrep1': 'Northeast',
-                        'salesrep2': 'West'
-                    }
-
                     # Safely get the display name
                     user_display_name = names.get(username, username)
 
@@ -132,23 +201,12 @@ def main():
                 # Existing GH Patient Tab (only for doctors)
                 if username not in ["salesrep1", "salesrep2"]:
                     with tab2:
-                        existing_customers = ["Patient A", "Patient B"]
-                        selected_customer = st.selectbox("Select an existing Patient:", existing_customers)
-
-                        if selected_customer == "Patient A":
-                            st.header('Patient Summary:')
-                            st.write('Patient A with CRC cancer started the journey at GH during stage III with a single **Reveal** monitoring test and came back when the cancer progressed to stage IV for **G360**. They then got on the 1st line lung and had no response to therapy thus getting an other **G360** and are currently following up with **Reveal**.')
-                            st.image('https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/images/Patient+1.png', caption="Patient A's Patient Journey")
-                        elif selected_customer == "Patient B":
-                            st.header('Patient Summary:')
-                            st.write('Patient B came in during late stage with CRC cancer and ordered **G360** and are currently monitoring through **Reveal** test. ')
-                            st.image('https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/images/Patient+2.png', use_column_width=True, caption="Patient B's Patient Journey")
+                        existing_patient_tab(username)
 
                 # My Territory Performance Tab (only for sales reps)
                 if username in ["salesrep1", "salesrep2"]:
                     with tab3:
-                        st.title(f'{names[username]}, Here is your **{territory[username]}** Territory Overview')
-                        st.image('https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/images/Field+Rep+Persona+at+NPI.png', caption="My Territory Performance")
+                        territory_tab(username, names[username])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
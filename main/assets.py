@@ -0,0 +1,148 @@
+import io
+import os
+import json
+import hashlib
+import logging
+import argparse
+import threading
+import urllib.request
+
+import streamlit as st
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Image assets for the portal. Each image is resolved once to a local, content-hashed cache (from the
+# copy in main/ when there is one, otherwise from S3), resized to the width it is displayed at and
+# re-encoded as WebP. Pages get the bytes through st.cache_data keyed by the content hash, so reruns
+# reuse them and Streamlit serves them under stable media URLs the browser can cache.
+#
+#   python main/assets.py --widths 800 1200    # build the variants ahead of time
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+S3_IMAGES = 'https://2024-q4-hackathon-team5.s3.us-west-2.amazonaws.com/images'
+
+# Configuration (use environment variables or configuration files in production)
+ASSET_CACHE_DIR = os.getenv('ASSET_CACHE_DIR', os.path.join(ASSET_DIR, '.asset_cache'))
+ASSET_FORMAT = os.getenv('ASSET_FORMAT', 'webp')
+ASSET_QUALITY = int(os.getenv('ASSET_QUALITY', '80'))
+ASSET_DOWNLOAD_TIMEOUT = float(os.getenv('ASSET_DOWNLOAD_TIMEOUT', '10'))
+
+# Logical name -> (file in main/, S3 URL used when the file is missing)
+ASSETS = {
+    "patient_a_journey": ("NPI Persona Patient 1.png", f"{S3_IMAGES}/Patient+1.png"),
+    "patient_b_journey": ("NPI Persona Patient 2.png", f"{S3_IMAGES}/Patient+2.png"),
+    "territory_overview": ("Field Rep Persona at NPI.png", f"{S3_IMAGES}/Field+Rep+Persona+at+NPI.png"),
+    "background": ("hackathonbackgroundimage.png", None),
+    "title_background": ("short_bg.png", None),
+}
+
+_lock = threading.Lock()
+# (path, mtime, size) -> content hash, so unchanged local files are not re-read on every rerun
+_local_hashes = {}
+
+
+def _cache_path(*parts: str) -> str:
+    path = os.path.join(ASSET_CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _downloaded_hashes() -> dict:
+    try:
+        with open(_cache_path('downloads.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def resolve(name: str) -> str:
+    """
+    Stores the original image in the cache and returns its content hash.
+    Local files are re-hashed when they change; S3 images are downloaded once per URL.
+    """
+    filename, url = ASSETS[name]
+    local_path = os.path.join(ASSET_DIR, filename)
+    with _lock:
+        if os.path.exists(local_path):
+            stat = os.stat(local_path)
+            file_key = (local_path, stat.st_mtime_ns, stat.st_size)
+            if file_key in _local_hashes and os.path.exists(_cache_path('originals', _local_hashes[file_key])):
+                return _local_hashes[file_key]
+            with open(local_path, 'rb') as f:
+                data = f.read()
+        else:
+            downloads = _downloaded_hashes()
+            if url in downloads and os.path.exists(_cache_path('originals', downloads[url])):
+                return downloads[url]
+            if url is None:
+                raise FileNotFoundError(local_path)
+            logger.info(f"Downloading {url}")
+            with urllib.request.urlopen(url, timeout=ASSET_DOWNLOAD_TIMEOUT) as response:
+                data = response.read()
+            downloads[url] = hashlib.sha256(data).hexdigest()[:16]
+            _write_atomic(_cache_path('downloads.json'), json.dumps(downloads).encode())
+        content_hash = hashlib.sha256(data).hexdigest()[:16]
+        original_path = _cache_path('originals', content_hash)
+        if not os.path.exists(original_path):
+            _write_atomic(original_path, data)
+        if os.path.exists(local_path):
+            _local_hashes[file_key] = content_hash
+        return content_hash
+
+
+def build_variant(content_hash: str, width: int, fmt: str = ASSET_FORMAT, quality: int = ASSET_QUALITY) -> bytes:
+    """
+    Returns the original resized to at most width pixels wide and encoded as fmt, building it on first use.
+    """
+    variant_path = _cache_path('variants', f"{content_hash}-{width}-q{quality}.{fmt}")
+    if os.path.exists(variant_path):
+        with open(variant_path, 'rb') as f:
+            return f.read()
+    with Image.open(_cache_path('originals', content_hash)) as image:
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if fmt == 'jpeg' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt.upper(), quality=quality, method=6 if fmt == 'webp' else None)
+    data = buffer.getvalue()
+    _write_atomic(variant_path, data)
+    return data
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _variant_bytes(content_hash: str, width: int, fmt: str, quality: int) -> bytes:
+    # Keyed by content hash, so a changed image gets a new entry and the old one ages out
+    return build_variant(content_hash, width, fmt, quality)
+
+
+def image_bytes(name: str, width: int, fmt: str = ASSET_FORMAT, quality: int = ASSET_QUALITY) -> bytes:
+    """
+    Bytes of the named image sized for display at width pixels, for st.image.
+    """
+    return _variant_bytes(resolve(name), width, fmt, quality)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the resized image variants used by the portal")
+    parser.add_argument('--widths', type=int, nargs='+', default=[800, 1200])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for name, (filename, _) in ASSETS.items():
+        content_hash = resolve(name)
+        original_size = os.path.getsize(_cache_path('originals', content_hash))
+        sizes = ', '.join(f"{width}px {len(build_variant(content_hash, width)) // 1024}KB" for width in args.widths)
+        print(f"{name:<20} {original_size // 1024}KB original -> {sizes}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import assets
+
+# Image payload of each portal page before (full-size PNGs) and after (resized WebP variants from
+# assets.py), with the transfer time on a slow clinic connection, plus the server-side cost of
+# producing the variants cold, from the disk cache and from st.cache_data.
+#
+#   python main/bench_assets.py --mbps 5
+
+PAGES = {
+    "Existing GH Patient: Patient A": [("patient_a_journey", 1200)],
+    "Existing GH Patient: Patient B": [("patient_b_journey", 1200)],
+    "Sales Enhancer": [("territory_overview", 1200)],
+}
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark portal image payloads before and after the asset pipeline")
+    parser.add_argument('--mbps', type=float, default=5.0, help="connection speed for the transfer estimate (megabits/s)")
+    args = parser.parse_args()
+    bytes_per_second = args.mbps * 1_000_000 / 8
+
+    assets.ASSET_CACHE_DIR = tempfile.mkdtemp(prefix='asset_cache_')
+    try:
+        print(f"{'page':<32} {'before':>9} {'after':>9} {'load before':>12} {'load after':>11}")
+        for page, images in PAGES.items():
+            before = sum(os.path.getsize(os.path.join(assets.ASSET_DIR, assets.ASSETS[name][0])) for name, _ in images)
+            after = sum(len(assets.image_bytes(name, width)) for name, width in images)
+            print(
+                f"{page:<32} {before / 1024:7.0f}KB {after / 1024:7.0f}KB "
+                f"{before / bytes_per_second:11.2f}s {after / bytes_per_second:10.2f}s"
+            )
+
+        content_hash = assets.resolve("patient_a_journey")
+        shutil.rmtree(os.path.join(assets.ASSET_CACHE_DIR, 'variants'))
+        _, cold = timed(lambda: assets.build_variant(content_hash, 800))
+        _, disk = timed(lambda: assets.build_variant(content_hash, 800))
+        assets.image_bytes("patient_a_journey", 800)
+        _, memory = timed(lambda: assets.image_bytes("patient_a_journey", 800))
+        print(f"\nvariant: cold build {cold * 1000:.1f}ms, disk cache {disk * 1000:.2f}ms, st.cache_data {memory * 1000:.2f}ms")
+    finally:
+        shutil.rmtree(assets.ASSET_CACHE_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
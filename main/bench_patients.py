@@ -0,0 +1,64 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from patient_store import PATIENT_PAGE_SIZE, PatientStore, journey_summary, seed_synthetic
+
+# Latency of the Existing GH Patient tab's queries on a seeded store: first page, prefix search,
+# paging deep into a panel, and loading plus summarising the selected patient's journey.
+#
+#   python main/bench_patients.py --patients 100000 --physicians 20
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(name: str, operation, runs: int):
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - start)
+    print(f"{name:<28} p50={percentile(latencies, 50) * 1000:6.2f}ms p95={percentile(latencies, 95) * 1000:6.2f}ms max={max(latencies) * 1000:6.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark patient selection on a seeded patient store")
+    parser.add_argument('--patients', type=int, default=100_000)
+    parser.add_argument('--physicians', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = PatientStore(os.path.join(directory, 'patients.db'))
+        start = time.perf_counter()
+        seed_synthetic(store, args.patients, args.physicians, args.seed)
+        print(f"seeded {args.patients} patients for {args.physicians} physicians in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(args.seed)
+        physicians = [f"Doc{i}" for i in range(1, args.physicians + 1)]
+        prefixes = ["a", "ch", "garcia", "kim, d", "patel, q", "sm", "walker, t"]
+
+        measure("first page", lambda i: store.search_patients(rng.choice(physicians)), args.runs)
+        measure("prefix search", lambda i: store.search_patients(rng.choice(physicians), rng.choice(prefixes)), args.runs)
+
+        def page_through(i, pages=20):
+            physician_id, after = rng.choice(physicians), None
+            for _ in range(pages):
+                page = store.search_patients(physician_id, after=after)
+                if len(page) < PATIENT_PAGE_SIZE:
+                    break
+                after = PatientStore.cursor(page[-1])
+        measure("20 pages deep (total)", page_through, max(1, args.runs // 10))
+
+        patient_ids = [rng.randint(1, args.patients) for _ in range(args.runs)]
+        measure("select: journey + summary", lambda i: journey_summary(store.get_journey(patient_ids[i])), args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from territory import TerritoryAnalytics, read_events, synthetic_events
+
+# Cost of keeping the Sales Enhancer figures current over a large event history: loading it in
+# chunks, merging a batch of new events incrementally against recomputing everything with the batch,
+# and building a rep's summary cold and from the per-rep cache. Also checks that the incremental
+# totals match the recomputed ones, and times reading a chunk back from Parquet and CSV.
+#
+#   python main/bench_territory.py --events 20000000 --batch 100000
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incremental territory rollups on synthetic events")
+    parser.add_argument('--events', type=int, default=20_000_000)
+    parser.add_argument('--chunk', type=int, default=2_000_000, help="events generated and merged at a time")
+    parser.add_argument('--batch', type=int, default=100_000, help="new events merged in the refresh")
+    parser.add_argument('--reps', type=int, default=200)
+    parser.add_argument('--npis', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = [
+        synthetic_events(min(args.chunk, args.events - start), args.reps, args.npis, seed=args.seed + i)
+        for i, start in enumerate(range(0, args.events, args.chunk))
+    ]
+    batch = synthetic_events(args.batch, args.reps, args.npis, start='2025-01-01', days=7, seed=args.seed + len(chunks))
+    history_mb = sum(chunk.memory_usage(deep=True).sum() for chunk in chunks) / 1e6
+    print(f"{args.events:,} events ({history_mb:.0f}MB in memory), {args.reps} reps, {args.npis:,} NPIs; new batch of {args.batch:,}")
+
+    analytics = TerritoryAnalytics()
+    _, load = timed(lambda: [analytics.add_events(chunk) for chunk in chunks])
+    print(f"initial load       {load:8.2f}s  ({args.events / load / 1e6:.1f}M events/s)")
+
+    _, incremental = timed(lambda: analytics.add_events(batch))
+    print(f"incremental merge  {incremental:8.3f}s")
+
+    def recompute():
+        full = TerritoryAnalytics()
+        full.add_events(pd.concat(chunks + [batch], ignore_index=True))
+        return full
+    full, recompute_seconds = timed(recompute)
+    print(f"full recompute     {recompute_seconds:8.2f}s  ({recompute_seconds / incremental:.0f}x the incremental merge)")
+
+    reps = analytics.reps()
+    cold = []
+    for rep_id in reps:
+        summary, seconds = timed(lambda: analytics.rep_summary(rep_id))
+        cold.append(seconds)
+    _, cached = timed(lambda: [analytics.rep_summary(rep_id) for rep_id in reps])
+    print(f"rep summary        cold {sum(cold) / len(cold) * 1000:.1f}ms, cached {cached / len(reps) * 1e6:.1f}us per rep")
+
+    for rep_id in ('salesrep1', reps[-1]):
+        ours, theirs = analytics.rep_summary(rep_id), full.rep_summary(rep_id)
+        matches = all(ours[key].equals(theirs[key]) for key in ('totals', 'orders_by_test', 'weekly', 'new_npis_weekly'))
+        print(f"incremental == recompute for {rep_id}: {matches}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        chunk = chunks[0]
+        for extension, write in (('parquet', lambda path: chunk.to_parquet(path, index=False)), ('csv', lambda path: chunk.to_csv(path, index=False))):
+            path = os.path.join(directory, f"events.{extension}")
+            write(path)
+            _, seconds = timed(lambda: read_events(path))
+            print(f"read {len(chunk):,} events from {extension:<8}{seconds:6.2f}s  ({os.path.getsize(path) / 1e6:.0f}MB)")
+
+
+if __name__ == '__main__':
+    main()
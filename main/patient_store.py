@@ -0,0 +1,215 @@
+import os
+import random
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# SQLite store of each physician's patients and their Guardant test history, behind the
+# "Existing GH Patient" tab. Patients are looked up by physician and name prefix through one
+# covering index and paged with keyset cursors, so selection cost does not grow with panel size;
+# a patient's test history is only read once they are selected.
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Configuration (use environment variables or configuration files in production)
+PATIENT_DB_PATH = os.getenv('PATIENT_DB_PATH', os.path.join(ASSET_DIR, 'patients.db'))
+PATIENT_PAGE_SIZE = int(os.getenv('PATIENT_PAGE_SIZE', '50'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    physician_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    cancer_type TEXT NOT NULL,
+    summary TEXT,
+    journey_image TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_patients_physician_name ON patients (physician_id, name_key, id);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patients (id),
+    ordered_on TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    stage TEXT,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tests_patient ON tests (patient_id, ordered_on);
+'''
+
+# The two demo patients the tab used to hard-code, shared by both demo physicians
+DEMO_PATIENTS = [
+    {
+        "name": "Patient A",
+        "cancer_type": "Colorectal",
+        "summary": "Patient A with CRC cancer started the journey at GH during stage III with a single **Reveal** monitoring test and came back when the cancer progressed to stage IV for **G360**. They then got on the 1st line lung and had no response to therapy thus getting an other **G360** and are currently following up with **Reveal**.",
+        "journey_image": "patient_a_journey",
+        "tests": [
+            ("2023-02-01", "Guardant Reveal", "Stage_2_3", "Monitoring after surgery"),
+            ("2023-09-12", "Guardant360 LDT", "Stage_4", "Progression"),
+            ("2024-03-20", "Guardant360 LDT", "Stage_4", "No response to 1st line therapy"),
+            ("2024-08-05", "Guardant Reveal", "Stage_4", "Monitoring"),
+        ],
+    },
+    {
+        "name": "Patient B",
+        "cancer_type": "Colorectal",
+        "summary": "Patient B came in during late stage with CRC cancer and ordered **G360** and are currently monitoring through **Reveal** test. ",
+        "journey_image": "patient_b_journey",
+        "tests": [
+            ("2024-01-15", "Guardant360 LDT", "Stage_4", "Newly diagnosed"),
+            ("2024-06-02", "Guardant Reveal", "Stage_4", "Monitoring"),
+        ],
+    },
+]
+DEMO_PHYSICIANS = ["Doc1", "Doc2"]
+
+Cursor = Tuple[str, int]
+
+
+def name_key(name: str) -> str:
+    return name.casefold()
+
+
+class PatientStore:
+    """
+    Patient and test-history store. Each thread gets its own SQLite connection.
+    """
+
+    def __init__(self, path: str = PATIENT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def search_patients(self, physician_id: str, prefix: str = '', after: Optional[Cursor] = None, limit: int = PATIENT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """
+        One page of the physician's patients whose name starts with prefix, in name order.
+        Pass the cursor of the last patient of a page as after to get the next page.
+        """
+        key = name_key(prefix)
+        # Prefix match as a range on the index: key <= name_key < key + U+10FFFF
+        query = 'SELECT id, name, name_key, cancer_type FROM patients WHERE physician_id = ? AND name_key >= ? AND name_key < ?'
+        params = [physician_id, key, key + '\U0010ffff']
+        if after is not None:
+            query += ' AND (name_key, id) > (?, ?)'
+            params += list(after)
+        query += ' ORDER BY name_key, id LIMIT ?'
+        params.append(limit)
+        return [dict(row) for row in self._connection().execute(query, params)]
+
+    @staticmethod
+    def cursor(patient: Dict[str, Any]) -> Cursor:
+        return (patient["name_key"], patient["id"])
+
+    def get_journey(self, patient_id: int) -> Optional[Dict[str, Any]]:
+        """
+        The patient with their tests in the order they were ordered, or None if there is no such patient.
+        """
+        connection = self._connection()
+        patient = connection.execute('SELECT * FROM patients WHERE id = ?', (patient_id,)).fetchone()
+        if patient is None:
+            return None
+        tests = connection.execute(
+            'SELECT ordered_on, test_name, stage, reason FROM tests WHERE patient_id = ? ORDER BY ordered_on', (patient_id,)
+        ).fetchall()
+        return {**dict(patient), "tests": [dict(test) for test in tests]}
+
+    def add_patients(self, physician_id: str, patients: List[Dict[str, Any]]):
+        """
+        Inserts patients, each a dict with name, cancer_type, optional summary and journey_image,
+        and tests as (ordered_on, test_name, stage, reason) tuples.
+        """
+        with self._connection() as connection:
+            for patient in patients:
+                patient_id = connection.execute(
+                    'INSERT INTO patients (physician_id, name, name_key, cancer_type, summary, journey_image) VALUES (?, ?, ?, ?, ?, ?)',
+                    (physician_id, patient["name"], name_key(patient["name"]), patient["cancer_type"],
+                     patient.get("summary"), patient.get("journey_image")),
+                ).lastrowid
+                connection.executemany(
+                    'INSERT INTO tests (patient_id, ordered_on, test_name, stage, reason) VALUES (?, ?, ?, ?, ?)',
+                    [(patient_id, *test) for test in patient.get("tests", [])],
+                )
+
+    def is_empty(self) -> bool:
+        return self._connection().execute('SELECT 1 FROM patients LIMIT 1').fetchone() is None
+
+    def seed_demo(self):
+        for physician_id in DEMO_PHYSICIANS:
+            self.add_patients(physician_id, DEMO_PATIENTS)
+
+
+def journey_summary(journey: Dict[str, Any]) -> str:
+    """
+    The stored summary, or one written from the test history.
+    """
+    if journey.get("summary"):
+        return journey["summary"]
+    if not journey["tests"]:
+        return f"{journey['name']} ({journey['cancer_type']}) has no Guardant tests yet."
+    steps = [
+        f"**{test['test_name']}** on {test['ordered_on']}" + (f" ({test['reason'].lower()})" if test['reason'] else '')
+        for test in journey["tests"]
+    ]
+    return f"{journey['name']} with {journey['cancer_type']} cancer has ordered " + ', then '.join(steps) + '.'
+
+
+SYNTHETIC_FIRST_NAMES = ["Alex", "Blake", "Casey", "Dana", "Emery", "Frankie", "Gray", "Harper", "Jordan", "Kendall", "Logan", "Morgan", "Parker", "Quinn", "Riley", "Sawyer", "Taylor"]
+SYNTHETIC_LAST_NAMES = ["Adams", "Brooks", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Hughes", "Ito", "Johnson", "Kim", "Lopez", "Miller", "Nguyen", "Okafor", "Patel", "Rossi", "Smith", "Walker"]
+SYNTHETIC_TESTS = [
+    ("Guardant360 LDT", "Stage_4", "Newly diagnosed"),
+    ("Guardant360 CDx", "Stage_4", "Newly diagnosed"),
+    ("Guardant Reveal", "Stage_2_3", "Monitoring after surgery"),
+    ("Guardant360 Response", "Stage_4", "Response to therapy"),
+    ("Guardant360 TissueNext", "Stage_4", "Tissue profiling"),
+]
+
+
+def seed_synthetic(store: PatientStore, patients: int, physicians: int, seed: int = 0, batch_size: int = 5000):
+    """
+    Fills the store with random patients spread over physicians Doc1..DocN, for benchmarks.
+    """
+    rng = random.Random(seed)
+    for start in range(0, patients, batch_size):
+        batches = {}
+        for _ in range(start, min(patients, start + batch_size)):
+            tests = sorted(
+                (f"202{rng.randint(0, 4)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", *rng.choice(SYNTHETIC_TESTS))
+                for _ in range(rng.randint(1, 5))
+            )
+            batches.setdefault(f"Doc{rng.randint(1, physicians)}", []).append({
+                "name": f"{rng.choice(SYNTHETIC_LAST_NAMES)}, {rng.choice(SYNTHETIC_FIRST_NAMES)} {rng.randint(1000, 9999)}",
+                "cancer_type": rng.choice(["Lung", "Breast", "Colorectal", "Other"]),
+                "tests": tests,
+            })
+        for physician_id, batch in batches.items():
+            store.add_patients(physician_id, batch)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_patient_store(path: str = PATIENT_DB_PATH) -> PatientStore:
+    """
+    Returns the process-wide store, creating it with the demo patients on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = PatientStore(path)
+                if store.is_empty():
+                    store.seed_demo()
+                _store = store
+    return _store
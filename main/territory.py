@@ -0,0 +1,355 @@
+import os
+import glob
+import time
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Territory analytics behind the "Sales Enhancer" tab. Order events (ordered_at, rep_id, npi,
+# test_name, optionally territory and region) are read from Parquet or CSV files dropped in
+# TERRITORY_EVENTS_PATH. Each new file is aggregated once with vectorized groupbys into per-rep
+# partials (orders by test, orders by week, first order week of each NPI) that are merged into the
+# running totals, so a refresh only touches the new events. Territory and region figures are rolled
+# up from the rep partials, which are small, and each rep's summary is cached until the next merge.
+#
+#   python main/territory.py generate --events 1000000    # write synthetic events for the demo reps
+#   python main/territory.py summary salesrep1
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+EVENT_COLUMNS = ['ordered_at', 'rep_id', 'npi', 'test_name']
+EVENT_PATTERNS = ('*.parquet', '*.csv')
+UNASSIGNED = 'Unassigned'
+
+# Configuration (use environment variables or configuration files in production)
+TERRITORY_EVENTS_PATH = os.getenv('TERRITORY_EVENTS_PATH', os.path.join(ASSET_DIR, 'territory_events'))
+# Weeks compared for the "recent" trend (last N weeks against the N before)
+TERRITORY_TREND_WEEKS = int(os.getenv('TERRITORY_TREND_WEEKS', '4'))
+# Seconds between checks of the events path for new files
+TERRITORY_REFRESH_SECONDS = float(os.getenv('TERRITORY_REFRESH_SECONDS', '60'))
+
+# rep_id -> (territory, region); events with territory and region columns add to or override this
+REP_TERRITORIES = {
+    'salesrep1': ('Albany', 'Northeast'),
+    'salesrep2': ('San Francisco', 'West'),
+}
+
+LEVELS = ('rep', 'territory', 'region')
+
+
+def week_start(ordered_at: pd.Series) -> np.ndarray:
+    """
+    Monday of each timestamp's week, as datetime64[D].
+    """
+    days = ordered_at.to_numpy(dtype='datetime64[D]').astype('int64')
+    # Day 0 (1970-01-01) was a Thursday
+    return (days - (days + 3) % 7).astype('datetime64[D]')
+
+
+def read_events(path: str) -> pd.DataFrame:
+    """
+    Reads one Parquet or CSV file of events, with rep and test names as categoricals.
+    """
+    if path.endswith('.parquet'):
+        events = pd.read_parquet(path)
+    else:
+        events = pd.read_csv(path, dtype={'rep_id': 'category', 'test_name': 'category', 'territory': 'category', 'region': 'category'})
+    missing = [column for column in EVENT_COLUMNS if column not in events.columns]
+    if missing:
+        raise ValueError(f"{path} is missing columns {missing}")
+    events['ordered_at'] = pd.to_datetime(events['ordered_at'])
+    return events
+
+
+def event_files(path: str) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    return sorted(file for pattern in EVENT_PATTERNS for file in glob.glob(os.path.join(path, pattern)))
+
+
+def _add(total: Optional[pd.Series], partial: pd.Series) -> pd.Series:
+    if total is None:
+        return partial
+    return total.add(partial, fill_value=0).astype('int64')
+
+
+class TerritoryAnalytics:
+    """
+    Running per-rep aggregates of order events with territory and region rollups.
+    """
+
+    def __init__(self, rep_territories: Dict[str, Tuple[str, str]] = None):
+        self.rep_territories = dict(REP_TERRITORIES if rep_territories is None else rep_territories)
+        self.events = 0
+        self.version = 0
+        self.last_order = None
+        self._orders = None       # (rep_id, test_name) -> orders
+        self._weekly = None       # (rep_id, week) -> orders
+        self._first_order = None  # (rep_id, npi) -> week of the rep's first order from that NPI
+        self._files = {}          # path -> (mtime, size) of the files merged so far
+        self._summaries = {}      # rep_id -> (version, summary)
+        self._lock = threading.RLock()
+
+    def add_events(self, events: pd.DataFrame):
+        """
+        Merges a batch of events into the totals.
+        """
+        if events.empty:
+            return
+        batch = pd.DataFrame({
+            'rep_id': events['rep_id'].astype('category'),
+            'test_name': events['test_name'].astype('category'),
+            'npi': events['npi'].to_numpy(dtype='int64'),
+            'week': week_start(events['ordered_at']),
+        })
+        orders = batch.groupby(['rep_id', 'test_name'], observed=True).size()
+        weekly = batch.groupby(['rep_id', 'week'], observed=True).size()
+        first_order = batch.groupby(['rep_id', 'npi'], observed=True)['week'].min()
+        assignments = {}
+        if 'territory' in events.columns and 'region' in events.columns:
+            reps = events[['rep_id', 'territory', 'region']].drop_duplicates(subset='rep_id', keep='last')
+            assignments = {str(rep): (str(territory), str(region)) for rep, territory, region in reps.itertuples(index=False)}
+
+        with self._lock:
+            self.rep_territories.update(assignments)
+            self._orders = _add(self._orders, orders)
+            self._weekly = _add(self._weekly, weekly)
+            if self._first_order is None:
+                self._first_order = first_order
+            else:
+                self._first_order = pd.concat([self._first_order, first_order]).groupby(level=[0, 1]).min()
+            self.events += len(events)
+            latest = events['ordered_at'].max()
+            self.last_order = latest if self.last_order is None else max(self.last_order, latest)
+            self.version += 1
+
+    def refresh(self, path: str = TERRITORY_EVENTS_PATH) -> int:
+        """
+        Merges files in path that have not been merged yet and returns how many were.
+        A merged file that changed since means totals can no longer be updated in place,
+        so everything is rebuilt from the files.
+        """
+        files = {file: (os.stat(file).st_mtime_ns, os.stat(file).st_size) for file in event_files(path)} if os.path.exists(path) else {}
+        with self._lock:
+            if any(files.get(file) != stamp for file, stamp in self._files.items()):
+                logger.warning(f"Event files in {path} changed or were removed, rebuilding territory aggregates")
+                self._reset()
+            new_files = [file for file in files if file not in self._files]
+            for file in new_files:
+                self.add_events(read_events(file))
+                self._files[file] = files[file]
+        return len(new_files)
+
+    def _reset(self):
+        self.rep_territories = dict(REP_TERRITORIES)
+        self.events = 0
+        self.last_order = None
+        self._orders = self._weekly = self._first_order = None
+        self._files = {}
+        self.version += 1
+
+    def reps(self) -> List[str]:
+        with self._lock:
+            return [] if self._orders is None else sorted(self._orders.index.get_level_values(0).unique().astype(str))
+
+    def _level_of(self, reps: pd.Index, level: str) -> np.ndarray:
+        if level == 'rep':
+            return np.asarray(reps, dtype=object)
+        position = 0 if level == 'territory' else 1
+        return np.array([self.rep_territories.get(rep, (UNASSIGNED, UNASSIGNED))[position] for rep in reps], dtype=object)
+
+    def _rollup(self, series: pd.Series, level: str, key: str) -> pd.Series:
+        # Rows of series (indexed by rep_id first) belonging to key at level
+        reps = series.index.levels[0].astype(str)
+        return series[(self._level_of(reps, level) == key)[series.index.codes[0]]]
+
+    def aggregates(self, level: str, key: str) -> Dict[str, Any]:
+        """
+        Orders by test, orders by week and NPI counts of one rep, territory or region.
+        """
+        with self._lock:
+            if self._orders is None:
+                return {"orders": 0, "npis": 0, "orders_by_test": pd.Series(dtype='int64'), "weekly": pd.Series(dtype='int64'), "new_npis_weekly": pd.Series(dtype='int64')}
+            orders = self._rollup(self._orders, level, key).groupby(level=1, observed=True).sum()
+            weekly = self._rollup(self._weekly, level, key).groupby(level=1).sum().sort_index()
+            # An NPI ordering through two reps of a territory counts once, from its first order
+            first_order = self._rollup(self._first_order, level, key).groupby(level=1).min()
+        return {
+            "orders": int(orders.sum()),
+            "npis": len(first_order),
+            "orders_by_test": orders[orders > 0].sort_values(ascending=False),
+            "weekly": weekly,
+            "new_npis_weekly": first_order.value_counts().sort_index(),
+        }
+
+    def rep_summary(self, rep_id: str) -> Dict[str, Any]:
+        """
+        The rep's figures next to their territory's and region's, cached until the next merge.
+        """
+        with self._lock:
+            cached = self._summaries.get(rep_id)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            version = self.version
+            territory, region = self.rep_territories.get(rep_id, (UNASSIGNED, UNASSIGNED))
+            levels = {'rep': rep_id, 'territory': territory, 'region': region}
+            aggregates = {level: self.aggregates(level, key) for level, key in levels.items()}
+            as_of = last_complete_week(self.last_order)
+
+        rows = []
+        for level, key in levels.items():
+            figures = aggregates[level]
+            recent, previous = recent_trend(figures["weekly"], as_of)
+            rows.append({
+                "level": level, "name": key, "orders": figures["orders"], "npis": figures["npis"],
+                f"orders_last_{TERRITORY_TREND_WEEKS}w": recent,
+                "change": (recent - previous) / previous if previous else None,
+            })
+        summary = {
+            "rep_id": rep_id,
+            "territory": territory,
+            "region": region,
+            "as_of": as_of,
+            "totals": pd.DataFrame(rows).set_index('level'),
+            "orders_by_test": pd.DataFrame({level: aggregates[level]["orders_by_test"] for level in LEVELS}).fillna(0).astype('int64'),
+            "weekly": pd.DataFrame({level: aggregates[level]["weekly"] for level in LEVELS}).fillna(0).astype('int64'),
+            "new_npis_weekly": aggregates['rep']["new_npis_weekly"],
+        }
+        with self._lock:
+            if self.version == version:
+                self._summaries[rep_id] = (version, summary)
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "events": self.events,
+                "files": len(self._files),
+                "version": self.version,
+                "reps": 0 if self._orders is None else self._orders.index.get_level_values(0).nunique(),
+                "npi_pairs": 0 if self._first_order is None else len(self._first_order),
+                "cached_summaries": sum(1 for version, _ in self._summaries.values() if version == self.version),
+            }
+
+
+def last_complete_week(last_order) -> Optional[np.datetime64]:
+    """
+    Monday of the last week that ended by the day of the last order.
+    """
+    if last_order is None:
+        return None
+    return week_start(pd.Series([last_order + pd.Timedelta(days=1)]))[0] - np.timedelta64(7, 'D')
+
+
+def recent_trend(weekly: pd.Series, as_of, weeks: int = TERRITORY_TREND_WEEKS) -> Tuple[int, int]:
+    """
+    Orders in the last weeks up to and including the week starting as_of, and in the weeks before those.
+    """
+    if as_of is None or weekly.empty:
+        return 0, 0
+    start = as_of - np.timedelta64(7 * (weeks - 1), 'D')
+    previous_start = start - np.timedelta64(7 * weeks, 'D')
+    recent = weekly[(weekly.index >= start) & (weekly.index <= as_of)].sum()
+    previous = weekly[(weekly.index >= previous_start) & (weekly.index < start)].sum()
+    return int(recent), int(previous)
+
+
+SYNTHETIC_TESTS = ["Guardant360 LDT", "Guardant360 CDx", "Guardant Reveal", "Guardant360 Response", "Guardant360 TissueNext", "Shield"]
+SYNTHETIC_TERRITORIES = [
+    ("Albany", "Northeast"), ("Boston", "Northeast"), ("New York", "Northeast"), ("Atlanta", "Southeast"),
+    ("Miami", "Southeast"), ("Chicago", "Central"), ("Dallas", "Central"), ("Denver", "West"),
+    ("Los Angeles", "West"), ("San Francisco", "West"),
+]
+
+
+def synthetic_reps(reps: int) -> Dict[str, Tuple[str, str]]:
+    """
+    The demo reps plus rep3..repN spread over the synthetic territories.
+    """
+    assignments = dict(REP_TERRITORIES)
+    for i in range(len(assignments) + 1, reps + 1):
+        assignments[f"rep{i}"] = SYNTHETIC_TERRITORIES[i % len(SYNTHETIC_TERRITORIES)]
+    return assignments
+
+
+def synthetic_events(count: int, reps: int = 200, npis: int = 50_000, start: str = '2023-01-01', days: int = 730, seed: int = 0) -> pd.DataFrame:
+    """
+    Random order events: each NPI orders through one rep, test mix skewed towards the first tests.
+    """
+    rng = np.random.default_rng(seed)
+    assignments = synthetic_reps(reps)
+    rep_names = list(assignments)
+    npi = rng.integers(0, npis, count) + 1_000_000_000
+    rep_codes = (npi * 2654435761 % len(rep_names)).astype('int16')
+    test_weights = np.array([0.35, 0.25, 0.2, 0.1, 0.06, 0.04])
+    ordered_at = np.datetime64(start, 's') + rng.integers(0, days * 86400, count).astype('timedelta64[s]')
+    territory_names = sorted({territory for territory, _ in assignments.values()})
+    region_names = sorted({region for _, region in assignments.values()})
+    territory_codes = np.array([territory_names.index(assignments[rep][0]) for rep in rep_names], dtype='int16')
+    region_codes = np.array([region_names.index(assignments[rep][1]) for rep in rep_names], dtype='int8')
+    return pd.DataFrame({
+        'ordered_at': ordered_at.astype('datetime64[ns]'),
+        'rep_id': pd.Categorical.from_codes(rep_codes, rep_names),
+        'npi': npi,
+        'test_name': pd.Categorical.from_codes(rng.choice(len(SYNTHETIC_TESTS), count, p=test_weights).astype('int8'), SYNTHETIC_TESTS),
+        'territory': pd.Categorical.from_codes(territory_codes[rep_codes], territory_names),
+        'region': pd.Categorical.from_codes(region_codes[rep_codes], region_names),
+    })
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+_last_refresh = 0.0
+
+
+def get_territory_analytics(path: str = TERRITORY_EVENTS_PATH) -> TerritoryAnalytics:
+    """
+    Returns the process-wide analytics, merging new event files at most every TERRITORY_REFRESH_SECONDS.
+    """
+    global _analytics, _last_refresh
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = TerritoryAnalytics()
+        if time.monotonic() - _last_refresh >= TERRITORY_REFRESH_SECONDS or _last_refresh == 0.0:
+            _last_refresh = time.monotonic()
+            try:
+                _analytics.refresh(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error refreshing territory events from {path}: {e}")
+    return _analytics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate territory events or print a rep's territory summary")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate = subparsers.add_parser('generate', help="write synthetic events as a Parquet file in the events path")
+    generate.add_argument('--events', type=int, default=1_000_000)
+    generate.add_argument('--reps', type=int, default=20)
+    generate.add_argument('--npis', type=int, default=5_000)
+    generate.add_argument('--seed', type=int, default=0)
+    summary = subparsers.add_parser('summary', help="print a rep's summary from the events path")
+    summary.add_argument('rep_id')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        os.makedirs(TERRITORY_EVENTS_PATH, exist_ok=True)
+        path = os.path.join(TERRITORY_EVENTS_PATH, f"synthetic-{args.seed}.parquet")
+        synthetic_events(args.events, args.reps, args.npis, seed=args.seed).to_parquet(path, index=False)
+        print(f"wrote {args.events} events to {path}")
+    else:
+        analytics = TerritoryAnalytics()
+        analytics.refresh(TERRITORY_EVENTS_PATH)
+        result = analytics.rep_summary(args.rep_id)
+        pd.set_option('display.width', 160)
+        print(f"{result['rep_id']} ({result['territory']}, {result['region']}) as of {result['as_of']}\n")
+        print(result['totals'], end='\n\n')
+        print(result['orders_by_test'])
+
+
+if __name__ == '__main__':
+    main()